@@ -0,0 +1,77 @@
+import sys
+import os
+import time
+import tempfile
+import argparse
+import numpy as np
+import pandas as pd
+import plasma
+
+"""
+This file benchmarks reading osu-hydro evolution files (see plasma.load_hydro_grid), comparing the pandas C parser
+used by load_hydro_grid against numpy's loadtxt and fromfile, and against memory-mapping the .npy cache.
+Exits with a nonzero status if any of the readers disagree with loadtxt.
+"""
+# Define command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-f", "--hydro_file", help="viscous_14_moments_evo.dat hydro file to read, "
+                                               "otherwise a synthetic file is written and used")
+parser.add_argument("-w", "--grid_width", type=int, default=100, help="grid width of the synthetic file")
+parser.add_argument("-t", "--num_times", type=int, default=40, help="number of time steps of the synthetic file")
+parser.add_argument("-r", "--repeats", type=int, default=3, help="number of timed reads of each reader")
+
+# Get command line arguments
+args = parser.parse_args()
+
+temp_dir = tempfile.TemporaryDirectory()
+if args.hydro_file is not None:
+    file_path = args.hydro_file
+else:
+    # Write a synthetic file laid out as osu-hydro writes them -- x fastest, then y, then time
+    file_path = os.path.join(temp_dir.name, 'viscous_14_moments_evo.dat')
+    rng = np.random.default_rng(1)
+    axis = np.linspace(-15, 15, args.grid_width)
+    times = 0.5 + 0.1 * np.arange(args.num_times)
+    t, y, x = np.meshgrid(times, axis, axis, indexing='ij')
+    lines = np.column_stack([t.ravel(), x.ravel(), y.ravel(), rng.uniform(0, 2.5, t.size),
+                             rng.uniform(-0.9, 0.9, t.size), rng.uniform(-0.9, 0.9, t.size)])
+    np.savetxt(file_path, lines, fmt='%.8e')
+print('Reading {} ({:.1f} MB)'.format(file_path, os.path.getsize(file_path) / 1e6))
+
+readers = {'loadtxt': lambda: np.loadtxt(file_path, dtype=np.float64, ndmin=2),
+           'fromfile': lambda: np.fromfile(file_path, sep=' ').reshape(-1, len(plasma.HYDRO_FIELDS)),
+           'pandas': lambda: pd.read_csv(file_path, sep=r'\s+', header=None, engine='c',
+                                         dtype=np.float64).to_numpy()}
+
+num_bad = 0
+reference = readers['loadtxt']()
+print('{:>12} {:>12}'.format('reader', 'time [s]'))
+for name, reader in readers.items():
+    elapsed = []
+    for i in range(args.repeats):
+        start = time.time()
+        rows = reader()
+        elapsed.append(time.time() - start)
+    if not np.array_equal(rows, reference):
+        num_bad += 1
+        print('{} disagrees with loadtxt'.format(name))
+    print('{:>12} {:>12.3f}'.format(name, min(elapsed)))
+
+# Full loads of the grid, parsing the text and then from the cache
+cache_dir = os.path.join(temp_dir.name, 'cache')
+os.makedirs(cache_dir)
+cache_file_path = os.path.join(cache_dir, 'viscous_14_moments_evo.dat')
+os.symlink(os.path.abspath(file_path), cache_file_path)
+for name in ['grid (text)', 'grid (cache)']:
+    start = time.time()
+    grid = plasma.load_hydro_grid(cache_file_path, cache=True)
+    elapsed = time.time() - start
+    if not np.array_equal(np.reshape(np.transpose(grid, axes=[0, 2, 1, 3]), reference.shape), reference):
+        num_bad += 1
+        print('{} disagrees with loadtxt'.format(name))
+    print('{:>12} {:>12.3f}'.format(name, elapsed))
+
+temp_dir.cleanup()
+print('{} mismatched readers'.format(num_bad))
+if num_bad > 0:
+    sys.exit(1)
@@ -0,0 +1,114 @@
+import sys
+import numpy as np
+import time
+import argparse
+import config
+import plasma
+import utilities
+
+"""
+This file benchmarks the quadrature rules used to average medium properties over a time step
+(see utilities.dtau_quadrature), comparing accuracy and cost against the rectangle rule at various point counts.
+Step averages of the temperature and flow velocity are computed for random steps through the medium and compared
+to a high order Gauss-Legendre reference.
+The batched step averages of every rule are also checked against utilities.dtau_avg, and the rectangle rule against
+the original step average (samples at the start of the step and every dtau / num_samples along it, averaged).
+Exits with a nonzero status if any of these disagree.
+"""
+# Define command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-f", "--hydro_file", help="viscous_14_moments_evo.dat hydro file to use, "
+                                               "otherwise a smooth analytic medium is used")
+parser.add_argument("-n", "--num_steps", type=int, default=2000, help="number of random steps to average over")
+parser.add_argument("-d", "--dtau", type=float, default=config.jet.DTAU, help="step length [fm]")
+parser.add_argument("-s", "--seed", type=int, default=1, help="random seed for the steps")
+parser.add_argument("-c", "--num_checked", type=int, default=100, help="number of steps checked against dtau_avg")
+
+# Get command line arguments
+args = parser.parse_args()
+
+# Load medium
+if args.hydro_file is not None:
+    print('Loading hydro file {}'.format(args.hydro_file))
+    event = plasma.plasma_event(event=plasma.osu_hydro_file(file_path=args.hydro_file))
+else:
+    print('Using analytic medium')
+    def temp_func(t, x, y):
+        return 0.45 * np.exp(-(x ** 2 + 1.5 * y ** 2) / (2 * (3 + 0.3 * t) ** 2)) * (0.6 / t) ** 0.33
+
+    def x_vel_func(t, x, y):
+        return 0.08 * x * t / (1 + 0.1 * t * t) * np.exp(-(x ** 2 + y ** 2) / 60)
+
+    def y_vel_func(t, x, y):
+        return 0.1 * y * t / (1 + 0.1 * t * t) * np.exp(-(x ** 2 + y ** 2) / 60)
+
+    event = plasma.functional_plasma(temp_func=temp_func, x_vel_func=x_vel_func, y_vel_func=y_vel_func,
+                                     resolution=10, rmax=10, time=12, tau0=0.6)
+
+# Draw random steps that stay well within the medium
+rng = np.random.default_rng(args.seed)
+num_steps = args.num_steps
+margin = 2 * args.dtau
+points = np.column_stack((rng.uniform(event.t0, event.tf - margin, num_steps),
+                          rng.uniform(event.xmin + margin, event.xmax - margin, num_steps),
+                          rng.uniform(event.ymin + margin, event.ymax - margin, num_steps)))
+phi = rng.uniform(0, 2 * np.pi, num_steps)
+beta = np.ones(num_steps)
+bounds = (event.t0, event.tf, event.xmin, event.xmax, event.ymin, event.ymax)
+funcs = [event.temp, event.x_vel, event.y_vel]
+
+# Reference step averages
+reference = utilities.dtau_avg_batch(funcs=funcs, points=points, phi=phi, dtau=args.dtau, beta=beta, bounds=bounds,
+                                     num_samples=64, rule='gauss')
+in_medium = reference[0] > 0
+
+print('{:>10} {:>7} {:>14} {:>14} {:>14} {:>12}'.format('rule', 'points', 'max |dT| [GeV]', 'rms |dT| [GeV]',
+                                                        'max |du|', 'time [ms]'))
+for rule, point_counts in [('rectangle', [2, 4, 6, 10, 20]), ('simpson', [3, 5, 7]), ('gauss', [1, 2, 3, 4, 6])]:
+    for num_samples in point_counts:
+        start = time.time()
+        averages = utilities.dtau_avg_batch(funcs=funcs, points=points, phi=phi, dtau=args.dtau, beta=beta,
+                                            bounds=bounds, num_samples=num_samples, rule=rule)
+        elapsed = time.time() - start
+        temp_error = np.abs(averages[0] - reference[0])[in_medium]
+        vel_error = np.maximum(np.abs(averages[1] - reference[1]), np.abs(averages[2] - reference[2]))[in_medium]
+        num_points = len(utilities.dtau_quadrature(dtau=args.dtau, num_samples=num_samples, rule=rule)[0])
+        print('{:>10} {:>7} {:>14.3e} {:>14.3e} {:>14.3e} {:>12.2f}'.format(
+            rule, num_points, np.amax(temp_error), np.sqrt(np.mean(temp_error ** 2)), np.amax(vel_error),
+            1000 * elapsed))
+
+
+# Function to average over a step as the original dtau_avg did, one sample point at a time
+def original_dtau_avg(func, point, phi, dtau, beta, num_samples=10):
+    sample_coords = point
+    for delta_tau in np.arange(dtau/num_samples, dtau, dtau/num_samples):
+        sample_tau = point[0] + delta_tau
+        sample_x = point[1] + (beta * delta_tau * np.cos(phi))
+        sample_y = point[2] + (beta * delta_tau * np.sin(phi))
+        sample_coords = np.vstack((sample_coords, np.array([sample_tau, sample_x, sample_y])))
+    return np.mean(func(sample_coords))
+
+
+# Check the batched step averages of each rule against single step averages
+num_bad = 0
+num_checked = min(args.num_checked, num_steps)
+for rule, point_counts in [('rectangle', [2, 4, 6, 10, 20]), ('simpson', [3, 5, 7]), ('gauss', [1, 2, 3, 4, 6])]:
+    for num_samples in point_counts:
+        averages = utilities.dtau_avg_batch(funcs=funcs, points=points[:num_checked], phi=phi[:num_checked],
+                                            dtau=args.dtau, beta=beta[:num_checked], bounds=bounds,
+                                            num_samples=num_samples, rule=rule)
+        for i in range(num_checked):
+            expected = utilities.dtau_avg(func=funcs, point=points[i], phi=phi[i], dtau=args.dtau, beta=beta[i],
+                                          num_samples=num_samples, rule=rule)
+            if rule == 'rectangle':
+                expected = expected + [original_dtau_avg(func=func, point=points[i], phi=phi[i], dtau=args.dtau,
+                                                         beta=beta[i], num_samples=num_samples) for func in funcs]
+            for j, value in enumerate(expected):
+                if not np.isclose(averages[j % len(funcs)][i], value, rtol=1e-9, atol=1e-12):
+                    num_bad += 1
+                    print('{} rule, {} samples, step {}: batched average {} differs from {}'.format(
+                        rule, num_samples, i, averages[j % len(funcs)][i], value))
+
+print('{} mismatched step averages'.format(num_bad))
+if num_bad > 0:
+    sys.exit(1)
@@ -38,6 +38,7 @@ class EBE:
     NUM_EVENTS = int(cfg['mode']['NUM_EVENTS'])
     NUM_SAMPLES = int(cfg['mode']['NUM_SAMPLES'])
     NUM_FRAGS = int(cfg['mode']['NUM_FRAGS'])
+    NUM_WORKERS = int(cfg['mode']['NUM_WORKERS'])
 
 
 # Mode configuration
@@ -45,6 +46,11 @@ class mode:
     VARY_POINT = bool(cfg['mode']['VARY_POINT'])
     KEEP_EVENT = bool(cfg['mode']['KEEP_EVENT'])
     KEEP_RECORD = bool(cfg['mode']['KEEP_RECORD'])
+    MEDIUM_DTYPE = str(cfg['mode']['MEDIUM_DTYPE'])
+    CROP_MEDIUM = bool(cfg['mode']['CROP_MEDIUM'])
+    MEDIUM_STORE = bool(cfg['mode']['MEDIUM_STORE'])
+    LIBRARY_MODE = str(cfg['mode']['LIBRARY_MODE'])
+    LIBRARY_PATH = str(cfg['mode']['LIBRARY_PATH'])
 
 
 class transport:
@@ -91,6 +97,11 @@ class jet:
     PTHATMAX = float(cfg['jet']['PTHATMAX'])
     PROCESS_CORRECTIONS = bool(cfg['jet']['PROCESS_CORRECTIONS'])
     DTAU = float(cfg['jet']['DTAU'])
+    STEPPING = str(cfg['jet']['STEPPING'])
+    MAX_DTAU = float(cfg['jet']['MAX_DTAU'])
+    REFINE_MARGIN = float(cfg['jet']['REFINE_MARGIN'])
+    STEP_RULE = str(cfg['jet']['STEP_RULE'])
+    STEP_SAMPLES = int(cfg['jet']['STEP_SAMPLES'])
     T_HRG = float(cfg['jet']['T_HRG'])
     T_UNHYDRO = float(cfg['jet']['T_UNHYDRO'])
     K_F_DRIFT = float(cfg['jet']['K_F_DRIFT'])
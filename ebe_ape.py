@@ -1,11 +1,13 @@
 import os
 import sys
+import copy
 import numpy as np
 import pandas as pd
 import xarray as xr
 import logging
 import traceback
 import argparse
+import multiprocessing
 
 #########
 # Setup #
@@ -80,6 +82,10 @@ import timekeeper
 import pythia
 import hadronization
 import observables
+import medium_library
+
+# Absolute path of the medium library -- relative paths are from the directory the script was run in
+library_path = os.path.join(home_path, config.mode.LIBRARY_PATH)
 
 
 ###############
@@ -136,6 +142,21 @@ def safe_exit(resultsDataFrame, event_obs, temp_dir, filename, identifier, hadro
         except FileNotFoundError:
             logging.error('Failed to copy grid file -- file not found')
 
+        try:
+            utilities.run_cmd(*['mv', 'viscous_14_moments_evo.dat.npy',
+                                results_path + '/hydro_grid_{}.dat.npy'.format(identifierString)],
+                              quiet=False)
+        except FileNotFoundError:
+            logging.error('Failed to copy grid cache file -- file not found')
+
+        if config.mode.MEDIUM_STORE:
+            try:
+                utilities.run_cmd(*['mv', 'medium_store.dat',
+                                    results_path + '/hydro_medium_{}.dat'.format(identifierString)],
+                                  quiet=False)
+            except FileNotFoundError:
+                logging.error('Failed to copy medium store -- file not found')
+
         try:
             utilities.run_cmd(*['mv', 'surface.dat',
                                 results_path + '/hydro_surface_{}.dat'.format(identifierString, identifierString)],
@@ -174,22 +195,335 @@ def safe_exit(resultsDataFrame, event_obs, temp_dir, filename, identifier, hadro
         pass
 
 
+# Function to return the (name, dtype) columns of the results for each parton in a jet process
+def process_columns():
+    columns = timekeeper.PARTON_COLUMNS + [('process', np.int64), ('z', object), ('pp_z', object),
+                                           ('z_22', object), ('pp_z_22', object),
+                                           ('hadron_pt_f', np.float64), ('hadron_pt_0', np.float64),
+                                           ('hadron_22_pt_f', np.float64), ('hadron_22_pt_0', np.float64),
+                                           ('process_run', np.int64)]
+    if config.jet.TYPE == "dijet":
+        columns += [('partner_pt_f', np.float64), ('partner_hadron_pt_f', np.float64),
+                    ('partner_hadron_22_pt_f', np.float64), ('aco', np.float64)]
+    return columns
+
+
+# Function to evolve a parton in each of the physics variants, appending their rows to results
+# The variants are evolved together with timekeeper.evolve_variants. If that fails, they are evolved one at a time in
+# order, so that the variants before a failing one still complete.
+# Returns the (row, record, evolved parton) of each variant completed, and the error that stopped the rest (or None).
+def evolve_parton_variants(event, parton, variants, el_model, record, results):
+    num_rows = len(results)
+    try:
+        return timekeeper.evolve_variants(event=event, parton=parton, variants=variants, el_model=el_model,
+                                          record=record, results=results), None
+    except Exception as error:
+        logging.info("Joint evolution of variants failed: {}".format(type(error).__name__))
+        results.truncate(num_rows)
+
+    variant_results = []
+    for variant in variants:
+        variant_parton = copy.copy(parton)
+        try:
+            row, jet_xarray = timekeeper.evolve(event=event, parton=variant_parton, el_model=el_model, record=record,
+                                                results=results, **variant)
+        except Exception as error:
+            results.truncate(num_rows + len(variant_results))
+            return variant_results, error
+        variant_results.append((row, jet_xarray, variant_parton))
+    return variant_results, None
+
+
+# Function to run a single hard jet production process in an event
+# Samples a hard scattering, places it in the event, and evolves each parton in every physics variant for each phi.
+# If a seed is given, numpy and pythia random number generation are seeded with it, for independent parallel workers.
+# Returns a timekeeper.result_builder holding the process's partons.
+def run_process(event, event_dataframe, CNM_interp, npart, process_num, num_phi=11, seed=None):
+    # Reseed random number generation for this process, if requested
+    if seed is not None:
+        np.random.seed(seed)
+        pythia_seed = int(seed % 900000000) + 1
+    else:
+        pythia_seed = None
+
+    # Create unique jet seed tag
+    process_tag = int(np.random.uniform(0, 1000000000000))
+    logging.info('- Jet Seed Process {} Start -'.format(process_num))
+
+    process_partons = timekeeper.result_builder(columns=process_columns())
+    completed_rows = 0
+    try:
+        #########################
+        # Create new scattering #
+        #########################
+        particles, weight = pythia.scattering(type=config.jet.TYPE, seed=pythia_seed)
+        particle_tags = np.random.default_rng().uniform(0, 1000000000000, len(particles)).astype(int)
+        process_hadrons = pd.DataFrame({})
+
+        # Compute angules for particles
+        part_phis = np.array([])
+        for index, particle in particles.iterrows():
+            # Find angle of each particle, add to list
+            pythia_phi = np.arctan2(particle['py'], particle['px']) + np.pi
+            part_phis = np.append(part_phis, pythia_phi)
+
+        # set coordinate system such that phi of first particle is at 0, on interval 0 to 2pi
+        part_phis = np.mod(part_phis - part_phis[0], 2*np.pi)
+
+        # Select jet seed production point
+        if not config.mode.VARY_POINT:
+            x0 = 0
+            y0 = 0
+        else:
+            newPoint = collision.generate_jet_seed_point(event)
+            x0, y0 = newPoint[0], newPoint[1]
+
+        process_run = 0
+
+        # Random azimuthal sampling
+        # phi_values = phi_rng.uniform(0, 2 * np.pi, num_phi)
+
+        # Uniform azimuthal sampling
+        phi_values = np.linspace(start=0, stop=2*np.pi, num=num_phi, endpoint=False) #+ psi_2
+
+        # Determine the physics variants to run -- each case, with each of its K_F_DRIFT values
+        variants = []
+        for case in [0, 1, 2, 3]:
+            # Determine case details
+            if case == 0:
+                el = True
+                cel = False
+                drift = False
+                fg = False
+                fgqhat = False
+                G = config.constants.G_RAD
+            elif case == 1:
+                el = True
+                cel = False
+                drift = True
+                fg = False
+                fgqhat = False
+                G = config.constants.G_RAD
+            elif case == 2:
+                el = True
+                cel = True
+                drift = False
+                fg = False
+                fgqhat = False
+                G = config.constants.G_COL
+            elif case == 3:
+                el = True
+                cel = True
+                drift = True
+                fg = False
+                fgqhat = False
+                G = config.constants.G_COL
+            else:
+                el = True
+                cel = False
+                drift = True
+                fg = False
+                fgqhat = False
+                G = config.constants.G_RAD
+
+            if drift == True:
+                kfdrift_list = [1.0, 0.75, 1.25]
+            else:
+                kfdrift_list = [0.0]
+            for kfdrift in kfdrift_list:
+                variants.append({'el': el, 'cel': cel, 'drift': drift, 'fg': fg, 'fgqhat': fgqhat,
+                                 'G': G, 'K_F_DRIFT': kfdrift})
+
+        el_model = 'num_GLV'
+
+        # Only build the step-by-step record if we're going to keep it
+        if config.mode.KEEP_RECORD:
+            record_mode = 'full'
+        else:
+            record_mode = 'off'
+
+        for phi_val in phi_values:
+            # phi_val = np.mod(np.random.uniform(phi_center - phi_res/2, phi_center + phi_res/2), 2*np.pi)
+
+            # Evolve each particle in every variant, holding the rows until the variants are finished below
+            phi_partons = timekeeper.result_builder()
+            particle_results = []
+            error = None
+
+            i = 0
+            jet_seed_num = -1
+            for index, particle in particles.iterrows():
+                # Only do the things for the particle output
+                particle_status = particle['status']
+                particle_tag = int(particle_tags[i])
+                jet_seed_num += 1
+                # Read jet seed particle properties
+                chosen_e = particle['pt']
+                chosen_weight = weight
+                particle_pid = particle['id']
+                if particle_pid == 21:
+                    chosen_pilot = 'g'
+                elif particle_pid == 1:
+                    chosen_pilot = 'd'
+                elif particle_pid == -1:
+                    chosen_pilot = 'dbar'
+                elif particle_pid == 2:
+                    chosen_pilot = 'u'
+                elif particle_pid == -2:
+                    chosen_pilot = 'ubar'
+                elif particle_pid == 3:
+                    chosen_pilot = 's'
+                elif particle_pid == -3:
+                    chosen_pilot = 'sbar'
+                elif particle_pid == 22:
+                    chosen_pilot = 'gamma'
+                    i += 1
+                    continue  # Skip the photons -- noninteracting.
+                else:
+                    i += 1
+                    continue  # We don't know how this should interact... skip it.
+
+                # Select jet seed particle angles
+                phi_0 = np.mod(part_phis[i] + phi_val, 2*np.pi)
+
+                # Yell about your selected jet
+                logging.info('Pilot parton: {}, pT: {} GeV'.format(chosen_pilot, chosen_e))
+
+                # Log jet number
+                logging.info('Running Jet {}, {} variants'.format(str(process_num), len(variants)))
+
+                # Perform AA CNM weighting
+                AA_weight = CNM_interp.weight(pt=chosen_e, npart=npart, id=particle_pid) * chosen_weight
+
+                # Create the jet object
+                parton = jets.parton(x_0=x0, y_0=y0, phi_0=phi_0, p_T0=chosen_e, tag=particle_tag, no=jet_seed_num, part=chosen_pilot,
+                                  weight=chosen_weight, AA_weight=AA_weight)
+
+                # Run the time loop for all variants together
+                variant_results, error = evolve_parton_variants(event=event, parton=parton, variants=variants,
+                                                                el_model=el_model, record=record_mode,
+                                                                results=phi_partons)
+                particle_results.append((parton, variant_results))
+
+                i += 1
+                if error is not None:
+                    break
+
+            # Finish the variants one at a time, in order, adding the rows of their partons to the process results.
+            # Rows are grouped by variant as when variants were run one by one,
+            # and an error keeps the variants finished before it.
+            num_finished = min([len(variant_results) for parton, variant_results in particle_results],
+                               default=len(variants))
+            for v in range(num_finished):
+                rows = []
+                for parton, variant_results in particle_results:
+                    phi_row, jet_xarray, variant_parton = variant_results[v]
+
+                    # Perform pp-level fragmentation
+                    pp_frag_z = hadronization.frag(parton, num=config.EBE.NUM_FRAGS)
+                    pp_frag_z_22 = hadronization.frag(parton, num=config.EBE.NUM_FRAGS,
+                                                      ff_name="JAM22-FF_hadron_nlo")
+
+                    # Save the xarray trajectory file
+                    # Note we are currently in a temp directory... Save record in directory above.
+                    if config.mode.KEEP_RECORD:
+                        jet_xarray.to_netcdf('../{}_record.nc'.format(process_tag))
+
+                    logging.info('FF Fragmentation')
+                    # Perform ff fragmentation
+                    frag_z = hadronization.frag(variant_parton, num=config.EBE.NUM_FRAGS)
+                    frag_z_22 = hadronization.frag(variant_parton, num=config.EBE.NUM_FRAGS,
+                                                   ff_name="JAM22-FF_hadron_nlo")
+                    hadron_pt = variant_parton.p_T() * frag_z[0]
+                    hadron_pt_0 = variant_parton.p_T0 * pp_frag_z[0]
+                    hadron_22_pt = variant_parton.p_T() * frag_z_22[0]
+                    hadron_22_pt_0 = variant_parton.p_T0 * pp_frag_z_22[0]
+
+                    # Add the parton's row, filling in the process columns
+                    # Event columns are added once for the whole event, in run_event
+                    row = process_partons.append(**{name: phi_partons[name][phi_row]
+                                                    for name, dtype in timekeeper.PARTON_COLUMNS})
+                    process_partons.set(row, 'process', process_tag)
+                    process_partons.set(row, 'z', frag_z)
+                    process_partons.set(row, 'pp_z', pp_frag_z)
+                    process_partons.set(row, 'z_22', frag_z_22)
+                    process_partons.set(row, 'pp_z_22', pp_frag_z_22)
+                    process_partons.set(row, 'hadron_pt_f', hadron_pt)
+                    process_partons.set(row, 'hadron_pt_0', hadron_pt_0)
+                    process_partons.set(row, 'hadron_22_pt_f', hadron_22_pt)
+                    process_partons.set(row, 'hadron_22_pt_0', hadron_22_pt_0)
+                    process_partons.set(row, 'process_run', process_run)
+                    rows.append(row)
+
+                logging.info('Computing process-level observables')
+                # Compute acoplanarity
+                if config.jet.TYPE == "dijet":
+                    angles = process_partons['phi_f'][rows]
+                    pts = process_partons['pt_f'][rows]
+                    had_pts = process_partons['hadron_pt_f'][rows]
+                    had_22_pts = process_partons['hadron_22_pt_f'][rows]
+                    aco = np.abs(np.abs(np.mod(angles[0] - angles[1] + np.pi, 2 * np.pi) - np.pi))
+                    for row, partner_pt, partner_had_pt, partner_had_22_pt in zip(rows, np.flip(pts), np.flip(had_pts),
+                                                                                  np.flip(had_22_pts)):
+                        process_partons.set(row, 'partner_pt_f', partner_pt)
+                        process_partons.set(row, 'partner_hadron_pt_f', partner_had_pt)
+                        process_partons.set(row, 'partner_hadron_22_pt_f', partner_had_22_pt)
+                        process_partons.set(row, 'aco', aco)
+
+                # This variant is done
+                completed_rows = len(process_partons)
+                process_run += 1
+
+            # Stop the process at an error, as when variants were run one by one
+            if error is not None:
+                raise error
+
+
+    except Exception as error:
+        logging.info("An error occurred: {}".format(type(error).__name__))  # An error occurred: NameError
+        logging.info('- Jet Process Failed -')
+        traceback.print_exc()
+
+        # Drop the rows of any partially completed phi
+        process_partons.truncate(completed_rows)
+
+
+    # Declare jet complete
+    logging.info('- Jet Process ' + str(process_num) + ' Complete -')
+
+    return process_partons
+
+
+# Worker for parallel process execution
+# The event and its related objects are inherited from the parent when the worker is forked,
+# so the medium grids are shared copy-on-write rather than sent to each worker.
+process_context = {}
+def run_process_worker(work_unit):
+    process_num, seed = work_unit
+    return run_process(process_num=process_num, seed=seed, **process_context)
+
+
 # Function to generate a new HIC event and sample config.NUM_SAMPLES jets in it.
 def run_event(eventNo):
 
-    # Generate empty results frame
-    event_partons = pd.DataFrame({})
+    # Generate empty hadron results frame
     event_hadrons = pd.DataFrame({})
 
     ###############################
     # Generate new event geometry #
     ###############################
 
-    logging.info('Generating new event...')
+    if config.mode.LIBRARY_MODE == 'read':
+        # Reuse a hydro event from the medium library
+        logging.info('Sampling event from medium library...')
+        event, event_dataframe, event_observables = medium_library.sample_event(library_path, name=eventNo)
+    else:
+        logging.info('Generating new event...')
+
+        # Run event generation using config setttings
+        # Note that we need write permissions in the working directory
+        event_dataframe, event_observables = collision.generate_event(working_dir=None, IC_type=event_type)
 
-    # Run event generation using config setttings
-    # Note that we need write permissions in the working directory
-    event_dataframe, event_observables = collision.generate_event(working_dir=None, IC_type=event_type)
     rmax = event_dataframe.iloc[0]['rmax']
 
     # Record seed selected
@@ -201,13 +535,27 @@ def run_event(eventNo):
     # Record event psi_2
     psi_2 = event_dataframe.iloc[0]['psi_2']
 
-    # Open the hydro file and create file object for manipulation.
-    plasmaFilePath = 'viscous_14_moments_evo.dat'
-    file = plasma.osu_hydro_file(file_path=plasmaFilePath, event_name='seed: {}'.format(seed))
-
-    # Create event object
-    # This asks the hydro file object to interpolate the relevant functions and pass them on to the plasma object.
-    event = plasma.plasma_event(event=file, name=eventNo, rmax=rmax)
+    if config.mode.LIBRARY_MODE != 'read':
+        # Open the hydro file and create file object for manipulation.
+        plasmaFilePath = 'viscous_14_moments_evo.dat'
+        # The grid is only cached on disk if the event is kept, for later reads of the same event.
+        # Otherwise the event file is deleted with the temporary directory at exit, and a cache would never be read.
+        file = plasma.osu_hydro_file(file_path=plasmaFilePath, event_name='seed: {}'.format(seed),
+                                     cache=config.mode.KEEP_EVENT)
+
+        # Save the event to the medium library for reuse
+        if config.mode.LIBRARY_MODE == 'write':
+            medium_library.add_event(library_path, file, event_dataframe, event_observables)
+
+        # Create event object
+        # This asks the hydro file object to interpolate the relevant functions and pass them on to the plasma object.
+        if config.mode.MEDIUM_STORE:
+            # Lay the medium out in a store on disk and map it, so all workers share one copy through the page cache
+            plasma.write_medium_store(file, 'medium_store.dat')
+            del file
+            event = plasma.open_medium_store('medium_store.dat', name=eventNo, rmax=rmax)
+        else:
+            event = plasma.plasma_event(event=file, name=eventNo, rmax=rmax)
 
     # Compute temperature statistics for the hydro initial state (after freestreaming)
     maxTemp, minTemp, meanTemp, medianTemp, stdTemp = event.temp_stats()
@@ -230,232 +578,28 @@ def run_event(eventNo):
     num_phi = 11  # We select a prime number so this can't (?) influence v_n =/= v_{num_phi}
 
     # Oversample the background with jet seeds
-    for process_num in range(0, config.EBE.NUM_SAMPLES):
-        # Create unique jet seed tag
-        process_tag = int(np.random.uniform(0, 1000000000000))
-        logging.info('- Jet Seed Process {} Start -'.format(process_num))
-
+    if config.EBE.NUM_WORKERS > 1:
+        # Farm processes out to a pool of forked workers that share the event
+        logging.info('Running {} jet processes on {} workers'.format(config.EBE.NUM_SAMPLES, config.EBE.NUM_WORKERS))
+        process_context.update({'event': event, 'event_dataframe': event_dataframe, 'CNM_interp': CNM_interp,
+                                'npart': npart, 'num_phi': num_phi})
+        process_seeds = np.random.randint(0, 2**31 - 1, size=config.EBE.NUM_SAMPLES)
+        work_units = [(process_num, int(process_seeds[process_num]))
+                      for process_num in range(0, config.EBE.NUM_SAMPLES)]
         try:
-            #########################
-            # Create new scattering #
-            #########################
-            particles, weight = pythia.scattering(type=config.jet.TYPE)
-            particle_tags = np.random.default_rng().uniform(0, 1000000000000, len(particles)).astype(int)
-            process_partons = pd.DataFrame({})
-            process_hadrons = pd.DataFrame({})
-
-            # Compute angules for particles
-            part_phis = np.array([])
-            for index, particle in particles.iterrows():
-                # Find angle of each particle, add to list
-                pythia_phi = np.arctan2(particle['py'], particle['px']) + np.pi
-                part_phis = np.append(part_phis, pythia_phi)
-
-            # set coordinate system such that phi of first particle is at 0, on interval 0 to 2pi
-            part_phis = np.mod(part_phis - part_phis[0], 2*np.pi)
-
-            # Select jet seed production point
-            if not config.mode.VARY_POINT:
-                x0 = 0
-                y0 = 0
-            else:
-                newPoint = collision.generate_jet_seed_point(event)
-                x0, y0 = newPoint[0], newPoint[1]
-
-            process_run = 0
-
-            # Random azimuthal sampling
-            # phi_values = phi_rng.uniform(0, 2 * np.pi, num_phi)
-
-            # Uniform azimuthal sampling
-            phi_values = np.linspace(start=0, stop=2*np.pi, num=num_phi, endpoint=False) #+ psi_2
-
-            for phi_val in phi_values:
-                # phi_val = np.mod(np.random.uniform(phi_center - phi_res/2, phi_center + phi_res/2), 2*np.pi)
-
-
-
-                for case in [0, 1, 2, 3]:
-                    case_partons = pd.DataFrame({})
-                    # Determine case details
-                    if case == 0:
-                        el = True
-                        cel = False
-                        drift = False
-                        fg = False
-                        fgqhat = False
-                        config.constants.G = config.constants.G_RAD
-                    elif case == 1:
-                        el = True
-                        cel = False
-                        drift = True
-                        fg = False
-                        fgqhat = False
-                        config.constants.G = config.constants.G_RAD
-                    elif case == 2:
-                        el = True
-                        cel = True
-                        drift = False
-                        fg = False
-                        fgqhat = False
-                        config.constants.G = config.constants.G_COL
-                    elif case == 3:
-                        el = True
-                        cel = True
-                        drift = True
-                        fg = False
-                        fgqhat = False
-                        config.constants.G = config.constants.G_COL
-                    else:
-                        el = True
-                        cel = False
-                        drift = True
-                        fg = False
-                        fgqhat = False
-                        config.constants.G = config.constants.G_RAD
-
-                    if drift == True:
-                        kfdrift_list = [1.0, 0.75, 1.25]
-                    else:
-                        kfdrift_list = [0.0]
-                    for kfdrift in kfdrift_list:
-                        config.jet.K_F_DRIFT = kfdrift
-                        kf_partons = pd.DataFrame({})
-                        i = 0
-                        jet_seed_num = -1
-                        for index, particle in particles.iterrows():
-                            # Only do the things for the particle output
-                            particle_status = particle['status']
-                            particle_tag = int(particle_tags[i])
-                            jet_seed_num += 1
-                            # Read jet seed particle properties
-                            chosen_e = particle['pt']
-                            chosen_weight = weight
-                            particle_pid = particle['id']
-                            if particle_pid == 21:
-                                chosen_pilot = 'g'
-                            elif particle_pid == 1:
-                                chosen_pilot = 'd'
-                            elif particle_pid == -1:
-                                chosen_pilot = 'dbar'
-                            elif particle_pid == 2:
-                                chosen_pilot = 'u'
-                            elif particle_pid == -2:
-                                chosen_pilot = 'ubar'
-                            elif particle_pid == 3:
-                                chosen_pilot = 's'
-                            elif particle_pid == -3:
-                                chosen_pilot = 'sbar'
-                            elif particle_pid == 22:
-                                chosen_pilot = 'gamma'
-                                i += 1
-                                continue  # Skip the photons -- noninteracting.
-                            else:
-                                i += 1
-                                continue  # We don't know how this should interact... skip it.
-
-
-                            # Select jet seed particle angles
-                            phi_0 = np.mod(part_phis[i] + phi_val, 2*np.pi)
-
-                            # Yell about your selected jet
-                            logging.info('Pilot parton: {}, pT: {} GeV'.format(chosen_pilot, chosen_e))
-
-                            el_model = 'num_GLV'
-
-                            # Log jet number and case description
-                            logging.info('Running Jet {}, case {}'.format(str(process_num), case))
-                            logging.info('Energy Loss: {}, Vel Drift: {}, FG Drift: {}, FG Qhat: {}'.format(el, drift, fg,
-                                                                                                            fgqhat))
-                            # Perform AA CNM weighting
-                            AA_weight = CNM_interp.weight(pt=chosen_e, npart=npart, id=particle_pid) * chosen_weight
-
-                            # Create the jet object
-                            parton = jets.parton(x_0=x0, y_0=y0, phi_0=phi_0, p_T0=chosen_e, tag=particle_tag, no=jet_seed_num, part=chosen_pilot,
-                                              weight=chosen_weight, AA_weight=AA_weight)
-
-                            # Perform pp-level fragmentation
-                            pp_frag_z = hadronization.frag(parton, num=config.EBE.NUM_FRAGS)
-                            pp_frag_z_22 = hadronization.frag(parton, num=config.EBE.NUM_FRAGS,
-                                                              ff_name="JAM22-FF_hadron_nlo")
-
-                            # Run the time loop
-                            jet_dataframe, jet_xarray = timekeeper.evolve(event=event, parton=parton, drift=drift,
-                                                                          el=el, cel=cel, fg=fg, fgqhat=fgqhat,
-                                                                          el_model=el_model)
-
-                            # Save the xarray trajectory file
-                            # Note we are currently in a temp directory... Save record in directory above.
-                            if config.mode.KEEP_RECORD:
-                                jet_xarray.to_netcdf('../{}_record.nc'.format(process_tag))
-
-                            # Add scattering process tag
-                            jet_dataframe['process'] = process_tag
-
-                            # Merge the event and jet dataframe lines
-                            current_parton = pd.concat([jet_dataframe, event_dataframe], axis=1)
-
-                            logging.info('FF Fragmentation')
-                            # Perform ff fragmentation
-                            frag_z = hadronization.frag(parton, num=config.EBE.NUM_FRAGS)
-                            frag_z_22 = hadronization.frag(parton, num=config.EBE.NUM_FRAGS,
-                                                           ff_name="JAM22-FF_hadron_nlo")
-                            hadron_pt = parton.p_T() * frag_z[0]
-                            hadron_pt_0 = parton.p_T0 * pp_frag_z[0]
-                            hadron_22_pt = parton.p_T() * frag_z_22[0]
-                            hadron_22_pt_0 = parton.p_T0 * pp_frag_z_22[0]
-                            current_parton['z'] = [frag_z]
-                            current_parton['pp_z'] = [pp_frag_z]
-                            current_parton['z_22'] = [frag_z_22]
-                            current_parton['pp_z_22'] = [pp_frag_z_22]
-                            current_parton['hadron_pt_f'] = hadron_pt
-                            current_parton['hadron_pt_0'] = hadron_pt_0
-                            current_parton['hadron_22_pt_f'] = hadron_22_pt
-                            current_parton['hadron_22_pt_0'] = hadron_22_pt_0
-                            current_parton['process_run'] = process_run
-
-                            # Save jet pair
-                            if i == 0:
-                                parton1 = parton
-                            elif i == 1:
-                                parton2 = parton
-
-                            # Append current partons to the current process run list
-                            kf_partons = pd.concat([kf_partons, current_parton], axis=0)
-
-                            i += 1
-
-                        logging.info('Computing process-level observables')
-                        # Compute acoplanarity
-                        if config.jet.TYPE == "dijet":
-                            angles = kf_partons['phi_f'].to_numpy()
-                            pts = kf_partons['pt_f'].to_numpy()
-                            had_pts = kf_partons['hadron_pt_f'].to_numpy()
-                            had_22_pts = kf_partons['hadron_22_pt_f'].to_numpy()
-                            aco = np.abs(np.abs(np.mod(angles[0] - angles[1] + np.pi, 2 * np.pi) - np.pi))
-                            kf_partons['partner_pt_f'] = np.flip(pts)
-                            kf_partons['partner_hadron_pt_f'] = np.flip(had_pts)
-                            kf_partons['partner_hadron_22_pt_f'] = np.flip(had_22_pts)
-                            kf_partons['aco'] = np.full(2, aco)
-
-                        # Append to the case partons
-                        case_partons = pd.concat([case_partons, kf_partons], axis=0)
-
-                        process_run += 1
-
-                    logging.info('Appending case results to process results')
-                    process_partons = pd.concat([process_partons, case_partons], axis=0)
-
-
-        except Exception as error:
-            logging.info("An error occurred: {}".format(type(error).__name__))  # An error occurred: NameError
-            logging.info('- Jet Process Failed -')
-            traceback.print_exc()
-
-        event_partons = pd.concat([event_partons, process_partons], axis=0)
-
-        # Declare jet complete
-        logging.info('- Jet Process ' + str(process_num) + ' Complete -')
+            with multiprocessing.get_context('fork').Pool(processes=config.EBE.NUM_WORKERS) as pool:
+                # Results come back in process order, regardless of which worker finishes first
+                process_results = pool.map(run_process_worker, work_units, chunksize=1)
+        finally:
+            process_context.clear()
+    else:
+        process_results = [run_process(event=event, event_dataframe=event_dataframe, CNM_interp=CNM_interp,
+                                       npart=npart, process_num=process_num, num_phi=num_phi)
+                           for process_num in range(0, config.EBE.NUM_SAMPLES)]
+
+    # Join the process results, then make the dataframe once with the event columns broadcast to every parton
+    event_partons = timekeeper.concatenate_results(process_results, columns=process_columns()).to_dataframe(
+        broadcast={name: event_dataframe[name].iloc[0] for name in event_dataframe.columns})
 
     # Compute event metadata for xarray datasets
     event_mult = event_dataframe['mult'][0]
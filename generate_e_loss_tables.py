@@ -1,108 +1,219 @@
+import os
 import numpy as np
 import scipy.integrate as integrate
 import plasma_interaction as pi
 import time
-import config
 import argparse
+import multiprocessing
 
 """
 This file generates the tabulated energy loss values in the 'e_loss_tables' folder.
+The (E, T, L) grid of each table is split into shards of points, computed on a pool of worker processes.
+Each finished shard is saved in 'e_loss_tables/shards', so a killed run picks up where it left off when run again.
+Once every point of a table is done, the table is assembled and its shards are removed.
 """
-# Define command line arguments
-parser = argparse.ArgumentParser()
-parser.add_argument("-g", "--coupling", help="coupling to generate, e.g. 2.0 or 2.1")
-
-# Get command line arguments
-args = parser.parse_args()
-coupling_list = np.array([float(args.coupling)])  # Coupling to use
-
-# Use default hard coded list if not passed a coupling on the command line
-if coupling_list is None:
-    coupling_list = [1.6, 1.7, 1.8, 1.9, 2.0, 2.1, 2.2, 2.3, 2.4, 2.5, 2.6]
 
 subdiv = 1
-for parton in ['q', 'g']:
-    print('Computing tables for parton: {}'.format(parton))
-    for coupling in coupling_list:
-        print('Computing tables for g={}'.format(coupling))
-        config.constants.G = coupling
-        ALPHAS = (coupling ** 2) / (4 * np.pi)
-
-
-        ####################
-        # Define integrand #
-        ####################
-
-        # Create interpolated function for delta E given T, L, & E:
-        def delta_E(E, T, L):
-
-            if parton == 'q':
-                CR = 4 / 3
-            else:
-                CR = 3
-
-            mu = pi.mu_DeBye(T=T, g=coupling)  # in GeV
-            lamb = 1 / pi.inv_lambda(T=T, parton_type=parton)  # in GeV
-            FmGeV = 1 / 0.19732687
-
-            # # Define the analytic dI_dx we're targeting
-            # def an_dI_dx(x):
-            #     return ( ((1 / FmGeV) ** 2) * (CR * ALPHAS / 4) * ((1 - x + ((x**2)/2))/x) * ((L**2 * mu**2)/lamb))
-
-            # Define the analytic Delta E at first order
-            an_delta_E_1 = (((FmGeV) ** 2) * (CR * ALPHAS / 4) * ((L ** 2 * mu ** 2) / lamb) * np.log(E / mu))
-
-            # Define analytic Delta E at zeroth order (vacuum)
-            an_delta_E_0 = ((4 * CR * ALPHAS / (3 * np.pi)) * E * np.log(E / mu))
-
-            an_delta_E = an_delta_E_1  # an_delta_E_0 + an_delta_E_1
-
-            # Define numerical integrand as function of q and k
-
-            # Define numerical integrand as function of q and k
-            def integrand(x):
-                return lambda phi, k, q: (((FmGeV) ** 3) * (4 * CR * ALPHAS / (np.pi ** 2))
-                                          * (1)  # - x + ((x ** 2) / 2))
-                                          * (L / lamb) * E
-                                          * ((mu ** 2) / ((q ** 2 + mu ** 2) ** 2))
-                                          * ((q ** 2 * np.cos(phi) * (
-                                    k ** 2 - 2 * k * q * np.cos(phi) + q ** 2) * L ** 2)
-                                             / (16 * x ** 2 * E ** 2 + (
-                                        (k ** 2 - 2 * k * q * np.cos(phi) + q ** 2) ** 2 * L ** 2 * ((FmGeV) ** 2)))))
-
-            abs_err = 0.1
-            rel_err = 0.1
-
-            dI_dx_finq = lambda x: 2 * (integrate.nquad(integrand(x), [[0, np.pi], [mu, np.min(
-                [2 * E * x, 2 * E * np.sqrt(x * (1 - x))])], [0, np.sqrt(3 * mu * E)]],
-                                                        opts={"epsabs": abs_err, "epsrel": rel_err, "limit": subdiv})[
-                0])
-
-            x_min = 0
-            x_max = 1
-            t0 = time.time()
-            delta_E = integrate.quad(dI_dx_finq, x_min, x_max, limit=subdiv)[0]
-            tf = time.time()
-            print('E={} GeV, T={} GeV, L={} fm -- time={} s'.format(E, T, L, (tf - t0)))
-
-            return delta_E
-
-
-        delta_E = np.vectorize(delta_E)  # IMPORTANT!!!
-
-        ##############################
-        # Sample Delta E Phase Space #
-        ##############################
-
-        E_points = np.logspace(-0.3010299956639812, 2, 15)  # Logarithmic, 0.5 to 100 GeV
-        T_points = np.logspace(-1.3010299956639813, 0, 15)  # Logarithmic, 0.05 to 1 GeV
-        L_points = np.concatenate([np.array([0.0]), np.logspace(-2, 1.4, 15)])  # Logarithmic, 0.01 to 25 fm
-        #  g_points = np.array([1.8, 1.9, 2, 2.1, 2.2])
-
-        Es, Ts, Ls = np.meshgrid(E_points, T_points, L_points, indexing='ij')
-
-        delta_E_vals = delta_E(Es, Ts, Ls)
 
-        np.savez('e_loss_tables/g{}_deltaE_samples_{}_{}subdiv.npz'.format(coupling, parton, subdiv), E_points=E_points,
-                 T_points=T_points,
-                 L_points=L_points, delta_E_vals=delta_E_vals)
+##############################
+# Sample Delta E Phase Space #
+##############################
+
+E_points = np.logspace(-0.3010299956639812, 2, 15)  # Logarithmic, 0.5 to 100 GeV
+T_points = np.logspace(-1.3010299956639813, 0, 15)  # Logarithmic, 0.05 to 1 GeV
+L_points = np.concatenate([np.array([0.0]), np.logspace(-2, 1.4, 15)])  # Logarithmic, 0.01 to 25 fm
+#  g_points = np.array([1.8, 1.9, 2, 2.1, 2.2])
+
+Es, Ts, Ls = np.meshgrid(E_points, T_points, L_points, indexing='ij')
+grid_points = np.column_stack((Es.ravel(), Ts.ravel(), Ls.ravel()))
+
+
+####################
+# Define integrand #
+####################
+
+# Function to compute delta E for the parton type at the coupling, given E, T, & L
+def delta_E(E, T, L, parton, coupling):
+    ALPHAS = (coupling ** 2) / (4 * np.pi)
+
+    if parton == 'q':
+        CR = 4 / 3
+    else:
+        CR = 3
+
+    mu = pi.mu_DeBye(T=T, g=coupling)  # in GeV
+    lamb = 1 / pi.inv_lambda(T=T, parton_type=parton, g=coupling)  # in GeV
+    FmGeV = 1 / 0.19732687
+
+    # # Define the analytic dI_dx we're targeting
+    # def an_dI_dx(x):
+    #     return ( ((1 / FmGeV) ** 2) * (CR * ALPHAS / 4) * ((1 - x + ((x**2)/2))/x) * ((L**2 * mu**2)/lamb))
+
+    # Define the analytic Delta E at first order
+    an_delta_E_1 = (((FmGeV) ** 2) * (CR * ALPHAS / 4) * ((L ** 2 * mu ** 2) / lamb) * np.log(E / mu))
+
+    # Define analytic Delta E at zeroth order (vacuum)
+    an_delta_E_0 = ((4 * CR * ALPHAS / (3 * np.pi)) * E * np.log(E / mu))
+
+    an_delta_E = an_delta_E_1  # an_delta_E_0 + an_delta_E_1
+
+    # Define numerical integrand as function of q and k
+    def integrand(x):
+        return lambda phi, k, q: (((FmGeV) ** 3) * (4 * CR * ALPHAS / (np.pi ** 2))
+                                  * (1)  # - x + ((x ** 2) / 2))
+                                  * (L / lamb) * E
+                                  * ((mu ** 2) / ((q ** 2 + mu ** 2) ** 2))
+                                  * ((q ** 2 * np.cos(phi) * (
+                            k ** 2 - 2 * k * q * np.cos(phi) + q ** 2) * L ** 2)
+                                     / (16 * x ** 2 * E ** 2 + (
+                                (k ** 2 - 2 * k * q * np.cos(phi) + q ** 2) ** 2 * L ** 2 * ((FmGeV) ** 2)))))
+
+    abs_err = 0.1
+    rel_err = 0.1
+
+    dI_dx_finq = lambda x: 2 * (integrate.nquad(integrand(x), [[0, np.pi], [mu, np.min(
+        [2 * E * x, 2 * E * np.sqrt(x * (1 - x))])], [0, np.sqrt(3 * mu * E)]],
+                                                opts={"epsabs": abs_err, "epsrel": rel_err, "limit": subdiv})[
+        0])
+
+    x_min = 0
+    x_max = 1
+    t0 = time.time()
+    delta_E = integrate.quad(dI_dx_finq, x_min, x_max, limit=subdiv)[0]
+    tf = time.time()
+    print('E={} GeV, T={} GeV, L={} fm -- time={} s'.format(E, T, L, (tf - t0)))
+
+    return delta_E
+
+
+# Function to return the path of the table for the parton type at the coupling
+def table_path(parton, coupling):
+    return 'e_loss_tables/g{}_deltaE_samples_{}_{}subdiv.npz'.format(float(coupling), parton, subdiv)
+
+
+# Function to return the directory holding the finished shards of the table for the parton type at the coupling
+def shard_dir(parton, coupling):
+    return 'e_loss_tables/shards/g{}_deltaE_samples_{}_{}subdiv'.format(float(coupling), parton, subdiv)
+
+
+# Function to load the finished shards of the table for the parton type at the coupling
+# Shards computed on a different grid are ignored.
+# Returns the flat grid indices done and their delta E values
+def load_shards(parton, coupling):
+    indices = []
+    values = []
+    if os.path.isdir(shard_dir(parton, coupling)):
+        for filename in sorted(os.listdir(shard_dir(parton, coupling))):
+            if not (filename.startswith('shard_') and filename.endswith('.npz')) or filename.endswith('.tmp.npz'):
+                continue
+            shard = np.load(os.path.join(shard_dir(parton, coupling), filename))
+            if (np.amax(shard['indices'], initial=-1) >= len(grid_points)
+                    or not np.array_equal(shard['points'], grid_points[shard['indices']])):
+                print('Ignoring shard from a different grid: {}'.format(filename))
+                continue
+            indices.append(shard['indices'])
+            values.append(shard['delta_E_vals'])
+    if len(indices) == 0:
+        return np.array([], dtype=int), np.array([])
+    return np.concatenate(indices), np.concatenate(values)
+
+
+# Function to compute a shard of a table and save it
+# Each shard is named by its first grid index, which no other shard of the table holds.
+def run_shard(shard):
+    parton, coupling, indices = shard
+    delta_E_vals = np.array([delta_E(E, T, L, parton=parton, coupling=coupling) for E, T, L in grid_points[indices]])
+
+    # Write to a temporary file first, so an interrupted shard is never taken as finished
+    shard_path = os.path.join(shard_dir(parton, coupling), 'shard_{:05d}.npz'.format(indices[0]))
+    temp_path = shard_path[:-len('.npz')] + '.tmp.npz'
+    np.savez(temp_path, indices=indices, points=grid_points[indices], delta_E_vals=delta_E_vals)
+    os.replace(temp_path, shard_path)
+    return parton, coupling, len(indices)
+
+
+# Function to assemble the table for the parton type at the coupling from its shards, then remove the shards
+def assemble_table(parton, coupling, keep_shards=False):
+    indices, values = load_shards(parton, coupling)
+    delta_E_vals = np.full(len(grid_points), np.nan)
+    delta_E_vals[indices] = values
+    if np.any(np.isnan(delta_E_vals)):
+        raise RuntimeError('Table for {} at g={} is missing points'.format(parton, coupling))
+    delta_E_vals = delta_E_vals.reshape(Es.shape)
+
+    temp_path = table_path(parton, coupling)[:-len('.npz')] + '.tmp.npz'
+    np.savez(temp_path, E_points=E_points,
+             T_points=T_points,
+             L_points=L_points, delta_E_vals=delta_E_vals)
+    os.replace(temp_path, table_path(parton, coupling))
+
+    if not keep_shards:
+        for filename in os.listdir(shard_dir(parton, coupling)):
+            os.remove(os.path.join(shard_dir(parton, coupling), filename))
+        os.rmdir(shard_dir(parton, coupling))
+        try:
+            os.rmdir(os.path.dirname(shard_dir(parton, coupling)))
+        except OSError:
+            pass  # Shards of other tables remain
+
+
+if __name__ == '__main__':
+    # Define command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--coupling", type=float, nargs='+',
+                        help="couplings to generate, e.g. 2.0 2.1")
+    parser.add_argument("-p", "--parton", nargs='+', default=['q', 'g'], help="parton types to generate")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-s", "--shard_size", type=int, default=8, help="number of grid points per shard")
+    parser.add_argument("-k", "--keep_shards", action="store_true", help="keep the shards after assembling tables")
+    parser.add_argument("-c", "--combine", action="store_true",
+                        help="combine the tables of every coupling into the (E, T, L, g) tables afterwards")
+
+    # Get command line arguments
+    args = parser.parse_args()
+    if args.coupling is not None:
+        coupling_list = args.coupling  # Couplings to use
+    elif args.combine:
+        coupling_list = []  # Only combine existing tables
+    else:
+        coupling_list = None
+
+    # Use default hard coded list if not passed a coupling on the command line
+    if coupling_list is None:
+        coupling_list = [1.6, 1.7, 1.8, 1.9, 2.0, 2.1, 2.2, 2.3, 2.4, 2.5, 2.6]
+
+    # Split the points not yet done of every table into shards
+    # Points are dealt out in strides, so each shard holds a mix of cheap and expensive points.
+    shards = []
+    tables = []
+    for parton in args.parton:
+        for coupling in coupling_list:
+            os.makedirs(shard_dir(parton, coupling), exist_ok=True)
+            done = load_shards(parton, coupling)[0]
+            pending = np.setdiff1d(np.arange(len(grid_points)), done)
+            print('Table for {} at g={}: {} of {} points done'.format(parton, coupling, len(done), len(grid_points)))
+            num_shards = int(np.ceil(len(pending) / args.shard_size))
+            for shard_num in range(num_shards):
+                shards.append((parton, coupling, pending[shard_num::num_shards]))
+            tables.append((parton, coupling))
+
+    # Compute the shards, saving each as it finishes
+    print('Computing {} shards on {} workers'.format(len(shards), args.workers))
+    if args.workers > 1 and len(shards) > 1:
+        with multiprocessing.get_context('fork').Pool(processes=args.workers) as pool:
+            for parton, coupling, num_points in pool.imap_unordered(run_shard, shards, chunksize=1):
+                print('Finished shard of {} points for {} at g={}'.format(num_points, parton, coupling))
+    else:
+        for shard in shards:
+            parton, coupling, num_points = run_shard(shard)
+            print('Finished shard of {} points for {} at g={}'.format(num_points, parton, coupling))
+
+    # Assemble the tables
+    for parton, coupling in tables:
+        print('Assembling table for {} at g={}'.format(parton, coupling))
+        assemble_table(parton, coupling, keep_shards=args.keep_shards)
+
+    # Combine the tables of every coupling into one (E, T, L, g) table per parton type
+    if args.combine:
+        print('Combining tables for all couplings')
+        pi.write_combined_eloss_tables()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+import plasma
+
+"""
+A medium library is a directory of hydro events saved for reuse, so that jet physics can be run again in the same
+events without running Trento, freestreaming, osu-hydro, and UrQMD again.
+Each event is an entry -- a directory holding:
+    medium.dat -- the medium of the event, as a medium store (see plasma.write_medium_store)
+    event.pickle -- the event_dataframe of the event, with its soft observables
+    observables.npy -- the UrQMD observables of the event
+"""
+
+# Names of the files of each library entry
+MEDIUM_FILE = 'medium.dat'
+EVENT_FILE = 'event.pickle'
+OBSERVABLES_FILE = 'observables.npy'
+
+
+# Function to add an event to the medium library at library_path
+# The entry is written to a temporary directory first and then moved into place,
+# so an interrupted write never leaves a partial entry behind.
+# Returns the name of the new entry.
+def add_event(library_path, hydro_file, event_dataframe, event_observables, entry=None):
+    os.makedirs(library_path, exist_ok=True)
+
+    # Name the entry by the seed of the event, if not given
+    if entry is None:
+        entry = 'seed_{}'.format(int(event_dataframe.iloc[0]['seed']))
+    base_entry = entry
+    number = 1
+    while os.path.exists(os.path.join(library_path, entry)):
+        entry = '{}_{}'.format(base_entry, number)
+        number += 1
+
+    logging.info('Adding event to medium library: {}'.format(os.path.join(library_path, entry)))
+    temp_path = os.path.join(library_path, '.tmp_{}_{}'.format(entry, os.getpid()))
+    os.makedirs(temp_path, exist_ok=True)
+    try:
+        plasma.write_medium_store(hydro_file, os.path.join(temp_path, MEDIUM_FILE))
+        event_dataframe.to_pickle(os.path.join(temp_path, EVENT_FILE))
+        np.save(os.path.join(temp_path, OBSERVABLES_FILE), event_observables)
+        os.rename(temp_path, os.path.join(library_path, entry))
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+    return entry
+
+
+# Function to list the complete entries of the medium library at library_path
+# Returns a sorted list of entry names
+def list_events(library_path):
+    if not os.path.isdir(library_path):
+        return []
+    return sorted(entry for entry in os.listdir(library_path)
+                  if not entry.startswith('.')
+                  and all(os.path.exists(os.path.join(library_path, entry, file_name))
+                          for file_name in [MEDIUM_FILE, EVENT_FILE, OBSERVABLES_FILE]))
+
+
+# Function to load an entry of the medium library at library_path
+# The medium is memory-mapped from the library, so loading is immediate.
+# Returns the plasma_event, the event_dataframe, and the UrQMD observables of the event.
+def load_event(library_path, entry, name=None):
+    entry_path = os.path.join(library_path, entry)
+    logging.info('Loading event from medium library: {}'.format(entry_path))
+    event_dataframe = pd.read_pickle(os.path.join(entry_path, EVENT_FILE))
+    event_observables = np.load(os.path.join(entry_path, OBSERVABLES_FILE), allow_pickle=True)[()]
+    event = plasma.open_medium_store(os.path.join(entry_path, MEDIUM_FILE), name=name,
+                                     rmax=event_dataframe.iloc[0]['rmax'])
+    return event, event_dataframe, event_observables
+
+
+# Function to load a random entry of the medium library at library_path
+# Returns the plasma_event, the event_dataframe, and the UrQMD observables of the event.
+def sample_event(library_path, name=None, rng=None):
+    entries = list_events(library_path)
+    if len(entries) == 0:
+        raise FileNotFoundError('No events in medium library: {}'.format(library_path))
+    if rng is None:
+        entry = entries[np.random.randint(len(entries))]
+    else:
+        entry = entries[rng.integers(len(entries))]
+    return load_event(library_path, entry, name=name)
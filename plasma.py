@@ -9,10 +9,97 @@ except:
 from scipy.interpolate import RegularGridInterpolator
 import config
 import logging
-
-
+import os
+import math
+import json
+
+
+# Columns of an osu-hydro viscous_14_moments_evo.dat file, in order
+HYDRO_FIELDS = ['time', 'xpos', 'ypos', 'temp', 'xvel', 'yvel']
+
+# Medium fields of a plasma_event
+MEDIUM_FIELDS = ['temp', 'x_vel', 'y_vel', 'temp_grad_x', 'temp_grad_y',
+                 'grad_x_u_x', 'grad_x_u_y', 'grad_y_u_x', 'grad_y_u_y']
+
+# Fields needed by every event -- gradients are only needed for flow-gradient effects
+BASE_FIELDS = ['temp', 'x_vel', 'y_vel']
+
+# Fields built on first use by an event
+GRADIENT_FIELDS = [field for field in MEDIUM_FIELDS if field not in BASE_FIELDS]
+
+# First bytes of a medium store file (see write_medium_store), and the alignment of the field blocks within it
+MEDIUM_STORE_MAGIC = b'APE-MEDIUM-STORE'
+MEDIUM_STORE_ALIGN = 4096
+
+
+# Function to load an osu-hydro evolution file as a contiguous [NT, NX, NY, field] array, fields as in HYDRO_FIELDS.
+# The text is read in one pass with the C parser of pandas. If cache, the array is saved to a .npy file next to the
+# event (file_path + '.npy'), and later loads of the same event memory-map the cache rather than parsing the text again.
+# A cache older than the event file is ignored and rewritten.
+def load_hydro_grid(file_path, cache=True):
+    cache_path = file_path + '.npy'
+    if cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        logging.info('Memory-mapping cached hydro grid: {}'.format(cache_path))
+        return np.load(cache_path, mmap_mode='r')
+
+    # Read the lines of the file straight into a [line, field] array with the C parser of pandas
+    num_fields = len(HYDRO_FIELDS)
+    try:
+        rows = pd.read_csv(file_path, sep=r'\s+', header=None, engine='c', dtype=np.float64).to_numpy()
+    except pd.errors.EmptyDataError:
+        rows = np.empty((0, num_fields))
+    if len(rows) == 0 or rows.shape[1] != num_fields:
+        raise ValueError('Malformed hydro file: {}'.format(file_path))
+
+    # Grid is always square. Number of lines of the same time is the number of grid squares == grid_width**2.
+    # Note that we check the END timestep because the first timestep may be repeated
+    grid_width = int(np.sqrt(np.count_nonzero(rows[:, 0] == rows[-1, 0])))
+    NT = int(len(rows) / grid_width ** 2)
+
+    # Lines run over x fastest, then y, then time -- reorder into [time, x, y, field].
+    # The transposition has been confirmed against data.
+    grid = np.ascontiguousarray(np.transpose(np.reshape(rows, [NT, grid_width, grid_width, num_fields]),
+                                             axes=[0, 2, 1, 3]))
+
+    if cache:
+        try:
+            # Write to a temporary name first, so an interrupted write never leaves a partial cache behind
+            temp_path = cache_path + '.tmp.npy'
+            np.save(temp_path, grid)
+            os.replace(temp_path, cache_path)
+        except OSError as error:
+            logging.warning('Could not write hydro grid cache: {}'.format(error))
+
+    return grid
+
+
+# Function to stack the temperature and flow velocity on a [time, x, y] grid and/or their x and y gradients
+# into one read-only [time, x, y, field] array, with the requested fields (from MEDIUM_FIELDS) in the order given.
+# Gradients are computed one field at a time, and only if requested.
+# The stacked array is stored as dtype, while gradients are always computed in double precision.
+def stack_medium_fields(temp_values, x_vel_values, y_vel_values, grid_step, fields=MEDIUM_FIELDS, dtype=np.float64):
+    fields = list(fields)
+    stacked = np.empty(np.shape(temp_values) + (len(fields),), dtype=dtype)
+    for field, values, x_name, y_name in [('temp', temp_values, 'temp_grad_x', 'temp_grad_y'),
+                                          ('x_vel', x_vel_values, 'grad_x_u_x', 'grad_y_u_x'),
+                                          ('y_vel', y_vel_values, 'grad_x_u_y', 'grad_y_u_y')]:
+        if field in fields:
+            stacked[:, :, :, fields.index(field)] = values
+        if x_name in fields or y_name in fields:
+            values = np.asarray(values, dtype=np.float64)
+            for axis, name in [(1, x_name), (2, y_name)]:
+                if name in fields:
+                    stacked[:, :, :, fields.index(name)] = np.gradient(values, grid_step, axis=axis)
+
+    stacked.flags.writeable = False
+    return stacked
+
+
+# dtype sets the precision the grid and medium fields are stored in -- float32 halves the memory of an event.
+# Grid coordinates are always found in double precision.
 class osu_hydro_file:
-    def __init__(self, file_path, event_name=None, temp_conv_factor=0.1973269788):
+    def __init__(self, file_path, event_name=None, temp_conv_factor=0.1973269788, cache=True,
+                 dtype=config.mode.MEDIUM_DTYPE, crop=config.mode.CROP_MEDIUM):
         # Store your original file location and event number
         self.file_path = file_path
         self.name = event_name
@@ -20,34 +107,29 @@ class osu_hydro_file:
         # Announce initialization
         print('Reading osu-hydro file ... event: ' + str(self.name))
 
-        # Store grid data
-        self.grid_data = pd.read_table(file_path, header=None, sep='\s+', dtype=np.float64,
-                                       names=['time', 'xpos', 'ypos', 'temp', 'xvel', 'yvel'])
+        # Store grid data as a [time, x, y, field] array
+        self.grid = load_hydro_grid(file_path, cache=cache)
 
         # Initialize all the ordinary grid parameters
-
-        # Grid is always square. Number of lines of the same time is the number of grid squares == grid_width**2.
-        # Note that we check the END timestep because the first timestep may be repeated
-        self.grid_width = int(np.sqrt(self.grid_data[['time']].value_counts().to_numpy()[-1]))
+        self.grid_width = int(self.grid.shape[1])
 
         # n_grid_spaces is total number of grid spaces / bins. Assumes square grid.
         self.n_grid_spaces = self.grid_width ** 2
 
-        # Number of time steps is grid_data's time column divided by number of grid spaces.
-        self.NT = int(len(self.grid_data[['time']]) / self.n_grid_spaces)
+        # Number of time steps
+        self.NT = int(self.grid.shape[0])
 
         # Set grid space & time domains & lists
 
         # We get lists of time and space coordinates from the file
-        # These are literally just numpy arrays of the xpos and time columns
-        # Use this to match up to NT x grid_width x grid_width array of values for interpolation
-        self.xlist = np.ndarray.flatten(pd.DataFrame(self.grid_data[['xpos']]).to_numpy())
-        self.tlist = np.ndarray.flatten(pd.DataFrame(self.grid_data[['time']]).to_numpy())
+        # These are the time of each time step and the x position of each x grid index
+        self.xlist = np.array(self.grid[0, :, 0, HYDRO_FIELDS.index('xpos')])
+        self.tlist = np.array(self.grid[:, 0, 0, HYDRO_FIELDS.index('time')])
 
         # Difference in absolute time between steps in simulation
         # Note that we find the timestep from the end of the list. In files from osu-hydro,
         # the first two timesteps are labeled with the same absolute time.
-        self.timestep = self.tlist[-1] - self.tlist[-1 - int(self.n_grid_spaces)]
+        self.timestep = self.tlist[-1] - self.tlist[-2]
 
         # Difference in absolute space between grid positions
         # Note that we want a real, positive value for this
@@ -83,247 +165,203 @@ class osu_hydro_file:
         # Converts temperature to GeV -- By default goes from fm^-1 to GeV
         self.temp_conv_factor = temp_conv_factor
 
+        # Store grid data in the requested precision
+        self.dtype = np.dtype(dtype)
+        if self.grid.dtype != self.dtype:
+            self.grid = self.grid.astype(self.dtype)
+
+        # Medium fields, built when first needed
+        self.stacked_data = None
+        self.field_data = None
+
+        # Region of the grid the medium is interpolated over
+        self.crop = self.crop_box() if crop else None
+
+    # Grid data as a table with one line per grid point, in the order of the hydro file
+    @property
+    def grid_data(self):
+        rows = np.reshape(np.transpose(self.grid, axes=[0, 2, 1, 3]), [-1, len(HYDRO_FIELDS)])
+        return pd.DataFrame(rows, columns=HYDRO_FIELDS)
+
+    # Method to find the bounding box of the grid cells above the lowest temperature that matters to partons
+    # The box is padded by a few steps, so that every step that comes near a cell above the threshold
+    # samples the same medium as the full grid.
+    # Returns a tuple of (time, x, y) index slices, or None if no cell is above the threshold.
+    def crop_box(self, threshold=None, dtau=config.jet.DTAU):
+        if threshold is None:
+            threshold = min(config.transport.hydro.T_SWITCH, config.jet.T_HRG, config.jet.T_UNHYDRO)
+
+        # Find the time slices, x indexes, and y indexes with cells above the threshold, one slice at a time
+        temp_index = HYDRO_FIELDS.index('temp')
+        hot_t = np.zeros(self.NT, dtype=bool)
+        hot_x = np.zeros(self.grid_width, dtype=bool)
+        hot_y = np.zeros(self.grid_width, dtype=bool)
+        for it in range(self.NT):
+            hot = self.temp_conv_factor * self.grid[it, :, :, temp_index] >= threshold
+            if np.any(hot):
+                hot_t[it] = True
+                hot_x |= np.any(hot, axis=1)
+                hot_y |= np.any(hot, axis=0)
+        if not np.any(hot_t):
+            return None
+
+        # Pad the box by a step plus a couple of cells, within the grid
+        box = []
+        for hot_index, padding, size in [(hot_t, int(np.ceil(dtau / self.timestep)) + 2, self.NT),
+                                         (hot_x, int(np.ceil(dtau / self.gridstep)) + 2, self.grid_width),
+                                         (hot_y, int(np.ceil(dtau / self.gridstep)) + 2, self.grid_width)]:
+            indexes = np.flatnonzero(hot_index)
+            box.append(slice(int(max(indexes[0] - padding, 0)), int(min(indexes[-1] + padding + 1, size))))
+
+        logging.info('Cropped medium to {} of {} grid points'.format(
+            np.prod([index.stop - index.start for index in box]), self.NT * self.n_grid_spaces))
+        return tuple(box)
+
+    # Method to build the medium fields of the event from the grid, once
+    # T, u_x and u_y are cut out of the grid a single time, and all six gradients are computed from them in one pass.
+    # The fields are stored together as one [time, x, y, field] array (see stacked_fields),
+    # and every field is a read-only view of it, so all users share the same data.
+    # Returns a dictionary of [time, x, y] arrays, keyed by MEDIUM_FIELDS.
+    def field_arrays(self):
+        if self.field_data is None:
+            self.field_data = {field: self.stacked_fields()[:, :, :, i] for i, field in enumerate(MEDIUM_FIELDS)}
+        return self.field_data
+
+    # Method to return the given medium fields as one [time, x, y, field] array, in the order given
+    # The full set of fields over the full grid is kept once built, for field_arrays.
+    # With crop, only the region of the crop box is returned.
+    # Gradients are taken over the box widened by a cell, so they match those of the full grid.
+    def stacked_fields(self, fields=MEDIUM_FIELDS, crop=False):
+        if crop and self.crop is not None:
+            box_t, box_x, box_y = self.crop
+            wide_x = slice(max(box_x.start - 1, 0), min(box_x.stop + 1, self.grid_width))
+            wide_y = slice(max(box_y.start - 1, 0), min(box_y.stop + 1, self.grid_width))
+            region = (box_t, wide_x, wide_y)
+            trim = (slice(None), slice(box_x.start - wide_x.start, box_x.stop - wide_x.start),
+                    slice(box_y.start - wide_y.start, box_y.stop - wide_y.start))
+        else:
+            if self.stacked_data is not None and list(fields) == MEDIUM_FIELDS:
+                return self.stacked_data
+            region = (slice(None), slice(None), slice(None))
+            trim = None
+
+        logging.debug('Multiplying temperatures by HbarC to convert fm^-1 to GeV')
+        grid = self.grid[region]
+        stacked = stack_medium_fields(temp_values=self.temp_conv_factor * grid[:, :, :, HYDRO_FIELDS.index('temp')],
+                                      x_vel_values=grid[:, :, :, HYDRO_FIELDS.index('xvel')],
+                                      y_vel_values=grid[:, :, :, HYDRO_FIELDS.index('yvel')],
+                                      grid_step=self.gridstep, fields=fields, dtype=self.dtype)
+        if trim is not None:
+            stacked = np.ascontiguousarray(stacked[trim])
+            stacked.flags.writeable = False
+        elif list(fields) == MEDIUM_FIELDS:
+            self.stacked_data = stacked
+        return stacked
+
+    # Method to return the given medium fields of a single time slice of the grid, at full precision
+    # Returns a dictionary of [x, y] arrays, keyed by field.
+    def slice_fields(self, index, fields=BASE_FIELDS):
+        grid = self.grid[index:index + 1]
+        stacked = stack_medium_fields(temp_values=self.temp_conv_factor * grid[:, :, :, HYDRO_FIELDS.index('temp')],
+                                      x_vel_values=grid[:, :, :, HYDRO_FIELDS.index('xvel')],
+                                      y_vel_values=grid[:, :, :, HYDRO_FIELDS.index('yvel')],
+                                      grid_step=self.gridstep, fields=fields)
+        return {field: stacked[0, :, :, i] for i, field in enumerate(fields)}
+
     # Method to get raw temp data
+    # You can get the temperature at the grid indexes (ix,iy) at timestep 'it' as temp_array[it,ix,iy].
     def temp_array(self):
-        # Cut temp data out and convert to numpy array
-        temp_column = self.grid_data[['temp']]
-        temp_data = pd.DataFrame(temp_column).to_numpy()
-
-        # Reshape this nonsense into an array with first index time, then x, then y.
-        # You can get the temperature at the grid indexes (ix,iy) at timestep 'it' as temp_array[it,ix,iy].
-        logging.debug('Transposing temperatures and multiplying by HbarC to convert fm^-1 to GeV')
-        temp_data = self.temp_conv_factor * np.transpose(np.reshape(temp_data, [self.NT, self.grid_width, self.grid_width]), axes=[0, 2, 1])
-
-        return temp_data
+        return self.field_arrays()['temp']
 
     # Method to get raw temp x-direction gradient data
     def temp_grad_x_array(self):
-        # Get the temp data as an array organized to be [time, x, y]-ish
-        temp_data = self.temp_array()
-
-        # Compute temperature gradient in the x-direction
-        temp_grad_x = np.gradient(temp_data, self.gridstep, axis=1)
-
-        # Spit out the array, organized the same as the temp_data array
-        return temp_grad_x
+        return self.field_arrays()['temp_grad_x']
 
     # Method to get raw temp y-direction gradient data
     def temp_grad_y_array(self):
-        # Get the temp data as an array organized to be [time, x, y]-ish
-        temp_data = self.temp_array()
-
-        # Compute temperature gradient in the y-direction
-        temp_grad_y = np.gradient(temp_data, self.gridstep, axis=2)
-
-        # Spit out the array, organized the same as the temp_data array
-        return temp_grad_y
+        return self.field_arrays()['temp_grad_y']
 
     # Method to get raw x velocity data
+    # You can get the x velocity at the grid point (ix,iy) at timestep it as vel_x_data[it,ix,iy].
     def x_vel_array(self):
-        # Cut x velocity data out and convert to numpy array
-        x_vel_column = self.grid_data[['xvel']]
-        x_vel_data = pd.DataFrame(x_vel_column).to_numpy()
-
-        # Reshape this nonsense into an array with first index time, then x, then y.
-        # You can get the x velocity at the grid point (ix,iy) at timestep it as vel_x_data[it,ix,iy].
-        # The transposition has been confirmed against data.
-        x_vel_data = np.transpose(np.reshape(x_vel_data, [self.NT, self.grid_width, self.grid_width]), axes=[0, 2, 1])
-
-        return x_vel_data
+        return self.field_arrays()['x_vel']
 
     # Method to get raw y velocity data
     def y_vel_array(self):
-        # Cut x velocity data out and convert to numpy array
-        y_vel_column = self.grid_data[['yvel']]
-        y_vel_data = pd.DataFrame(y_vel_column).to_numpy()
-
-        # Reshape this nonsense into an array with first index time, then x, then y.
-        # You can get the x velocity at the grid point (ix,iy) at timestep it as vel_x_data[it,ix,iy].
-        # The transposition has been confirmed against data.
-        y_vel_data = np.transpose(np.reshape(y_vel_data, [self.NT, self.grid_width, self.grid_width]), axes=[0, 2, 1])
-
-        return y_vel_data
+        return self.field_arrays()['y_vel']
 
     # Method to get raw flow x-direction gradient data
     def grad_x_u_x_array(self):
-        # Get the temp data as an array organized to be [time, x, y]-ish
-        flow_x_data = self.x_vel_array()
-
-        # Compute temperature gradient in the x-direction
-        grad_x_u_x = np.gradient(flow_x_data, self.gridstep, axis=1)
-
-        # Spit out the array, organized the same as the temp_data array
-        return grad_x_u_x
+        return self.field_arrays()['grad_x_u_x']
 
     # Method to get raw flow x-direction gradient data
     def grad_x_u_y_array(self):
-        # Get the temp data as an array organized to be [time, x, y]-ish
-        flow_y_data = self.y_vel_array()
-
-        # Compute temperature gradient in the x-direction
-        grad_x_u_y = np.gradient(flow_y_data, self.gridstep, axis=1)
+        return self.field_arrays()['grad_x_u_y']
 
-        # Spit out the array, organized the same as the temp_data array
-        return grad_x_u_y
-
-    # Method to get raw flow x-direction gradient data
+    # Method to get raw flow y-direction gradient data
     def grad_y_u_x_array(self):
-        # Get the temp data as an array organized to be [time, x, y]-ish
-        flow_x_data = self.x_vel_array()
-
-        # Compute temperature gradient in the x-direction
-        grad_y_u_x = np.gradient(flow_x_data, self.gridstep, axis=2)
+        return self.field_arrays()['grad_y_u_x']
 
-        # Spit out the array, organized the same as the temp_data array
-        return grad_y_u_x
-
-    # Method to get raw flow x-direction gradient data
+    # Method to get raw flow y-direction gradient data
     def grad_y_u_y_array(self):
-        # Get the temp data as an array organized to be [time, x, y]-ish
-        flow_y_data = self.y_vel_array()
-
-        # Compute temperature gradient in the x-direction
-        grad_y_u_y = np.gradient(flow_y_data, self.gridstep, axis=2)
-
-        # Spit out the array, organized the same as the temp_data array
-        return grad_y_u_y
+        return self.field_arrays()['grad_y_u_y']
 
     # Method to plot raw temp data
     def plot_temps(self, time):
-        # Cut temp data out and convert to numpy array #
-        temp_data_cut = self.grid_data[['temp']]
-        temp_data = pd.DataFrame(temp_data_cut).to_numpy()
+        # Cut temp data out of the grid
+        temp_data = self.temp_array()
 
         return plt.contourf(temp_data[time, :, :])
 
     # Method to return interpolated function object from data
-    # Function to interpolate the temperature grid from the hydro file
+    # Function to interpolate a medium field grid from the hydro file
     # Returns interpolating callable function
+    def interpolate_grid(self, field):
+        # The final values have been confirmed directly against absolute coordinates in data.
+        return RegularGridInterpolator((self.tspace, self.xspace, self.xspace), self.field_arrays()[field])
+
+    # Method to interpolate every medium field grid from the hydro file
+    # Returns a dictionary of interpolating callable functions, keyed by MEDIUM_FIELDS
+    def interpolate_grids(self):
+        print('Interpolating grid data for event: ' + str(self.name))
+        return {field: self.interpolate_grid(field) for field in MEDIUM_FIELDS}
+
+    # Method to interpolate the given medium fields from the hydro file together
+    # Only the crop box is tabulated, if any, and the medium outside of it is vacuum.
+    # Returns a grid_interpolator over the fields, spanning the full grid
+    def interpolate_fields(self, fields=MEDIUM_FIELDS):
+        print('Interpolating {} grid data for event: {}'.format(', '.join(fields), self.name))
+        offset = None if self.crop is None else [index.start for index in self.crop]
+        return grid_interpolator((self.tspace, self.xspace, self.xspace), self.stacked_fields(fields, crop=True),
+                                 fields, offset=offset)
+
+    # Methods to interpolate each of the medium field grids from the hydro file
     def interpolate_temp_grid(self):
-        print('Interpolating temp grid data for event: ' + str(self.name))
-
-        # Cut temp data out and convert to numpy array
-        temp_data = self.temp_array()
+        return self.interpolate_grid('temp')
 
-        # Interpolate data!
-        # The final temperatures have been confirmed directly against absolute coordinates in data.
-        interp_temps = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), temp_data)
-
-        return interp_temps
-
-    # Method to return interpolated function object from data
-    # Function to interpolate the temperature gradient grid from the hydro file
-    # Returns interpolating callable function
     def interpolate_temp_grad_x_grid(self):
-        print('Interpolating temp x-gradient grid data for event: ' + str(self.name))
-
-        # Cut temp data out and convert to numpy array
-        temp_grad_x_data = self.temp_grad_x_array()
+        return self.interpolate_grid('temp_grad_x')
 
-        # Interpolate data!
-        # The final temperatures have been confirmed directly against absolute coordinates in data.
-        interp_temp_grad_x = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), temp_grad_x_data)
-
-        return interp_temp_grad_x
-
-    # Method to return interpolated function object from data
-    # Function to interpolate the temperature gradient grid from the hydro file
-    # Returns interpolating callable function
     def interpolate_temp_grad_y_grid(self):
-        print('Interpolating temp y-gradient grid data for event: ' + str(self.name))
+        return self.interpolate_grid('temp_grad_y')
 
-        # Cut temp data out and convert to numpy array
-        temp_grad_y_data = self.temp_grad_y_array()
-
-        # Interpolate data!
-        # The final temperatures have been confirmed directly against absolute coordinates in data.
-        interp_temp_grad_y = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), temp_grad_y_data)
-
-        return interp_temp_grad_y
-
-    # Method to interpolate the x velocities from a grid file
-    # Returns interpolating callable function
     def interpolate_x_vel_grid(self):
-        print('Interpolating x-flow grid data for event: ' + str(self.name))
-
-        # Cut x velocity data out and convert to numpy array
-        x_vel_array = self.x_vel_array()
+        return self.interpolate_grid('x_vel')
 
-        # Interpolate data!
-        # The final velocities have been confirmed directly against absolute coordinates in data.
-        interp_x_vel = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), x_vel_array)
-
-        return interp_x_vel
-
-    # Method to interpolate the y velocities from a grid file
-    # Returns interpolating callable function
     def interpolate_y_vel_grid(self):
-        print('Interpolating y-flow grid data for event: ' + str(self.name))
-
-        # Cut y velocity data out and convert to numpy array
-        y_vel_array = self.y_vel_array()
-
-        # Interpolate data!
-        # The final velocities have been confirmed directly against absolute coordinates in data.
-        interp_y_vel = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), y_vel_array)
+        return self.interpolate_grid('y_vel')
 
-        return interp_y_vel
-
-    # Method to return interpolated function object from data
-    # Function to interpolate the x direction flow gradient grid from the hydro file
-    # Returns interpolating callable function
     def interpolate_grad_x_u_x_grid(self):
-        print('Interpolating x-flow x-gradient grid data for event: ' + str(self.name))
-
-        # Cut flow grad x data out and convert to numpy array
-        grad_x_u_x_data = self.grad_x_u_x_array()
-
-        # Interpolate data!
-        interp_grad_x_u_x = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), grad_x_u_x_data)
+        return self.interpolate_grid('grad_x_u_x')
 
-        return interp_grad_x_u_x
-
-    # Method to return interpolated function object from data
-    # Function to interpolate the x direction flow gradient grid from the hydro file
-    # Returns interpolating callable function
     def interpolate_grad_x_u_y_grid(self):
-        print('Interpolating y-flow x-gradient grid data for event: ' + str(self.name))
-
-        # Cut flow grad x data out and convert to numpy array
-        grad_x_u_y_data = self.grad_x_u_y_array()
+        return self.interpolate_grid('grad_x_u_y')
 
-        # Interpolate data!
-        interp_grad_x_u_y = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), grad_x_u_y_data)
-
-        return interp_grad_x_u_y
-
-    # Method to return interpolated function object from data
-    # Function to interpolate the x direction flow gradient grid from the hydro file
-    # Returns interpolating callable function
     def interpolate_grad_y_u_x_grid(self):
-        print('Interpolating x-flow y-gradient grid data for event: ' + str(self.name))
-
-        # Cut flow grad x data out and convert to numpy array
-        grad_y_u_x_data = self.grad_y_u_x_array()
+        return self.interpolate_grid('grad_y_u_x')
 
-        # Interpolate data!
-        interp_grad_y_u_x = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), grad_y_u_x_data)
-
-        return interp_grad_y_u_x
-
-    # Method to return interpolated function object from data
-    # Function to interpolate the x direction flow gradient grid from the hydro file
-    # Returns interpolating callable function
     def interpolate_grad_y_u_y_grid(self):
-        print('Interpolating y-flow y-gradient grid data for event: ' + str(self.name))
-
-        # Cut flow grad x data out and convert to numpy array
-        grad_y_u_y_data = self.grad_y_u_y_array()
-
-        # Interpolate data!
-        interp_grad_y_u_y = RegularGridInterpolator((self.tspace, self.xspace, self.xspace), grad_y_u_y_data)
-
-        return interp_grad_y_u_y
+        return self.interpolate_grid('grad_y_u_y')
 
     # Method to find the maximum temperature of a hydro file object
     def max_temp(self, time='i'):
@@ -354,31 +392,231 @@ class osu_hydro_file:
         return minTemp
 
 
+# Linear interpolator for several fields (channels) tabulated on the same uniform (t, x, y) grid.
+# values is a [NT, NX, NY, C] array, and channels names each of the C fields.
+# As the grids are uniformly spaced, the cell of each point is found directly from its coordinates,
+# and every channel is interpolated from the same cell corners in one call.
+# Like scipy's RegularGridInterpolator, raises a ValueError for points outside of the grid.
+# values may cover only part of the grid, starting at the grid indexes offset -- the rest of the grid is
+# answered with a constant fill_value.
+class grid_interpolator:
+    def __init__(self, points, values, channels, offset=None, fill_value=0):
+        self.grid = tuple(np.asarray(axis, dtype=np.float64) for axis in points)
+        self.values = np.ascontiguousarray(values)
+        self.channels = list(channels)
+        self.fill_value = fill_value
+
+        # Index of the first tabulated grid point in each dimension, for values cropped out of the full grid
+        self.offset = np.zeros(3, dtype=np.int64) if offset is None else np.asarray(offset, dtype=np.int64)
+        self.cropped = self.values.shape[:3] != tuple(len(axis) for axis in self.grid)
+        if (np.any(self.offset < 0) or np.any(self.offset + self.values.shape[:3] > [len(axis) for axis in self.grid])
+                or self.values.shape[3] != len(self.channels)):
+            raise ValueError('Grid interpolator values do not match the grid and channels')
+
+        self.lower = np.array([axis[0] for axis in self.grid])
+        self.upper = np.array([axis[-1] for axis in self.grid])
+        self.step = np.array([(axis[-1] - axis[0]) / (len(axis) - 1) for axis in self.grid])
+        for axis, step in zip(self.grid, self.step):
+            if not np.allclose(np.diff(axis), step, rtol=1e-6, atol=0):
+                raise ValueError('Grid interpolator requires uniformly spaced grids')
+        self.max_index = np.array(self.values.shape[:3]) - 2
+
+        # Bounds of the tabulated region
+        self.table_lower = np.array([axis[i] for axis, i in zip(self.grid, self.offset)])
+        self.table_upper = np.array([axis[i + n - 1] for axis, i, n in zip(self.grid, self.offset,
+                                                                           self.values.shape[:3])])
+
+        # Values as a [grid point, channel] table, and the offsets of the corners of a cell within it
+        self.table = self.values.reshape(-1, len(self.channels))
+        self.strides = np.array([self.values.shape[1] * self.values.shape[2], self.values.shape[2], 1])
+
+    # Method to interpolate the given channels (names or indexes, by default all of them) at the points xi
+    # Points within the grid but outside of the tabulated region take the fill value.
+    # Returns an array of shape xi.shape[:-1] + (number of channels,)
+    def __call__(self, xi, channels=None):
+        xi = np.asarray(xi, dtype=np.float64)
+        if xi.ndim == 1:
+            xi = xi[np.newaxis, :]
+        shape = xi.shape[:-1]
+        xi = xi.reshape(-1, 3)
+
+        # Check bounds
+        for i in range(3):
+            if not (np.all(self.lower[i] <= xi[:, i]) and np.all(xi[:, i] <= self.upper[i])):
+                raise ValueError('One of the requested xi is out of bounds in dimension {}'.format(i))
+
+        # Select channels
+        if channels is None:
+            table = self.table
+        else:
+            columns = [self.channels.index(channel) if isinstance(channel, str) else channel for channel in channels]
+            table = self.table[:, columns] if len(columns) > 1 else self.table[:, columns[0]:columns[0] + 1]
+
+        if not self.cropped:
+            result = self.interpolate(xi, table)
+        else:
+            inside = np.all((self.table_lower <= xi) & (xi <= self.table_upper), axis=1)
+            if np.all(inside):
+                result = self.interpolate(xi, table)
+            else:
+                result = np.full((len(xi), table.shape[1]), self.fill_value, dtype=np.result_type(table, np.float64))
+                result[inside] = self.interpolate(xi[inside], table)
+
+        return result.reshape(shape + (result.shape[-1],))
+
+    # Method to interpolate the columns of table at points xi within the tabulated region
+    def interpolate(self, xi, table):
+        # Find the cell of each point and the distances into it
+        position = (xi - self.table_lower) / self.step
+        index = np.minimum(np.floor(position).astype(np.int64), self.max_index)
+        distance = position - index
+        base = index @ self.strides
+
+        # Interpolate along y, then x, then t
+        d_t, d_x, d_y = distance[:, 0:1], distance[:, 1:2], distance[:, 2:3]
+        corners = [table[base + offset] for offset in [0, 1, self.strides[1], self.strides[1] + 1]]
+        lower_t = ((corners[0] * (1 - d_y) + corners[1] * d_y) * (1 - d_x)
+                   + (corners[2] * (1 - d_y) + corners[3] * d_y) * d_x)
+        corners = [table[base + self.strides[0] + offset] for offset in [0, 1, self.strides[1], self.strides[1] + 1]]
+        upper_t = ((corners[0] * (1 - d_y) + corners[1] * d_y) * (1 - d_x)
+                   + (corners[2] * (1 - d_y) + corners[3] * d_y) * d_x)
+        return lower_t * (1 - d_t) + upper_t * d_t
+
+
+# A single field of a grid_interpolator, callable like a RegularGridInterpolator
+class grid_channel:
+    def __init__(self, interpolator, channel):
+        self.interpolator = interpolator
+        self.channel = channel
+        self.grid = interpolator.grid
+
+    @property
+    def values(self):
+        return self.interpolator.values[..., self.interpolator.channels.index(self.channel)]
+
+    def __call__(self, xi):
+        return self.interpolator(xi, channels=[self.channel])[..., 0]
+
+
+# Function to reduce an array over blocks of cells along one axis with a numpy ufunc (e.g. np.maximum)
+# Block i covers the grid points i * block to (i + 1) * block, including the points shared with its neighbours.
+def block_reduce(values, block, axis, ufunc):
+    size = values.shape[axis]
+    starts = np.arange(0, max(size - 1, 1), block)
+    reduced = ufunc.reduceat(values, starts, axis=axis)
+    if len(starts) > 1:
+        shared = np.take(values, starts[1:], axis=axis)
+        last = [slice(None)] * values.ndim
+        last[axis] = slice(0, -1)
+        reduced[tuple(last)] = ufunc(reduced[tuple(last)], shared)
+    return reduced
+
+
+# Coarse map of the range of a field over blocks of cells in each time slice.
+# Blocks are at least as long as a step (reach) in each dimension, and each block holds the lowest and highest
+# tabulated values of itself and its neighbours, so the interpolated field anywhere along a step is bounded by
+# the values of the block the step starts in. Points beyond the tabulated region (cropped or out of bounds)
+# are bounded by the interpolator's fill value and zero -- the value of a step that leaves the event.
+class field_block_map:
+    def __init__(self, interpolator, reach, channel='temp'):
+        self.lower = interpolator.table_lower
+        self.step = interpolator.step
+        values = interpolator.values[..., interpolator.channels.index(channel)]
+        self.block = np.array([max(int(np.ceil(reach_i / step_i)), 1)
+                               for reach_i, step_i in zip(reach, self.step)])
+
+        # Range of the tabulated values in each block
+        block_min = values
+        block_max = values
+        for axis in range(3):
+            block_min = block_reduce(block_min, self.block[axis], axis, np.minimum)
+            block_max = block_reduce(block_max, self.block[axis], axis, np.maximum)
+
+        # Surround the blocks with two layers of blocks beyond the table, then widen each block to its neighbours
+        self.fill = (min(interpolator.fill_value, 0), max(interpolator.fill_value, 0))
+        block_min = np.pad(block_min.astype(np.float64), 2, constant_values=self.fill[0])
+        block_max = np.pad(block_max.astype(np.float64), 2, constant_values=self.fill[1])
+        for axis in range(3):
+            block_min = np.minimum(np.minimum(np.roll(block_min, 1, axis), block_min), np.roll(block_min, -1, axis))
+            block_max = np.maximum(np.maximum(np.roll(block_max, 1, axis), block_max), np.roll(block_max, -1, axis))
+        self.block_min = np.ascontiguousarray(block_min[1:-1, 1:-1, 1:-1])
+        self.block_max = np.ascontiguousarray(block_max[1:-1, 1:-1, 1:-1])
+        self.max_block = np.array(self.block_min.shape) - 1
+
+        # Longest step the map is valid for, and the map as plain numbers for single steps
+        self.reach = float(np.amin(self.block * self.step))
+        self.axes = [(float(lower), float(step), int(block), int(max_block)) for lower, step, block, max_block
+                     in zip(self.lower, self.step, self.block, self.max_block)]
+
+    # Method to return the bounds (lower, upper) on the field along a step starting at the (t, x, y) point
+    # The same as bounds, for a single step without the overhead of arrays.
+    def point_bounds(self, point):
+        index = []
+        for coordinate, (lower, step, block, max_block) in zip(point, self.axes):
+            i = math.floor(math.floor((coordinate - lower) / step) / block) + 1
+            if i < 0 or i > max_block:
+                return self.fill
+            index.append(i)
+        index = tuple(index)
+        return float(self.block_min[index]), float(self.block_max[index])
+
+    # Method to return the bounds (lower, upper) on the field along steps starting at the (t, x, y) points
+    # Steps must be no longer than the reach of the map in any dimension.
+    def bounds(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        index = np.floor(np.floor((points - self.lower) / self.step) / self.block).astype(np.int64) + 1
+
+        # Steps starting more than a block beyond the table can't reach it
+        beyond = np.any((index < 0) | (index > self.max_block), axis=-1)
+        index = np.clip(index, 0, self.max_block)
+        index = (index[..., 0], index[..., 1], index[..., 2])
+        return (np.where(beyond, self.fill[0], self.block_min[index]),
+                np.where(beyond, self.fill[1], self.block_max[index]))
+
+
 # Plasma object as used for integration and muckery
 class plasma_event:
     def __init__(self, temp_func=None, x_vel_func=None, y_vel_func=None, grad_x_func=None, grad_y_func=None,
                  grad_x_u_x_func=None, grad_x_u_y_func=None, grad_y_u_x_func=None, grad_y_u_y_func=None,
-                 event=None, name=None, rmax=None):
+                 event=None, name=None, rmax=None, field_source=None, fields=BASE_FIELDS, slice_source=None):
+        # Interpolators for several fields at once, if available
+        # field_source is a function returning a grid_interpolator for a list of fields, e.g. from a hydro file.
+        # Only the given fields are built up front -- any other medium field (e.g. a gradient) is built on first use.
+        self.field_interps = []
+        self.field_source = None
+        self.temp_map = None
+
+        # Raw grid data, if available, for statistics of the medium
+        # slice_source is a function returning the raw [x, y] arrays of a list of fields at a time index of the grid.
+        # Slices and statistics are kept once found.
+        self.slice_source = slice_source
+        self.slice_data = {}
+        self.stats_data = {}
+
         # Initialize all the ordinary plasma parameters
         if event is not None:
-            self.temp = event.interpolate_temp_grid()
-            self.x_vel = event.interpolate_x_vel_grid()
-            self.y_vel = event.interpolate_y_vel_grid()
-            self.temp_grad_x = event.interpolate_temp_grad_x_grid()
-            self.temp_grad_y = event.interpolate_temp_grad_y_grid()
-            self.grad_x_u_x = event.interpolate_grad_x_u_x_grid()
-            self.grad_x_u_y = event.interpolate_grad_x_u_y_grid()
-            self.grad_y_u_x = event.interpolate_grad_y_u_x_grid()
-            self.grad_y_u_y = event.interpolate_grad_y_u_y_grid()
-            self.name = event.name
-            self.timestep = event.timestep
-            self.t0 = np.amin(self.temp.grid[0])
-            self.tf = np.amax(self.temp.grid[0])
-            self.xmin = np.amin(self.temp.grid[1])
-            self.xmax = np.amax(self.temp.grid[1])
-            self.ymin = np.amin(self.temp.grid[2])
-            self.ymax = np.amax(self.temp.grid[2])
-            self.gridstep = event.gridstep
+            # The hydro file builds the fields in one pass
+            field_source = event.interpolate_fields
+            self.slice_source = event.slice_fields
+            name = event.name
+
+        if field_source is not None:
+            self.field_source = field_source
+            self.build_fields(fields)
+            grid = self.field_interps[0].grid
+            self.name = name
+            self.t0 = np.amin(grid[0])
+            self.tf = np.amax(grid[0])
+            self.xmin = np.amin(grid[1])
+            self.xmax = np.amax(grid[1])
+            self.ymin = np.amin(grid[2])
+            self.ymax = np.amax(grid[2])
+            if event is not None:
+                self.timestep = event.timestep
+                self.gridstep = event.gridstep
+            else:
+                self.timestep = grid[0][-1] - grid[0][-2]
+                self.gridstep = grid[1][-1] - grid[1][-2]
         elif temp_func is not None and x_vel_func is not None and y_vel_func is not None:
             self.temp = temp_func
             self.x_vel = x_vel_func
@@ -417,6 +655,41 @@ class plasma_event:
 
 
 
+    # Method to build interpolators for the given medium fields from the field source
+    # Each field is available as an attribute, a channel of the shared interpolator.
+    # The field source may return the fields over several interpolators.
+    def build_fields(self, fields):
+        fields = [field for field in fields if field not in self.__dict__]
+        while len(fields) > 0:
+            field_interp = self.field_source(fields)
+            if fields[0] not in field_interp.channels:
+                raise ValueError('Field source did not provide {}'.format(fields[0]))
+            self.field_interps.append(field_interp)
+            for field in field_interp.channels:
+                setattr(self, field, grid_channel(field_interp, field))
+            fields = [field for field in fields if field not in self.__dict__]
+
+    # Build medium fields from the field source on first access
+    # All missing gradient fields are built together, as they are used together.
+    def __getattr__(self, name):
+        if name in MEDIUM_FIELDS and self.__dict__.get('field_source') is not None:
+            logging.info('Building {} for event {}'.format(name, self.__dict__.get('name')))
+            self.build_fields([name] + [field for field in GRADIENT_FIELDS if field != name])
+            return self.__dict__[name]
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    # Method to return bounds (lower, upper) on the temperature along steps of length up to dtau from the points
+    # A single (t, x, y) point gives float bounds, an array of points arrays of bounds.
+    # The coarse temperature map is built on first use. Returns None if the temperature is not tabulated on a grid.
+    def step_temp_bounds(self, points, dtau=config.jet.DTAU):
+        if self.temp_map is None or self.temp_map.reach < dtau:
+            if not isinstance(self.temp, grid_channel):
+                return None
+            self.temp_map = field_block_map(self.temp.interpolator, reach=(dtau, dtau, dtau))
+        if isinstance(points, tuple):
+            return self.temp_map.point_bounds(points)
+        return self.temp_map.bounds(points)
+
     # Method to get array on space domain of event with given resolution
     def xspace(self, resolution=100, fraction=1):
         return np.arange(start=fraction*self.xmin, stop=fraction*self.xmax,
@@ -443,24 +716,44 @@ class plasma_event:
         else:
             return arctan2
 
+    # Method to return the values of several fields at the given points
+    # With multi-channel interpolators, the fields of each interpolator are found in a single lookup
+    # (and all of them are returned), otherwise each named field is interpolated on its own.
+    # Returns a dictionary of field values keyed by field name.
+    def sample_fields(self, points, fields=MEDIUM_FIELDS):
+        if self.field_source is not None:
+            # Build any missing fields
+            for field in fields:
+                getattr(self, field)
+
+            sampled = {}
+            for field_interp in self.field_interps:
+                if any(field in field_interp.channels for field in fields):
+                    values = field_interp(points)
+                    sampled.update({field: values[..., i] for i, field in enumerate(field_interp.channels)})
+            return sampled
+        else:
+            return {field: getattr(self, field)(points) for field in fields}
+
     # Method to return velocity perpendicular to given trajectory angle at given time
     def u_perp(self, point, phi):
-        return -self.x_vel(point) * np.sin(phi) \
-               + self.y_vel(np.array(point)) * np.cos(phi)
+        values = self.sample_fields(point, fields=['x_vel', 'y_vel'])
+        return -values['x_vel'] * np.sin(phi) \
+               + values['y_vel'] * np.cos(phi)
 
     # Method to return velocity parallel to given trajectory angle at given time
     def u_par(self, point, phi):
-        return self.x_vel(point) * np.cos(phi) \
-               + self.y_vel(np.array(point)) * np.sin(phi)
+        values = self.sample_fields(point, fields=['x_vel', 'y_vel'])
+        return values['x_vel'] * np.cos(phi) \
+               + values['y_vel'] * np.sin(phi)
 
     # Method to return gradient of the Temperature
     # at a particular point perpendicular to a given angle phi.
     # Chosen to be ideal gluon gas dens. as per Sievert, Yoon, et. al.
     def grad_perp_T(self, point, phi):
         # Compute x and y temperature gradient at given point, make grad vector
-        grad_x = self.temp_grad_x(point)
-        grad_y = self.temp_grad_y(point)
-        grad_T = np.array([grad_x, grad_y])
+        values = self.sample_fields(point, fields=['temp_grad_x', 'temp_grad_y'])
+        grad_T = np.array([values['temp_grad_x'], values['temp_grad_y']])
 
         # Compute unit vector perpendicular to given phi
         e_perp = np.array([-np.sin(phi), np.cos(phi)])
@@ -473,18 +766,20 @@ class plasma_event:
     # Method to return perp grad u perp, relative to given angle
     def grad_perp_u_perp(self, point, phi):
         # This is (eperp . grad) * (eperp . u)
-        return (self.grad_x_u_x(point) * (np.sin(phi)**2)
-                - self.grad_y_u_x(point) * np.sin(phi)*np.cos(phi)
-                - self.grad_x_u_y(point) * np.sin(phi)*np.cos(phi)
-                + self.grad_y_u_y(point) * (np.cos(phi)**2))
+        values = self.sample_fields(point, fields=['grad_x_u_x', 'grad_y_u_x', 'grad_x_u_y', 'grad_y_u_y'])
+        return (values['grad_x_u_x'] * (np.sin(phi)**2)
+                - values['grad_y_u_x'] * np.sin(phi)*np.cos(phi)
+                - values['grad_x_u_y'] * np.sin(phi)*np.cos(phi)
+                + values['grad_y_u_y'] * (np.cos(phi)**2))
 
     # Method to return perp grad u par, relative to given angle
     def grad_perp_u_par(self, point, phi):
         # This is (eperp . grad) * (epar . u)
-        return (- self.grad_x_u_x(point) * np.sin(phi) * np.cos(phi)
-                + self.grad_y_u_x(point) * (np.cos(phi)**2)
-                - self.grad_x_u_y(point) * (np.sin(phi)**2)
-                + self.grad_y_u_y(point) * np.sin(phi) * np.cos(phi))
+        values = self.sample_fields(point, fields=['grad_x_u_x', 'grad_y_u_x', 'grad_x_u_y', 'grad_y_u_y'])
+        return (- values['grad_x_u_x'] * np.sin(phi) * np.cos(phi)
+                + values['grad_y_u_x'] * (np.cos(phi)**2)
+                - values['grad_x_u_y'] * (np.sin(phi)**2)
+                + values['grad_y_u_y'] * np.sin(phi) * np.cos(phi))
 
     # Method to return gradient of the flow
     # at a particular point parallel to a given angle phi.
@@ -501,159 +796,113 @@ class plasma_event:
 
         return grad_perp_flow
 
-    # Method to find the maximum temperature of a plasma object
-    def max_temp(self, resolution=100, time='i'):
+    # Method to find the time slices of the grid around a time ('i' or 'f' for the initial or final time)
+    # Returns a list of (time index, weight) pairs, or None if the event has no raw grid data
+    def time_slices(self, time='i'):
         if time == 'i':
             time = self.t0
         elif time == 'f':
             time = self.tf
-        else:
-            pass
-
-        # Adapted from grid_reader.qgp_plot()
-        #
-        # Domains of physical positions to plot at (in fm)
-        # These limits of the linear space obtain the largest and smallest input value for
-        # the interpolating function's position inputs.
-        x_sample_space = self.xspace(resolution=resolution)
-
-        # Create arrays of each coordinate
-        # E.g. Here x_coords is a 2D array showing the x coordinates of each cell
-        # We necessarily must set time equal to a constant to plot in 2D.
-        x_coords, y_coords = np.meshgrid(x_sample_space, x_sample_space, indexing='ij')
-        # t_coords set to be an array matching the length of x_coords full of constant time
-        # Note that we select "initial time" as 0.5 fs by default
-        t_coords = np.full_like(x_coords, time)
-
-        # Put coordinates together into ordered pairs.
-        points = np.transpose(np.array([t_coords, x_coords, y_coords]), (2, 1, 0))
-
-        # Calculate temperatures and take maximum.
-        maxTemp = np.amax(self.temp(points))
-
-        return maxTemp
+        if self.slice_source is None:
+            return None
+
+        # The medium is linear in time between slices
+        t_space = self.field_interps[0].grid[0]
+        position = np.clip((time - t_space[0]) / (t_space[1] - t_space[0]), 0, len(t_space) - 1)
+        index = min(int(np.floor(position)), len(t_space) - 2)
+        weight = position - index
+        if weight < 1e-9:
+            return [(index, 1.0)]
+        elif weight > 1 - 1e-9:
+            return [(index + 1, 1.0)]
+        return [(index, 1 - weight), (index + 1, weight)]
+
+    # Method to return the values of the given fields at a time over the whole event
+    # With raw grid data, these are the values at the grid points, interpolated in time between slices if needed.
+    # Otherwise, the fields are sampled on a resolution x resolution grid.
+    # Returns a dictionary of [x, y] arrays, keyed by field.
+    def slice_values(self, time='i', fields=BASE_FIELDS, resolution=100):
+        slices = self.time_slices(time)
+        if slices is None:
+            if time == 'i':
+                time = self.t0
+            elif time == 'f':
+                time = self.tf
+            x_coords, y_coords = np.meshgrid(self.xspace(resolution=resolution), self.xspace(resolution=resolution),
+                                             indexing='ij')
+            points = np.stack([np.full_like(x_coords, time), x_coords, y_coords], axis=-1)
+            return {field: getattr(self, field)(points) for field in fields}
+
+        values = {}
+        for field in fields:
+            for index, weight in slices:
+                if (index, field) not in self.slice_data:
+                    self.slice_data.update({(index, name): value
+                                            for name, value in self.slice_source(index, fields=[field]).items()})
+                value = weight * self.slice_data[(index, field)]
+                values[field] = value if field not in values else values[field] + value
+        return values
+
+    # Method to return the key of a cached statistic of slice_values
+    # The resolution is part of the key only without raw grid data, as raw grid values don't depend on it.
+    def stats_key(self, *key, resolution=100):
+        if self.slice_source is None:
+            return key + (resolution,)
+        return key
 
     # Method to find the maximum temperature of a plasma object
-    def min_temp(self, resolution=100, time='i'):
-        if time == 'i':
-            time = self.t0
-        elif time == 'f':
-            time = self.tf
-        else:
-            pass
-
-        # Adapted from grid_reader.qgp_plot()
-        #
-        # Domains of physical positions to plot at (in fm)
-        # These limits of the linear space obtain the largest and smallest input value for
-        # the interpolating function's position inputs.
-        x_sample_space = np.linspace(self.xmin, self.xmax, resolution)
-
-        # Create arrays of each coordinate
-        # E.g. Here x_coords is a 2D array showing the x coordinates of each cell
-        # We necessarily must set time equal to a constant to plot in 2D.
-        x_coords, y_coords = np.meshgrid(x_sample_space, x_sample_space, indexing='ij')
-        # t_coords set to be an array matching the length of x_coords full of constant time
-        # Note that we select "initial time" as 0.5 fs by default
-        t_coords = np.full_like(x_coords, time)
-
-        # Put coordinates together into ordered pairs.
-        points = np.transpose(np.array([t_coords, x_coords, y_coords]), (1, 2, 0))
-
-        # Calculate temperatures and take maximum.
-        minTemp = np.amin(self.temp(points))
+    def max_temp(self, resolution=100, time='i'):
+        key = self.stats_key('max_temp', time, resolution=resolution)
+        if key not in self.stats_data:
+            self.stats_data[key] = np.amax(self.slice_values(time, ['temp'], resolution=resolution)['temp'])
+        return self.stats_data[key]
 
-        return minTemp
+    # Method to find the minimum temperature of a plasma object
+    def min_temp(self, resolution=100, time='i'):
+        key = self.stats_key('min_temp', time, resolution=resolution)
+        if key not in self.stats_data:
+            self.stats_data[key] = np.amin(self.slice_values(time, ['temp'], resolution=resolution)['temp'])
+        return self.stats_data[key]
 
-    # Method to find the maximum temperature of a plasma object
+    # Method to find the maximum, minimum, mean, median, and standard deviation of the fluid temperature
+    # Only fluid cells above 0.01 GeV count.
     def temp_stats(self, resolution=100, time='i'):
-        if time == 'i':
-            time = self.t0
-        elif time == 'f':
-            time = self.tf
-        else:
-            pass
-
-        # Adapted from grid_reader.qgp_plot()
-        #
-        # Domains of physical positions to plot at (in fm)
-        # These limits of the linear space obtain the largest and smallest input value for
-        # the interpolating function's position inputs.
-        x_sample_space = self.xspace(resolution=resolution)
-
-        # Create arrays of each coordinate
-        # E.g. Here x_coords is a 2D array showing the x coordinates of each cell
-        # We necessarily must set time equal to a constant to plot in 2D.
-        x_coords, y_coords = np.meshgrid(x_sample_space, x_sample_space, indexing='ij')
-        # t_coords set to be an array matching the length of x_coords full of constant time
-        # Note that we select "initial time" as 0.5 fs by default
-        t_coords = np.full_like(x_coords, time)
-
-        # Put coordinates together into ordered pairs.
-        points = np.transpose(np.array([t_coords, x_coords, y_coords]), (2, 1, 0))
-
-        # Calculate temperatures and take maximum.
-        temp_threshold = 0.01  # threshold in GeV
-        fluid_cell_temps = self.temp(points)  # Get array of temps
-        fluid_cell_temps[(fluid_cell_temps < temp_threshold)] = np.nan  # Put all values < temp_threshold to np.nan
-        maxTemp = np.nanmax(fluid_cell_temps)
-        minTemp = np.nanmin(fluid_cell_temps)
-        meanTemp = np.nanmean(fluid_cell_temps)
-        medianTemp = np.nanmedian(fluid_cell_temps)
-        stdTemp = np.nanstd(fluid_cell_temps)
-
-        return maxTemp, minTemp, meanTemp, medianTemp, stdTemp
-
-    # Method to find the maximum temperature of a plasma object
+        key = self.stats_key('temp_stats', time, resolution=resolution)
+        if key not in self.stats_data:
+            temp_threshold = 0.01  # threshold in GeV
+            fluid_cell_temps = self.slice_values(time, ['temp'], resolution=resolution)['temp']
+            fluid_cell_temps = fluid_cell_temps[fluid_cell_temps >= temp_threshold]
+            if len(fluid_cell_temps) == 0:
+                self.stats_data[key] = (np.nan, np.nan, np.nan, np.nan, np.nan)
+            else:
+                self.stats_data[key] = (np.amax(fluid_cell_temps), np.amin(fluid_cell_temps),
+                                        np.mean(fluid_cell_temps), np.median(fluid_cell_temps),
+                                        np.std(fluid_cell_temps))
+        return self.stats_data[key]
+
+    # Method to find the maximum or minimum magnitude of the flow velocity ('vel') or temperature gradient ('grad')
     def ext_vec_mag(self, vec='vel', ext='max', resolution=100, time='i'):
-        if time == 'i':
-            time = self.t0
-        elif time == 'f':
-            time = self.tf
-        else:
-            pass
-
-        # Adapted from grid_reader.qgp_plot()
-        #
-        # Domains of physical positions to plot at (in fm)
-        # These limits of the linear space obtain the largest and smallest input value for
-        # the interpolating function's position inputs.
-        x_sample_space = self.xspace(resolution=resolution)
-
-        # Create arrays of each coordinate
-        # E.g. Here x_coords is a 2D array showing the x coordinates of each cell
-        # We necessarily must set time equal to a constant to plot in 2D.
-        x_coords, y_coords = np.meshgrid(x_sample_space, x_sample_space, indexing='ij')
-        # t_coords set to be an array matching the length of x_coords full of constant time
-        # Note that we select "initial time" as 0.5 fs by default
-        t_coords = np.full_like(x_coords, time)
-
-        # Put coordinates together into ordered pairs.
-        points = np.transpose(np.array([t_coords, x_coords, y_coords]), (2, 1, 0))
-
-        # Compute vectors at sample points
-        if vec == 'vel':
-            x_vec_mags = self.x_vel(points)
-            y_vec_mags = self.y_vel(points)
-        elif vec == 'grad':
-            x_vec_mags = self.temp_grad_x(points)
-            y_vec_mags = self.temp_grad_y(points)
-        else:
-            x_vec_mags = 0
-            y_vec_mags = 0
-
-        # Calculate magnitude
-        vec_mags = np.sqrt(x_vec_mags ** 2 + y_vec_mags ** 2)
-
-        # Determine extrema type and take extrema
-        if ext == 'max':
-            ext_vec_mag = np.amax(vec_mags)
-        elif ext == 'min':
-            ext_vec_mag = np.amin(vec_mags)
-        else:
-            ext_vec_mag = 0
-
-        return ext_vec_mag
+        key = self.stats_key('ext_vec_mag', vec, ext, time, resolution=resolution)
+        if key not in self.stats_data:
+            # Compute vectors at sample points
+            if vec == 'vel':
+                values = self.slice_values(time, ['x_vel', 'y_vel'], resolution=resolution)
+                vec_mags = np.sqrt(values['x_vel'] ** 2 + values['y_vel'] ** 2)
+            elif vec == 'grad':
+                values = self.slice_values(time, ['temp_grad_x', 'temp_grad_y'], resolution=resolution)
+                vec_mags = np.sqrt(values['temp_grad_x'] ** 2 + values['temp_grad_y'] ** 2)
+            else:
+                vec_mags = 0
+
+            # Determine extrema type and take extrema
+            if ext == 'max':
+                self.stats_data[key] = np.amax(vec_mags)
+            elif ext == 'min':
+                self.stats_data[key] = np.amin(vec_mags)
+            else:
+                self.stats_data[key] = 0
+
+        return self.stats_data[key]
 
     # Method to plot interpolated temperature function and / or velocity field
     # Can plot contour or density / colormesh for temps, stream or quiver for velocities
@@ -806,45 +1055,30 @@ class plasma_event:
 
 # Takes callable functions that take parameters (t, x, y) for the temperature and velocities
 # and returns plasma_event objects generated from them.
-def tabulated_plasma(t_space, x_space, temp_values, x_vel_values, y_vel_values, name=None, return_grids=False):
+# Only the given fields are interpolated up front, others (e.g. gradients) are built on first use.
+# dtype sets the precision the fields are stored in.
+def tabulated_plasma(t_space, x_space, temp_values, x_vel_values, y_vel_values, name=None, return_grids=False,
+                     fields=BASE_FIELDS, dtype=config.mode.MEDIUM_DTYPE):
     print('WARNING: Gradients of temp and flow not verified')
     grid_step = float(x_space[-1] - x_space[-2])
     rmax = x_space[-1]
 
-    # Compute gradients
-    temp_grad_x_values = np.gradient(temp_values, grid_step, axis=1)
-    temp_grad_y_values = np.gradient(temp_values, grid_step, axis=2)
-    grad_x_u_x = np.gradient(x_vel_values, grid_step, axis=1)
-    grad_y_u_x = np.gradient(x_vel_values, grid_step, axis=2)
-    grad_x_u_y = np.gradient(y_vel_values, grid_step, axis=1)
-    grad_y_u_y = np.gradient(y_vel_values, grid_step, axis=2)
-
-    # Interpolate functions
-    interped_temp_function = RegularGridInterpolator((t_space, x_space, x_space), temp_values)
-
-    interped_x_vel_function = RegularGridInterpolator((t_space, x_space, x_space), x_vel_values)
-    interped_y_vel_function = RegularGridInterpolator((t_space, x_space, x_space), y_vel_values)
-
-    interped_grad_x_function = RegularGridInterpolator((t_space, x_space, x_space), temp_grad_x_values)
-    interped_grad_y_function = RegularGridInterpolator((t_space, x_space, x_space), temp_grad_y_values)
-
-    interped_grad_x_u_x = RegularGridInterpolator((t_space, x_space, x_space), grad_x_u_x)
-    interped_grad_y_u_x = RegularGridInterpolator((t_space, x_space, x_space), grad_y_u_x)
+    # Interpolate the fields together, as they are needed
+    def field_source(fields):
+        return grid_interpolator((t_space, x_space, x_space),
+                                 stack_medium_fields(temp_values, x_vel_values, y_vel_values, grid_step, fields=fields,
+                                                     dtype=dtype),
+                                 fields)
 
-    interped_grad_x_u_y = RegularGridInterpolator((t_space, x_space, x_space), grad_x_u_y)
-    interped_grad_y_u_y = RegularGridInterpolator((t_space, x_space, x_space), grad_y_u_y)
+    # Take statistics from the tabulated values
+    def slice_source(index, fields=BASE_FIELDS):
+        stacked = stack_medium_fields(temp_values[index:index + 1], x_vel_values[index:index + 1],
+                                      y_vel_values[index:index + 1], grid_step, fields=fields)
+        return {field: stacked[0, :, :, i] for i, field in enumerate(fields)}
 
     # Create and return plasma object
-    plasma_object = plasma_event(temp_func=interped_temp_function,
-                                 x_vel_func=interped_x_vel_function,
-                                 y_vel_func=interped_y_vel_function,
-                                 grad_x_func=interped_grad_x_function,
-                                 grad_y_func=interped_grad_y_function,
-                                 grad_x_u_x_func=interped_grad_x_u_x,
-                                 grad_y_u_x_func=interped_grad_y_u_x,
-                                 grad_x_u_y_func=interped_grad_x_u_y,
-                                 grad_y_u_y_func=interped_grad_y_u_y,
-                                 name=name, rmax=rmax)
+    plasma_object = plasma_event(field_source=field_source, name=name, rmax=rmax, fields=fields,
+                                 slice_source=slice_source)
 
     # Return the grids of evaluated points, if requested.
     if return_grids:
@@ -855,7 +1089,8 @@ def tabulated_plasma(t_space, x_space, temp_values, x_vel_values, y_vel_values,
 # Takes callable functions that take parameters (t, x, y) for the temperature and velocities
 # and returns plasma_event objects generated from them.
 def functional_plasma(temp_func=None, x_vel_func=None, y_vel_func=None, name=None,
-                      resolution=10, rmax=15, time=None, return_grids=False, tau0=0.5):
+                      resolution=10, rmax=15, time=None, return_grids=False, tau0=0.5, fields=BASE_FIELDS,
+                      dtype=config.mode.MEDIUM_DTYPE):
     # Define grid time and space domains
     if time is None:
         t_space = np.linspace(tau0, 2 * rmax, int((rmax + rmax) * resolution))
@@ -874,8 +1109,102 @@ def functional_plasma(temp_func=None, x_vel_func=None, y_vel_func=None, name=Non
 
     # Create the plasma object via tabulated points
     return tabulated_plasma(t_space, x_space, temp_values, x_vel_values, y_vel_values, name=name,
-                            return_grids=return_grids)
-
-
-
-
+                            return_grids=return_grids, fields=fields, dtype=dtype)
+
+
+# Function to write the medium of an osu_hydro_file to a medium store at file_path
+# A medium store is a single file holding the medium fields of an event, ready to use, after a header
+# with the grid and metadata. Each group of fields is laid out as one [time, x, y, field] array, aligned
+# to a page, so open_medium_store can memory-map it. Fields are cropped and stored as by the hydro file.
+# By default, the fields every event needs and the gradients built on first use are stored as separate groups.
+# The raw temperature and flow velocity over the whole grid follow, for statistics of the medium.
+def write_medium_store(hydro_file, file_path, groups=(BASE_FIELDS, GRADIENT_FIELDS)):
+    logging.info('Writing medium store: {}'.format(file_path))
+    header = {'name': hydro_file.name,
+              't_space': [float(t) for t in hydro_file.tspace],
+              'x_space': [float(x) for x in hydro_file.xspace],
+              'timestep': float(hydro_file.timestep),
+              'gridstep': float(hydro_file.gridstep),
+              'offset': [0, 0, 0] if hydro_file.crop is None else [index.start for index in hydro_file.crop],
+              'fill_value': 0,
+              'groups': []}
+
+    # Lay out the groups one after the other, past the header
+    group_values = [hydro_file.stacked_fields(list(fields), crop=True) for fields in groups]
+    position = 0
+    for fields, values in zip(groups, group_values):
+        header['groups'].append({'fields': list(fields), 'dtype': values.dtype.str, 'shape': list(values.shape),
+                                 'position': position})
+        position += int(np.ceil(values.nbytes / MEDIUM_STORE_ALIGN)) * MEDIUM_STORE_ALIGN
+    raw_shape = [hydro_file.NT, hydro_file.grid_width, hydro_file.grid_width, len(BASE_FIELDS)]
+    header['raw'] = {'fields': BASE_FIELDS, 'dtype': np.dtype(np.float64).str, 'shape': raw_shape,
+                     'position': position}
+    position += int(np.ceil(np.prod(raw_shape) * 8 / MEDIUM_STORE_ALIGN)) * MEDIUM_STORE_ALIGN
+    header_bytes = json.dumps(header).encode()
+    data_start = int(np.ceil((len(MEDIUM_STORE_MAGIC) + 8 + len(header_bytes)) / MEDIUM_STORE_ALIGN)) \
+        * MEDIUM_STORE_ALIGN
+
+    # Write to a temporary name first, so an interrupted write never leaves a partial store behind
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as store:
+        store.write(MEDIUM_STORE_MAGIC)
+        store.write(len(header_bytes).to_bytes(8, 'little'))
+        store.write(header_bytes)
+        for group, values in zip(header['groups'], group_values):
+            store.seek(data_start + group['position'])
+            store.write(np.ascontiguousarray(values).tobytes())
+
+        # Raw fields, one time slice at a time
+        store.seek(data_start + header['raw']['position'])
+        for index in range(hydro_file.NT):
+            raw_slice = hydro_file.slice_fields(index, fields=BASE_FIELDS)
+            store.write(np.stack([raw_slice[field] for field in BASE_FIELDS], axis=-1).astype(np.float64).tobytes())
+        store.truncate(data_start + position)
+    os.replace(temp_path, file_path)
+
+
+# Function to open a medium store written by write_medium_store as a plasma_event
+# The fields are memory-mapped read-only, so every process that opens the same store shares one copy
+# of the medium through the page cache, and nothing is parsed or computed.
+def open_medium_store(file_path, name=None, rmax=None, fields=BASE_FIELDS):
+    with open(file_path, 'rb') as store:
+        if store.read(len(MEDIUM_STORE_MAGIC)) != MEDIUM_STORE_MAGIC:
+            raise ValueError('Not a medium store: {}'.format(file_path))
+        header_length = int.from_bytes(store.read(8), 'little')
+        header = json.loads(store.read(header_length).decode())
+    data_start = int(np.ceil((len(MEDIUM_STORE_MAGIC) + 8 + header_length) / MEDIUM_STORE_ALIGN)) \
+        * MEDIUM_STORE_ALIGN
+    points = (np.array(header['t_space']), np.array(header['x_space']), np.array(header['x_space']))
+
+    # Map each group of fields when first needed
+    field_interps = {}
+
+    def group_interp(field):
+        for i, group in enumerate(header['groups']):
+            if field in group['fields']:
+                if i not in field_interps:
+                    values = np.memmap(file_path, dtype=np.dtype(group['dtype']), mode='r',
+                                       offset=data_start + group['position'], shape=tuple(group['shape']))
+                    field_interps[i] = grid_interpolator(points, values, group['fields'], offset=header['offset'],
+                                                         fill_value=header['fill_value'])
+                return field_interps[i]
+        raise ValueError('Medium store {} has no field {}'.format(file_path, field))
+
+    def field_source(fields):
+        return group_interp(fields[0])
+
+    # Take statistics from the raw fields
+    raw = np.memmap(file_path, dtype=np.dtype(header['raw']['dtype']), mode='r',
+                    offset=data_start + header['raw']['position'], shape=tuple(header['raw']['shape']))
+
+    def slice_source(index, fields=BASE_FIELDS):
+        raw_slice = raw[index:index + 1]
+        stacked = stack_medium_fields(raw_slice[..., 0], raw_slice[..., 1], raw_slice[..., 2], header['gridstep'],
+                                      fields=fields)
+        return {field: stacked[0, :, :, i] for i, field in enumerate(fields)}
+
+    plasma_object = plasma_event(field_source=field_source, name=header['name'] if name is None else name,
+                                 rmax=rmax, fields=fields, slice_source=slice_source)
+    plasma_object.timestep = header['timestep']
+    plasma_object.gridstep = header['gridstep']
+    return plasma_object
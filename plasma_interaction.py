@@ -18,16 +18,18 @@ def mu_DeBye(T, g=None):
 # Total GW cross section, as per Sievert, Yoon, et. al.
 # Specify med_parton either 'g' for medium gluon or 'q' for generic light (?) quark in medium
 # https://inspirehep.net/literature/1725162
-def sigma(temp, parton_type, med_parton='g'):
+def sigma(temp, parton_type, med_parton='g', g=None):
     """
     We select the appropriate cross-section for a known parton and
     known medium parton specified when called
     """
-    coupling = config.constants.G
+    if g is None:
+        g = config.constants.G
+    coupling = g
 
-    sigma_gg_gg = (9/(32 * np.pi)) * coupling ** 4 / (mu_DeBye(T=temp) ** 2)
-    sigma_qg_qg = (1/(8 * np.pi)) * coupling ** 4 / (mu_DeBye(T=temp) ** 2)
-    sigma_qq_qq = (1/(18 * np.pi)) * coupling ** 4 / (mu_DeBye(T=temp) ** 2)
+    sigma_gg_gg = (9/(32 * np.pi)) * coupling ** 4 / (mu_DeBye(T=temp, g=g) ** 2)
+    sigma_qg_qg = (1/(8 * np.pi)) * coupling ** 4 / (mu_DeBye(T=temp, g=g) ** 2)
+    sigma_qq_qq = (1/(18 * np.pi)) * coupling ** 4 / (mu_DeBye(T=temp, g=g) ** 2)
 
     if parton_type == 'g' and med_parton == 'g':
         # gg -> gg cross-section
@@ -61,7 +63,8 @@ def rho(temp, med_parton='g'):
 
 # Function to return inverse QGP drift mean free path in units of GeV
 # Total GW cross section, as per Sievert, Yoon, et. al.
-def inv_lambda(event=None, parton_type=None, point=None, med_parton='all', T=None):
+# The coupling g is config.constants.G by default.
+def inv_lambda(event=None, parton_type=None, point=None, med_parton='all', T=None, g=None):
     """
     We apply a reciprocal summation between the cross-section times density for a medium gluon and for a medium quark
     to get the mean free path as in https://inspirehep.net/literature/1725162
@@ -78,123 +81,197 @@ def inv_lambda(event=None, parton_type=None, point=None, med_parton='all', T=Non
         temp = event.temp(point)
 
     if med_parton == 'all':
-        return (sigma(temp, parton_type, med_parton='g') * rho(temp, med_parton='g')
-                + sigma(temp, parton_type, med_parton='q') * rho(temp, med_parton='q'))
+        return (sigma(temp, parton_type, med_parton='g', g=g) * rho(temp, med_parton='g')
+                + sigma(temp, parton_type, med_parton='q', g=g) * rho(temp, med_parton='q'))
     else:
-        return sigma(temp, parton_type, med_parton=med_parton) * rho(temp, med_parton=med_parton)
+        return sigma(temp, parton_type, med_parton=med_parton, g=g) * rho(temp, med_parton=med_parton)
+
+# Medium properties sampled along the next step of a parton
+# Every medium field is evaluated once at the shared sub-step points (the same points as utilities.dtau_avg)
+# and the step-averaged quantities are handed to all of the interaction integrands below.
+# num_samples and rule choose the quadrature along the step -- see utilities.dtau_quadrature.
+# As in utilities.dtau_avg, every average is zero if any point within the step is out of bounds of the medium.
+class medium_sample:
+    def __init__(self, event, parton, time, dtau=None, num_samples=None, rule=None, fields=None):
+        if dtau is None:
+            dtau = config.jet.DTAU
+        if num_samples is None:
+            num_samples = config.jet.STEP_SAMPLES
+        if rule is None:
+            rule = config.jet.STEP_RULE
+
+        self.event = event
+        self.time = time
+        self.dtau = dtau
+        self.point = parton.coords3(time=time)
+        self.phi = parton.polar_mom_coords()[1]
+        self.beta = parton.beta()
+        self.part = parton.part
+
+        # Sample points and weights along the step
+        delta_taus, self.weights = utilities.dtau_quadrature(dtau=dtau, num_samples=num_samples, rule=rule)
+        self.coords = utilities.dtau_sample_points(point=self.point, phi=self.phi, dtau=dtau, beta=self.beta,
+                                                   num_samples=num_samples, rule=rule)
+        self.samples_start = delta_taus[0] == 0
+
+        # Storage for field values at the sample points and step averages
+        # Field values may be handed over already interpolated, in which case the step is known to be in bounds.
+        self.averages = {}
+        if fields is not None:
+            self.fields = dict(fields)
+            self.in_bounds = True
+        else:
+            self.fields = {}
+
+            # Check if the whole step is within the medium
+            try:
+                self.field('temp')
+                self.in_bounds = True
+            except ValueError:
+                self.in_bounds = False
+
+    # Method to return the values of a medium field of the event at each sample point
+    # Each field is only interpolated once per step -- if the event interpolates all fields together,
+    # every field is found at the first lookup.
+    def field(self, name):
+        if name not in self.fields:
+            self.fields.update(self.event.sample_fields(self.coords, fields=[name]))
+        return self.fields[name]
+
+    # Method to return the step average of a quantity computed from the sampled fields
+    def average(self, name, func):
+        if name not in self.averages:
+            if self.in_bounds:
+                self.averages[name] = np.dot(self.weights, np.ravel(func()))
+            else:
+                self.averages[name] = 0
+        return self.averages[name]
+
+    # Step-averaged temperature
+    def T(self):
+        return self.average('T', lambda: self.field('temp'))
+
+    # Step-averaged magnitude of the flow velocity
+    def vel(self):
+        return self.average('vel', lambda: np.sqrt(self.field('x_vel') ** 2 + self.field('y_vel') ** 2))
+
+    # Step-averaged flow velocity perpendicular to the parton
+    def u_perp(self):
+        return self.average('u_perp', lambda: (-self.field('x_vel') * np.sin(self.phi)
+                                               + self.field('y_vel') * np.cos(self.phi)))
+
+    # Step-averaged flow velocity parallel to the parton
+    def u_par(self):
+        return self.average('u_par', lambda: (self.field('x_vel') * np.cos(self.phi)
+                                              + self.field('y_vel') * np.sin(self.phi)))
+
+    # Flow velocity perpendicular to the parton at the start of the step
+    def u_perp_point(self):
+        if self.in_bounds and self.samples_start:
+            return (-self.field('x_vel')[0] * np.sin(self.phi)
+                    + self.field('y_vel')[0] * np.cos(self.phi))
+        else:
+            return self.event.u_perp(point=self.point, phi=self.phi)
+
+    # Step-averaged temperature gradient perpendicular to the parton
+    def grad_perp_T(self):
+        return self.average('grad_perp_T', lambda: (-self.field('temp_grad_x') * np.sin(self.phi)
+                                                    + self.field('temp_grad_y') * np.cos(self.phi)))
+
+    # Step-averaged perp gradient of u perp
+    def grad_perp_u_perp(self):
+        return self.average('grad_perp_u_perp',
+                            lambda: (self.field('grad_x_u_x') * (np.sin(self.phi)**2)
+                                     - self.field('grad_y_u_x') * np.sin(self.phi)*np.cos(self.phi)
+                                     - self.field('grad_x_u_y') * np.sin(self.phi)*np.cos(self.phi)
+                                     + self.field('grad_y_u_y') * (np.cos(self.phi)**2)))
+
+    # Step-averaged perp gradient of u par
+    def grad_perp_u_par(self):
+        return self.average('grad_perp_u_par',
+                            lambda: (- self.field('grad_x_u_x') * np.sin(self.phi) * np.cos(self.phi)
+                                     + self.field('grad_y_u_x') * (np.cos(self.phi)**2)
+                                     - self.field('grad_x_u_y') * (np.sin(self.phi)**2)
+                                     + self.field('grad_y_u_y') * np.sin(self.phi) * np.cos(self.phi)))
+
+
+# Function to sample the medium along the next step of several partons at once
+# The given fields (or all of them, if the event interpolates its fields together) are interpolated in a single call
+# for the points of all partons, and any other fields are filled in by each sample when first needed.
+# time is the time at the start of the step -- the same for every parton, or a sequence of one time per parton.
+# If any step leaves the medium, falls back to sampling each parton on its own.
+def medium_samples(event, partons, time, dtau=None, num_samples=None, rule=None, fields=('temp', 'x_vel', 'y_vel')):
+    if dtau is None:
+        dtau = config.jet.DTAU
+    if num_samples is None:
+        num_samples = config.jet.STEP_SAMPLES
+    if rule is None:
+        rule = config.jet.STEP_RULE
+    times = np.broadcast_to(np.asarray(time, dtype=float), (len(partons),))
+    if len(partons) == 1:
+        return [medium_sample(event=event, parton=partons[0], time=times[0], dtau=dtau, num_samples=num_samples,
+                              rule=rule)]
+
+    # Gather the sample points of every parton
+    coords = np.concatenate([utilities.dtau_sample_points(point=parton.coords3(time=parton_time),
+                                                          phi=parton.polar_mom_coords()[1], dtau=dtau,
+                                                          beta=parton.beta(), num_samples=num_samples, rule=rule)
+                             for parton, parton_time in zip(partons, times)])
+
+    # Interpolate the fields once for all partons
+    try:
+        values = {name: np.split(field_values, len(partons))
+                  for name, field_values in event.sample_fields(coords, fields=fields).items()}
+    except ValueError:
+        return [medium_sample(event=event, parton=parton, time=parton_time, dtau=dtau, num_samples=num_samples,
+                              rule=rule)
+                for parton, parton_time in zip(partons, times)]
+
+    return [medium_sample(event=event, parton=parton, time=times[i], dtau=dtau, num_samples=num_samples, rule=rule,
+                          fields={name: values[name][i] for name in values})
+            for i, parton in enumerate(partons)]
 
 # Define integrand for mean q_drift (k=0 moment)
-def drift_integrand(event, parton, time):
-    FmGeV = 1/0.19732687
-
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    E = parton.p_T()
-    beta = parton.beta()
-
+# The formula is kept in drift_integrand_batch, as for the other integrands below.
+# The coupling g and drift factor k_f_drift are config.constants.G and config.jet.K_F_DRIFT by default,
+# as for the other integrands below.
+def drift_integrand(event, parton, time, sample=None, g=None, k_f_drift=None):
     # Average medium parameters
-    u_perp = utilities.dtau_avg(func=lambda x : event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x : event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    mu = utilities.dtau_avg(func=lambda x : mu_DeBye(T=event.temp(x)), point=point, phi=p_phi,
-                            dtau=config.jet.DTAU, beta=beta)
-    inv_lambda_val = utilities.dtau_avg(func=lambda x : inv_lambda(event=event, parton_type=parton.part, point=x),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
 
-    # Source link? -- Converts factor of fermi from integral to factor of GeV^{-1}
-    return ((FmGeV) * (1 / parton.p_T()) * config.jet.K_F_DRIFT
-            * (3 * np.log(E/mu)
-               * (u_perp / (1 - u_tau))
-               * (mu**2)
-               * inv_lambda_val))
+    return float(drift_integrand_batch(E=parton.p_T(), T=sample.T(), u_perp=sample.u_perp(), u_tau=sample.u_par(),
+                                       gluon=parton.part == 'g', g=g, k_f_drift=k_f_drift))
 
 # Define integrand for mean flow-grad_uT drift
-def flowgrad_T_integrand(event, parton, time):
-    FmGeV = 1/0.19732687
-
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    E = parton.p_T()
-    beta = parton.beta()
-
+def flowgrad_T_integrand(event, parton, time, sample=None, g=None):
     # Average medium parameters
-    T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    u_perp = utilities.dtau_avg(func=lambda x: event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-    mu = utilities.dtau_avg(func=lambda x: mu_DeBye(T=event.temp(x)), point=point, phi=p_phi,
-                            dtau=config.jet.DTAU, beta=beta)
-    inv_lambda_val = utilities.dtau_avg(func=lambda x: inv_lambda(event=event, parton_type=parton.part, point=x),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    grad_perp_temp = utilities.dtau_avg(func=lambda x: event.grad_perp_T(point=x, phi=p_phi),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-
-    return - ((FmGeV) * (3 / E) * config.jet.K_FG_DRIFT * (time - event.t0)
-              * 3 * grad_perp_temp * ((u_perp**2)/((1 - u_tau)**2)) * (1/T)
-              * (mu**2) * inv_lambda_val
-              * np.log(E / mu))
-
-# Define integrand for mean flow-grad_utau drift
-def flowgrad_utau_integrand(event, parton, time):
-    FmGeV = 1/0.19732687
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
 
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    E = parton.p_T()
-    beta = parton.beta()
+    return float(flowgrad_T_integrand_batch(E=parton.p_T(), T=sample.T(), u_perp=sample.u_perp(),
+                                            u_tau=sample.u_par(), grad_perp_temp=sample.grad_perp_T(),
+                                            gluon=parton.part == 'g', time=time, t0=event.t0, g=g))
 
+# Define integrand for mean flow-grad_utau drift
+def flowgrad_utau_integrand(event, parton, time, sample=None, g=None):
     # Average medium parameters
-    #T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    u_perp = utilities.dtau_avg(func=lambda x: event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-    mu = utilities.dtau_avg(func=lambda x: mu_DeBye(T=event.temp(x)), point=point, phi=p_phi,
-                            dtau=config.jet.DTAU, beta=beta)
-    inv_lambda_val = utilities.dtau_avg(func=lambda x: inv_lambda(event=event, parton_type=parton.part, point=x),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    grad_perp_u_tau = utilities.dtau_avg(func=lambda x: event.grad_perp_u_par(point=x, phi=p_phi),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
 
-    # Source link? -- Converts factor of fermi from integral to factor of GeV^{-1}
-    return - ((FmGeV) * (3 / E) * config.jet.K_FG_DRIFT * (time - event.t0)
-              * 2 * grad_perp_u_tau * ((u_perp**2)/((1 - u_tau)**3))
-              * (mu**2) * inv_lambda_val
-              * np.log(E / mu))
+    return float(flowgrad_utau_integrand_batch(E=parton.p_T(), T=sample.T(), u_perp=sample.u_perp(),
+                                               u_tau=sample.u_par(), grad_perp_u_tau=sample.grad_perp_u_par(),
+                                               gluon=parton.part == 'g', time=time, t0=event.t0, g=g))
 
 # Define integrand for mean flow-grad_uperp drift
-def flowgrad_uperp_integrand(event, parton, time):
-    FmGeV = 1/0.19732687
-
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    E = parton.p_T()
-    beta = parton.beta()
-
+def flowgrad_uperp_integrand(event, parton, time, sample=None, g=None):
     # Average medium parameters
-    # T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    u_perp = utilities.dtau_avg(func=lambda x: event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-    mu = utilities.dtau_avg(func=lambda x: mu_DeBye(T=event.temp(x)), point=point, phi=p_phi,
-                            dtau=config.jet.DTAU, beta=beta)
-    inv_lambda_val = utilities.dtau_avg(func=lambda x: inv_lambda(event=event, parton_type=parton.part, point=x),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    grad_perp_u_perp = utilities.dtau_avg(func=lambda x: event.grad_perp_u_perp(point=x, phi=p_phi),
-                                          point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
 
-    # Source link? -- Converts factor of fermi from integral to factor of GeV^{-1}
-    return - ((FmGeV) * (3 / E) * config.jet.K_FG_DRIFT * (time - event.t0)
-              * 2 * grad_perp_u_perp * (u_perp/((1 - u_tau)**2))
-              * (mu**2) * inv_lambda_val
-              * np.log(E / mu))
+    return float(flowgrad_uperp_integrand_batch(E=parton.p_T(), T=sample.T(), u_perp=sample.u_perp(),
+                                                u_tau=sample.u_par(), grad_perp_u_perp=sample.grad_perp_u_perp(),
+                                                gluon=parton.part == 'g', time=time, t0=event.t0, g=g))
 
 # Function to sample ebe fluctuation zeta parameter for energy loss integral
 def zeta(q=0, maxAttempts=5, batch=1000):
@@ -231,51 +308,14 @@ def zeta(q=0, maxAttempts=5, batch=1000):
 
 
 # Integrand for energy loss
-def energy_loss_integrand(event, parton, time, model='BBMG'):
-    FmGeV = 1/0.19732687
-
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    E = parton.p_T()
-    beta = parton.beta()
-
+def energy_loss_integrand(event, parton, time, model='BBMG', sample=None, g=None):
     # Average medium parameters
-    T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    mu = utilities.dtau_avg(func=lambda x: mu_DeBye(T=event.temp(x)), point=point, phi=p_phi,
-                            dtau=config.jet.DTAU, beta=beta)
-    inv_lambda_val = utilities.dtau_avg(func=lambda x: inv_lambda(event=event, parton_type=parton.part, point=x),
-                                        point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    vel = utilities.dtau_avg(func=event.vel, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
+    vel = sample.vel() if model == 'BBMG' else None
 
-    # Select energy loss model and return appropriate energy loss
-    if model == 'BBMG':
-        # Note that we apply FERMI GeV twice... Once for the t factor, once for the (int dt).
-        return (config.jet.K_BBMG * (-1) * ((FmGeV) ** 2) * (time - event.t0) * (T ** 3)
-                * zeta(q=-1) * (1 / np.sqrt(1 - (vel**2)))
-                * (1))
-    elif model == 'GLV':
-        # https://inspirehep.net/literature/539404
-        # Note that we apply FERMItoGeV twice... Once for the t factor, once for the (int dt).
-        # Set C_R, "quadratic Casimir of the representation R of SU(3) for the parton"
-        if parton.part == 'g':
-            # For a gluon it's the adjoint representation C_A = N_c = 3
-            CR = 3
-        else:
-            # For a quark it's the fundamental representation C_F = 4/3 in QCD
-            CR = 4/3
-
-        # Set alpha_s
-        alphas = (config.constants.G**2) / (4*np.pi)
-
-        # Calculate and return energy loss per unit length of this step.
-        return (-1)*(CR * alphas / 2) * (((FmGeV) ** 2)
-                                         * (time - event.t0)
-                                         * (mu**2)
-                                         * inv_lambda_val
-                                         * np.log(E / mu))
-    else:
-        return 0
+    return float(energy_loss_integrand_batch(E=parton.p_T(), T=sample.T(), vel=vel, gluon=parton.part == 'g',
+                                             time=time, t0=event.t0, model=model, g=g))
 
 # # Integrand for gradient deflection to 2nd order in opacity
 # # Note - first moment is zero. Essentially computing cuberoot(q_{grad}^3) as scale approx.
@@ -328,83 +368,183 @@ def energy_loss_integrand(event, parton, time, model='BBMG'):
 #     return np.cbrt(first_order_q + first_order_g + second_order_q + second_order_g)
 
 # Modification factor for energy loss due to gradients of temperature
-def fg_T_qhat_mod_factor(event, parton, time):
-
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    beta = parton.beta()
-
+def fg_T_qhat_mod_factor(event, parton, time, sample=None):
     # Average medium parameters
-    T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    u_perp = utilities.dtau_avg(func=lambda x: event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-    grad_perp_temp = utilities.dtau_avg(func=lambda x: event.grad_perp_T(point=x, phi=p_phi),
-                                          point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
 
-    return (-1) * (time - event.t0) * (3 * grad_perp_temp * (u_perp / (1-u_tau)) * (1/T))
+    return float(fg_T_qhat_mod_factor_batch(T=sample.T(), u_perp=sample.u_perp(), u_tau=sample.u_par(),
+                                            grad_perp_temp=sample.grad_perp_T(), time=time, t0=event.t0))
 
 
 # Modification factor for energy loss due to gradients of utau
-def fg_utau_qhat_mod_factor(event, parton, time):
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    beta = parton.beta()
-
+def fg_utau_qhat_mod_factor(event, parton, time, sample=None):
     # Average medium parameters
-    u_perp = utilities.dtau_avg(func=lambda x: event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-    grad_perp_u_tau = utilities.dtau_avg(func=lambda x: event.grad_perp_u_par(point=x, phi=p_phi),
-                                         point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
 
-    return (-1) * (time - event.t0) * (grad_perp_u_tau * (u_perp / ((1-u_tau)**2)))
+    return float(fg_utau_qhat_mod_factor_batch(u_perp=sample.u_perp(), u_tau=sample.u_par(),
+                                               grad_perp_u_tau=sample.grad_perp_u_par(), time=time, t0=event.t0))
 
 # Modification factor for energy loss due to gradients of uperp
-def fg_uperp_qhat_mod_factor(event, parton, time):
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    beta = parton.beta()
-
+def fg_uperp_qhat_mod_factor(event, parton, time, sample=None):
     # Average medium parameters
-    u_perp = utilities.dtau_avg(func=lambda x: event.u_perp(point=x, phi=p_phi), point=point, phi=p_phi,
-                                dtau=config.jet.DTAU, beta=beta)
-    u_tau = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=p_phi), point=point, phi=p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-    grad_perp_u_perp = utilities.dtau_avg(func=lambda x: event.grad_perp_u_perp(point=x, phi=p_phi),
-                                          point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
+
+    return float(fg_uperp_qhat_mod_factor_batch(u_tau=sample.u_par(), grad_perp_u_perp=sample.grad_perp_u_perp(),
+                                                time=time, t0=event.t0))
+
+# Function to return the paths of the gluon and light quark numerical energy loss tables for the coupling g
+# Tables on disk are found by the coupling they were generated at (see eloss_table_files), otherwise
+# the paths are those generate_e_loss_tables.py would write for the coupling.
+def eloss_table_paths(g):
+    files = eloss_table_files()
+    if float(g) in files:
+        return files[float(g)]
+
+    # Find directory of this file
+    project_path = os.path.dirname(os.path.realpath(__file__))
+    return (project_path + f'/e_loss_tables/g{float(g)}_deltaE_samples_g_1subdiv.npz',
+            project_path + f'/e_loss_tables/g{float(g)}_deltaE_samples_q_1subdiv.npz')
+
+
+# Function to return the paths of the gluon and light quark combined numerical energy loss tables,
+# which hold every tabulated coupling in one (E, T, L, g) array
+def combined_eloss_table_paths():
+    # Find directory of this file
+    project_path = os.path.dirname(os.path.realpath(__file__))
+
+    return (project_path + '/e_loss_tables/combined_deltaE_samples_g_1subdiv.npz',
+            project_path + '/e_loss_tables/combined_deltaE_samples_q_1subdiv.npz')
+
+
+# Function to find the per-coupling numerical energy loss tables on disk
+# Returns a dictionary from each coupling to the paths of its gluon and light quark tables
+def eloss_table_files():
+    # Find directory of this file
+    project_path = os.path.dirname(os.path.realpath(__file__))
+
+    files = {}
+    for filename in os.listdir(project_path + "/e_loss_tables/"):
+        if not (filename.startswith('g') and filename.endswith('_1subdiv.npz')):
+            continue
+        try:
+            coupling = float(filename[1:].split("_", 1)[0])
+        except ValueError:
+            continue
+        parton = filename[:-len('_1subdiv.npz')].rsplit("_", 1)[1]
+        files.setdefault(coupling, {})[parton] = project_path + "/e_loss_tables/" + filename
+    return {coupling: (paths['g'], paths['q']) for coupling, paths in files.items() if 'g' in paths and 'q' in paths}
+
+
+# Function to return the sorted couplings that have numerical energy loss tables on disk
+def eloss_table_couplings():
+    return np.sort(np.array(list(eloss_table_files().keys())))
+
+
+# Function to combine the per-coupling numerical energy loss tables into one (E, T, L, g) table per parton type
+# All couplings must share the same E, T, and L points, up to rounding. By default every coupling on disk is combined.
+def write_combined_eloss_tables(couplings=None):
+    files = eloss_table_files()
+    if couplings is None:
+        couplings = list(files.keys())
+    couplings = np.sort(np.array(couplings, dtype=float))
+    for g in couplings:
+        if g not in files:
+            raise FileNotFoundError('No energy loss tables for g={}'.format(g))
+    logging.info('Combining numerical energy loss tables for g={}...'.format(couplings))
+
+    for i, combined_path in enumerate(combined_eloss_table_paths()):
+        tables = [np.load(files[g][i]) for g in couplings]
+        for key in ['E_points', 'T_points', 'L_points']:
+            for g, table in zip(couplings, tables):
+                if table[key].shape != tables[0][key].shape or not np.allclose(table[key], tables[0][key],
+                                                                                rtol=1e-12, atol=0):
+                    raise ValueError('Energy loss table for g={} has different {}'.format(g, key))
+        delta_E_vals = np.stack([table['delta_E_vals'] for table in tables], axis=-1)
+
+        # Write to a temporary file first, so readers never see a partial table
+        temp_path = combined_path[:-len('.npz')] + '.tmp.npz'
+        np.savez(temp_path, E_points=tables[0]['E_points'], T_points=tables[0]['T_points'],
+                 L_points=tables[0]['L_points'], g_points=couplings, delta_E_vals=delta_E_vals)
+        os.replace(temp_path, combined_path)
+
+
+# Numerical energy loss interpolators loaded in this process, keyed by coupling (or 'combined')
+# Each entry is the modification times of the tables it was loaded from and the interpolator.
+eloss_interp_cache = {}
+
+
+# Function to return the combined (E, T, L, g) numerical energy loss interpolator, or None without combined tables
+# The combined tables are loaded once per process, and again if rewritten on disk since.
+def cached_combined_eloss_interpolator():
+    try:
+        mtimes = tuple(os.path.getmtime(path) for path in combined_eloss_table_paths())
+    except OSError:
+        eloss_interp_cache.pop('combined', None)
+        return None
+    if 'combined' not in eloss_interp_cache or eloss_interp_cache['combined'][0] != mtimes:
+        eloss_interp_cache['combined'] = (mtimes, combined_eloss_interpolator())
+    return eloss_interp_cache['combined'][1]
+
+
+# Function to return the numerical energy loss interpolator for the coupling g (by default config.constants.G)
+# Couplings tabulated in the combined tables are taken from them, so switching couplings reads no tables --
+# unless the coupling's own tables were rewritten after the combined tables. Other couplings use their own tables,
+# which must exist. Each interpolator is made once per process and shared by every later caller with the same
+# coupling, e.g. all partons and cases of an event. Tables rewritten on disk since are loaded again.
+def cached_num_eloss_interpolator(g=None):
+    if g is None:
+        g = config.constants.G
+    g = float(g)
+
+    combined = cached_combined_eloss_interpolator()
+    if combined is not None and combined.tabulates(g) and not combined.stale(g):
+        mtimes = ('combined',) + eloss_interp_cache['combined'][0]
+        if g not in eloss_interp_cache or eloss_interp_cache[g][0] != mtimes:
+            eloss_interp_cache[g] = (mtimes, coupling_eloss_interpolator(combined=combined, g=g))
+        return eloss_interp_cache[g][1]
+
+    try:
+        mtimes = tuple(os.path.getmtime(path) for path in eloss_table_paths(g))
+    except OSError:
+        mtimes = None
+    if g not in eloss_interp_cache or eloss_interp_cache[g][0] != mtimes:
+        if combined is not None and combined.tabulates(g):
+            logging.warning('Combined energy loss tables are older than the tables for g={} -- using its own tables. '
+                            'Rewrite them with write_combined_eloss_tables.'.format(g))
+        eloss_interp_cache[g] = (mtimes, num_eloss_interpolator(g=g))
+    return eloss_interp_cache[g][1]
+
+
+# Function to drop cached numerical energy loss interpolators -- those of the coupling g, or all of them
+def clear_num_eloss_cache(g=None):
+    if g is None:
+        eloss_interp_cache.clear()
+    else:
+        eloss_interp_cache.pop(float(g), None)
 
-    return (-1) * (time - event.t0) * (grad_perp_u_perp * (1 / (1-u_tau)))
 
 class num_eloss_interpolator():
     # Instantiation statement. All parameters optional.
-    def __init__(self):
-        logging.info(f'Loading numerical energy loss tables for g={config.constants.G:.1f}...')
-        # Find directory of this file
-        project_path = os.path.dirname(os.path.realpath(__file__))
+    # The coupling g is config.constants.G by default.
+    def __init__(self, g=None):
+        if g is None:
+            g = config.constants.G
+        logging.info(f'Loading numerical energy loss tables for g={g}...')
 
         # Load appropriate tables of computed fixed length energy loss
         try:
-            # Get the coupling as a string
-            tag = f"{config.constants.G:.1f}"
-
             # Load
-            self.g_table = np.load(project_path + f'/e_loss_tables/g{tag}_deltaE_samples_g_1subdiv.npz')
-            self.q_table = np.load(project_path + f'/e_loss_tables/g{tag}_deltaE_samples_q_1subdiv.npz')
+            g_path, q_path = eloss_table_paths(g)
+            self.g_table = np.load(g_path)
+            self.q_table = np.load(q_path)
         except:
             logging.error("Energy loss tables not found!")
 
             # Find list of computed couplings
-            data_tables = np.array(os.listdir(project_path + "/e_loss_tables/"))
-            couplings = np.array([])
-            for filename in data_tables:
-                couplings = np.append(couplings, float(filename.split("g", 1)[1].split("_", 1)[0]))
-            couplings = np.sort(np.array(list(set(couplings))))
+            couplings = eloss_table_couplings()
 
             # Shout about it
             logging.error("Available Couplings:")
@@ -436,63 +576,278 @@ class num_eloss_interpolator():
     # Method to return the energy loss rate from finite bound first order GLV
     # emitted gluon k on [mu, np.min([2 * E * x, 2 * E * np.sqrt(x * (1 - x))])],
     # medium gluon q on [0, np.sqrt(3 * mu * E)]
-    def eloss_rate(self, event, parton, time):
-        # Get parton energy, coordinates, etc.
+    def eloss_rate(self, event, parton, time, sample=None):
+        # Get parton energy
         E = parton.p_T()
-        beta = parton.beta()
-        point = parton.coords3(time=time)
-        p_rho, p_phi = parton.polar_mom_coords()
 
         # Get medium properties averaged over timestep
-        T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-        L = (2*(time - event.t0) + config.jet.DTAU)/2
+        if sample is None:
+            sample = medium_sample(event=event, parton=parton, time=time)
+        T = sample.T()
+        L = (2*(time - event.t0) + sample.dtau)/2
 
         # Return energy loss rate for appropriate identity
-        # Note minus sign - positive values in table correspond to energy loss
-        if parton.part == 'g':
-            # Use gluon tables
-            return (-1) * float(self.g_dE_dx(np.array([E, T, L]))[0])
-        else:
-            # Use light quark tables
-            return (-1) * float(self.q_dE_dx(np.array([E, T, L]))[0])
+        return float(self.eloss_rate_batch(E=E, T=T, L=L, gluon=parton.part == 'g'))
 
     def eloss_rate_an(self, E, T, L, pid=21):
         # Return energy loss rate for appropriate identity
+        return float(self.eloss_rate_batch(E=E, T=T, L=L, gluon=pid == 21))
+
+    # Method to return the energy loss rates of many partons at once
+    # E, T, and L are arrays (or scalars) of parton energy, temperature, and pathlength, and gluon is a boolean array
+    # marking the gluons -- the rest use the light quark tables. Each table is interpolated in a single call.
+    def eloss_rate_batch(self, E, T, L, gluon):
+        E, T, L, gluon = np.broadcast_arrays(np.asarray(E, dtype=float), np.asarray(T, dtype=float),
+                                             np.asarray(L, dtype=float), np.asarray(gluon, dtype=bool))
+        points = np.column_stack((E.ravel(), T.ravel(), L.ravel()))
+        gluon = gluon.ravel()
+
+        rates = np.zeros(len(points))
+        if np.any(gluon):
+            # Use gluon tables
+            rates[gluon] = self.g_dE_dx(points[gluon])
+        if not np.all(gluon):
+            # Use light quark tables
+            rates[~gluon] = self.q_dE_dx(points[~gluon])
+
         # Note minus sign - positive values in table correspond to energy loss
-        if pid == 21:
+        return ((-1) * rates).reshape(E.shape)
+
+
+# Class for the numerical energy loss rate interpolated in (E, T, L, g)
+# Uses the combined tables of every tabulated coupling (see write_combined_eloss_tables).
+class combined_eloss_interpolator():
+    # Instantiation statement.
+    def __init__(self):
+        logging.info('Loading combined numerical energy loss tables...')
+        g_path, q_path = combined_eloss_table_paths()
+        self.mtime = min(os.path.getmtime(g_path), os.path.getmtime(q_path))
+        self.g_table = np.load(g_path)
+        self.q_table = np.load(q_path)
+        self.g_points = self.g_table['g_points']
+
+        # Compute pathlength gradient to get energy loss rate tables
+        g_delta_E_grad_L = np.gradient(self.g_table['delta_E_vals'], self.g_table['L_points'], axis=2)
+        q_delta_E_grad_L = np.gradient(self.q_table['delta_E_vals'], self.q_table['L_points'], axis=2)
+
+        # Interpolate energy loss rate tables
+        self.g_dE_dx = RegularGridInterpolator(  # gluons
+            (self.g_table['E_points'],
+             self.g_table['T_points'],
+             self.g_table['L_points'],
+             self.g_table['g_points']),
+            g_delta_E_grad_L,
+            bounds_error=False,  # Do not fail if out of data bounds
+            fill_value=None)  # Extrapolate energy loss rate, if necessary
+
+        self.q_dE_dx = RegularGridInterpolator(  # light quarks
+            (self.q_table['E_points'],
+             self.q_table['T_points'],
+             self.q_table['L_points'],
+             self.q_table['g_points']),
+            q_delta_E_grad_L,
+            bounds_error=False,  # Do not fail if out of data bounds
+            fill_value=None)  # Extrapolate energy loss rate, if necessary
+
+    # Method to return whether the coupling g is one of the tabulated couplings
+    def tabulates(self, g):
+        return bool(np.any(np.isclose(self.g_points, g)))
+
+    # Method to return the energy loss rates of many partons at once, each at its own coupling
+    # As num_eloss_interpolator.eloss_rate_batch, with g an array (or scalar) of couplings,
+    # so partons of variants with different couplings share a single call per table.
+    def eloss_rate_batch(self, E, T, L, gluon, g):
+        E, T, L, g, gluon = np.broadcast_arrays(np.asarray(E, dtype=float), np.asarray(T, dtype=float),
+                                                np.asarray(L, dtype=float), np.asarray(g, dtype=float),
+                                                np.asarray(gluon, dtype=bool))
+        points = np.column_stack((E.ravel(), T.ravel(), L.ravel(), g.ravel()))
+        gluon = gluon.ravel()
+
+        rates = np.zeros(len(points))
+        if np.any(gluon):
             # Use gluon tables
-            return (-1) * float(self.g_dE_dx(np.array([E, T, L]))[0])
-        else:
+            rates[gluon] = self.g_dE_dx(points[gluon])
+        if not np.all(gluon):
             # Use light quark tables
-            return (-1) * float(self.q_dE_dx(np.array([E, T, L]))[0])
+            rates[~gluon] = self.q_dE_dx(points[~gluon])
+
+        # Note minus sign - positive values in table correspond to energy loss
+        return ((-1) * rates).reshape(E.shape)
+
+    # Method to return whether the per-coupling tables of the coupling g on disk were written after these tables
+    # A minute of slack allows for a checkout writing the tables in any order.
+    def stale(self, g):
+        paths = eloss_table_files().get(float(g))
+        if paths is None:
+            return False
+        return max(os.path.getmtime(path) for path in paths) > self.mtime + 60
+
+
+# Class for the numerical energy loss rate at a fixed coupling, taken from a combined_eloss_interpolator
+# Works as a num_eloss_interpolator, but reads no tables of its own.
+class coupling_eloss_interpolator():
+    # Instantiation statement.
+    def __init__(self, combined, g):
+        self.combined = combined
+        self.g = g
+
+    # Method to return the energy loss rate, as num_eloss_interpolator.eloss_rate
+    def eloss_rate(self, event, parton, time, sample=None):
+        # Get parton energy
+        E = parton.p_T()
+
+        # Get medium properties averaged over timestep
+        if sample is None:
+            sample = medium_sample(event=event, parton=parton, time=time)
+        T = sample.T()
+        L = (2*(time - event.t0) + sample.dtau)/2
+
+        # Return energy loss rate for appropriate identity
+        return float(self.eloss_rate_batch(E=E, T=T, L=L, gluon=parton.part == 'g'))
+
+    def eloss_rate_an(self, E, T, L, pid=21):
+        # Return energy loss rate for appropriate identity
+        return float(self.eloss_rate_batch(E=E, T=T, L=L, gluon=pid == 21))
+
+    # Method to return the energy loss rates of many partons at once, as num_eloss_interpolator.eloss_rate_batch
+    def eloss_rate_batch(self, E, T, L, gluon):
+        return self.combined.eloss_rate_batch(E=E, T=T, L=L, gluon=gluon, g=self.g)
 
 # Integrand for energy loss
 # https://journals.aps.org/prd/pdf/10.1103/PhysRevD.44.R2625
-def coll_energy_loss_integrand(event, parton, time):
+def coll_energy_loss_integrand(event, parton, time, sample=None, g=None):
+    # Average medium parameters
+    if sample is None:
+        sample = medium_sample(event=event, parton=parton, time=time)
+
+    return float(coll_energy_loss_integrand_batch(E=parton.p_T(), T=sample.T(), gluon=parton.part == 'g', g=g))
+
+
+#######################
+# Integrand formulas #
+#######################
+# The integrands above and evolve_batch share these, which take step-averaged medium quantities
+# as scalars (one parton) or arrays (one entry per parton) instead of an event and a parton object.
+# The boolean (array) "gluon" selects gluon or light quark properties for each parton.
+# The coupling g and drift factor k_f_drift are config.constants.G and config.jet.K_F_DRIFT by default.
+
+# Function to return inverse QGP drift mean free path for arrays of gluons and quarks
+def inv_lambda_batch(T, gluon, g=None):
+    return np.where(gluon, inv_lambda(T=T, parton_type='g', g=g), inv_lambda(T=T, parton_type='q', g=g))
+
+# Function to return the quadratic Casimir of the representation of each parton
+# For a gluon it's the adjoint representation C_A = N_c = 3,
+# for a quark it's the fundamental representation C_F = 4/3 in QCD
+def casimir_batch(gluon):
+    return np.where(gluon, 3, 4/3)
+
+# Batched integrand for mean q_drift (k=0 moment)
+def drift_integrand_batch(E, T, u_perp, u_tau, gluon, g=None, k_f_drift=None):
+    if k_f_drift is None:
+        k_f_drift = config.jet.K_F_DRIFT
     FmGeV = 1/0.19732687
-    nf = 2  # Source?
+    mu = mu_DeBye(T=T, g=g)
+    inv_lambda_val = inv_lambda_batch(T, gluon, g=g)
+
+    # Source link? -- Converts factor of fermi from integral to factor of GeV^{-1}
+    return ((FmGeV) * (1 / E) * k_f_drift
+            * (3 * np.log(E/mu)
+               * (u_perp / (1 - u_tau))
+               * (mu**2)
+               * inv_lambda_val))
 
-    # Get parton coordinates
-    point = parton.coords3(time=time)
-    p_rho, p_phi = parton.polar_mom_coords()
-    E = parton.p_T()
-    beta = parton.beta()
+# Batched integrand for mean flow-grad_uT drift
+def flowgrad_T_integrand_batch(E, T, u_perp, u_tau, grad_perp_temp, gluon, time, t0, g=None):
+    FmGeV = 1/0.19732687
+    mu = mu_DeBye(T=T, g=g)
+    inv_lambda_val = inv_lambda_batch(T, gluon, g=g)
 
-    # Average medium parameters
-    T = utilities.dtau_avg(func=event.temp, point=point, phi=p_phi, dtau=config.jet.DTAU, beta=beta)
-    # Set C_R, "quadratic Casimir of the representation R of SU(3) for the parton"
-    if parton.part == 'g':
-        # For a gluon it's the adjoint representation C_A = N_c = 3
-        CR = 3
+    return - ((FmGeV) * (3 / E) * config.jet.K_FG_DRIFT * (time - t0)
+              * 3 * grad_perp_temp * ((u_perp**2)/((1 - u_tau)**2)) * (1/T)
+              * (mu**2) * inv_lambda_val
+              * np.log(E / mu))
+
+# Batched integrand for mean flow-grad_utau drift
+def flowgrad_utau_integrand_batch(E, T, u_perp, u_tau, grad_perp_u_tau, gluon, time, t0, g=None):
+    FmGeV = 1/0.19732687
+    mu = mu_DeBye(T=T, g=g)
+    inv_lambda_val = inv_lambda_batch(T, gluon, g=g)
+
+    # Source link? -- Converts factor of fermi from integral to factor of GeV^{-1}
+    return - ((FmGeV) * (3 / E) * config.jet.K_FG_DRIFT * (time - t0)
+              * 2 * grad_perp_u_tau * ((u_perp**2)/((1 - u_tau)**3))
+              * (mu**2) * inv_lambda_val
+              * np.log(E / mu))
+
+# Batched integrand for mean flow-grad_uperp drift
+def flowgrad_uperp_integrand_batch(E, T, u_perp, u_tau, grad_perp_u_perp, gluon, time, t0, g=None):
+    FmGeV = 1/0.19732687
+    mu = mu_DeBye(T=T, g=g)
+    inv_lambda_val = inv_lambda_batch(T, gluon, g=g)
+
+    # Source link? -- Converts factor of fermi from integral to factor of GeV^{-1}
+    return - ((FmGeV) * (3 / E) * config.jet.K_FG_DRIFT * (time - t0)
+              * 2 * grad_perp_u_perp * (u_perp/((1 - u_tau)**2))
+              * (mu**2) * inv_lambda_val
+              * np.log(E / mu))
+
+# Batched integrand for energy loss
+# vel is only needed for the BBMG model
+def energy_loss_integrand_batch(E, T, vel, gluon, time, t0, model='BBMG', g=None):
+    if g is None:
+        g = config.constants.G
+    FmGeV = 1/0.19732687
+    mu = mu_DeBye(T=T, g=g)
+    inv_lambda_val = inv_lambda_batch(T, gluon, g=g)
+
+    # Select energy loss model and return appropriate energy loss
+    if model == 'BBMG':
+        # Note that we apply FERMI GeV twice... Once for the t factor, once for the (int dt).
+        return (config.jet.K_BBMG * (-1) * ((FmGeV) ** 2) * (time - t0) * (T ** 3)
+                * zeta(q=-1) * (1 / np.sqrt(1 - (vel**2)))
+                * (1))
+    elif model == 'GLV':
+        # https://inspirehep.net/literature/539404
+        # Note that we apply FERMItoGeV twice... Once for the t factor, once for the (int dt).
+        CR = casimir_batch(gluon)
+
+        # Set alpha_s
+        alphas = (g**2) / (4*np.pi)
+
+        # Calculate and return energy loss per unit length of this step.
+        return (-1)*(CR * alphas / 2) * (((FmGeV) ** 2)
+                                         * (time - t0)
+                                         * (mu**2)
+                                         * inv_lambda_val
+                                         * np.log(E / mu))
     else:
-        # For a quark it's the fundamental representation C_F = 4/3 in QCD
-        CR = 4/3
+        return np.zeros_like(E)
+
+# Batched integrand for collisional energy loss
+# https://journals.aps.org/prd/pdf/10.1103/PhysRevD.44.R2625
+def coll_energy_loss_integrand_batch(E, T, gluon, g=None):
+    if g is None:
+        g = config.constants.G
+    FmGeV = 1/0.19732687
+    nf = 2  # Source?
+    CR = casimir_batch(gluon)
 
     # Set alpha_s
-    ALPHAS = (config.constants.G**2) / (4*np.pi)
+    ALPHAS = (g**2) / (4*np.pi)
 
     # Calculate and return energy loss per unit length of this step.
-    mg = (config.constants.G * T / np.sqrt(3)) * np.sqrt(1 + (nf / 6))  # Thermal gluon mass, see paper
+    mg = (g * T / np.sqrt(3)) * np.sqrt(1 + (nf / 6))  # Thermal gluon mass, see paper
     return (-1) * FmGeV * CR * (3 / 4) * (8 * np.pi * (ALPHAS ** 2) / 3) * (1 + (nf / 6)) * (T ** 2) * np.log(
         (2 ** (nf / (2 * (6 + nf)))) * 0.920 * (np.sqrt(E * T) / mg))
 
+# Batched modification factor for energy loss due to gradients of temperature
+def fg_T_qhat_mod_factor_batch(T, u_perp, u_tau, grad_perp_temp, time, t0):
+    return (-1) * (time - t0) * (3 * grad_perp_temp * (u_perp / (1-u_tau)) * (1/T))
+
+# Batched modification factor for energy loss due to gradients of utau
+def fg_utau_qhat_mod_factor_batch(u_perp, u_tau, grad_perp_u_tau, time, t0):
+    return (-1) * (time - t0) * (grad_perp_u_tau * (u_perp / ((1-u_tau)**2)))
+
+# Batched modification factor for energy loss due to gradients of uperp
+def fg_uperp_qhat_mod_factor_batch(u_tau, grad_perp_u_perp, time, t0):
+    return (-1) * (time - t0) * (grad_perp_u_perp * (1 / (1-u_tau)))
@@ -5,7 +5,7 @@ import config
 
 # Function to generate a pp hard scattering at sqrt(s) = 5.02 TeV
 def scattering(pThatmin=config.jet.PTHATMIN, pThatmax=config.jet.PTHATMAX, do_shower=config.jet.PROCESS_CORRECTIONS,
-               type="dijet", min_pt=1):
+               type="dijet", min_pt=1, seed=None):
     ############
     # Settings #
     ############
@@ -58,9 +58,12 @@ def scattering(pThatmin=config.jet.PTHATMIN, pThatmax=config.jet.PTHATMAX, do_sh
     #################
     pythia_process = pythia8.Pythia("", False)  # Print header = False
 
-    # Use seed based on time
+    # Use seed based on time, unless one is given
     pythia_process.readString("Random:setSeed = on")
-    pythia_process.readString("Random:seed = 0")
+    if seed is None:
+        pythia_process.readString("Random:seed = 0")
+    else:
+        pythia_process.readString("Random:seed = {}".format(int(seed)))
 
     # # Set beam energy - in GeV
     pythia_process.readString("Beams:eCM = {}".format(config.constants.ROOT_S))
@@ -0,0 +1,193 @@
+import os
+import numpy as np
+import argparse
+import multiprocessing
+import generate_e_loss_tables as gen
+import plasma_interaction as pi
+from scipy.interpolate import RegularGridInterpolator
+
+"""
+This file builds the tabulated energy loss values in the 'e_loss_tables' folder on adaptively refined grids.
+Starting from a coarse (E, T, L) grid, every interval of every axis is tested by computing fresh integrals at its
+midpoint, on a few lines through the grid, and the interval is split wherever linear interpolation of the table
+misses them by more than the tolerance. Refinement repeats until every interval passes.
+The grid stays rectilinear and is shared by every table built together, so the tables are written in the usual
+format -- read by plasma_interaction.num_eloss_interpolator, and combinable across couplings.
+Every integral computed is saved in 'e_loss_tables/shards', so a killed run picks up where it left off.
+"""
+
+
+# Function to return the midpoint of an axis interval -- logarithmic, except for intervals starting at zero
+def midpoint(lower, upper):
+    if lower > 0:
+        return np.sqrt(lower * upper)
+    return (lower + upper) / 2
+
+
+# Function to return up to num_probes node indices spread evenly along an axis of num_nodes nodes
+def probe_indices(num_nodes, num_probes):
+    return np.unique(np.round(np.linspace(0, num_nodes - 1, num_probes)).astype(int))
+
+
+# Function to return the path of the saved integrals of the table for the parton type at the coupling
+def cache_path(parton, coupling):
+    return 'e_loss_tables/shards/g{}_deltaE_samples_{}_{}subdiv_adaptive.npz'.format(float(coupling), parton,
+                                                                                     gen.subdiv)
+
+
+# Function to load the saved integrals of the table for the parton type at the coupling
+# Returns a dictionary from each (E, T, L) point to its delta E
+def load_cache(parton, coupling):
+    if not os.path.exists(cache_path(parton, coupling)):
+        return {}
+    saved = np.load(cache_path(parton, coupling))
+    return {tuple(point): value for point, value in zip(saved['points'].tolist(), saved['delta_E_vals'])}
+
+
+# Function to save the integrals of the table for the parton type at the coupling
+def save_cache(parton, coupling, cache):
+    os.makedirs(os.path.dirname(cache_path(parton, coupling)), exist_ok=True)
+    points = np.array(list(cache.keys())).reshape(-1, 3)
+    temp_path = cache_path(parton, coupling)[:-len('.npz')] + '.tmp.npz'
+    np.savez(temp_path, points=points, delta_E_vals=np.array(list(cache.values())))
+    os.replace(temp_path, cache_path(parton, coupling))
+
+
+# Function to compute delta E at a single point for the parton type at the coupling
+def run_point(task):
+    parton, coupling, point = task
+    return gen.delta_E(*point, parton=parton, coupling=coupling)
+
+
+# Function to compute delta E at the given points for every table, skipping points already computed
+# Returns the number of integrals computed
+def compute_points(points, tables, caches, pool=None):
+    tasks = []
+    for table in tables:
+        for point in dict.fromkeys(tuple(point) for point in points):
+            if point not in caches[table]:
+                tasks.append((table[0], table[1], point))
+    if len(tasks) == 0:
+        return 0
+
+    if pool is None:
+        results = [run_point(task) for task in tasks]
+    else:
+        results = pool.map(run_point, tasks, chunksize=1)
+    for (parton, coupling, point), value in zip(tasks, results):
+        caches[(parton, coupling)][point] = value
+    for table in tables:
+        save_cache(table[0], table[1], caches[table])
+    return len(tasks)
+
+
+# Function to return the points of the rectilinear grid on the given axes, in the order of its flattened values
+def grid_points(axes):
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return np.column_stack([values.ravel() for values in mesh])
+
+
+# Function to refine the axes of the tables until linear interpolation meets the tolerance at every test point
+# An interval is failed when |interpolated - integral| > atol + rtol * |integral| for any table.
+# Axes stop refining once they reach max_points.
+# Returns the refined axes and the number of integrals computed
+def refine_axes(axes, tables, caches, rtol, atol, num_probes=3, max_points=64, pool=None):
+    axes = [np.array(axis, dtype=float) for axis in axes]
+    num_integrals = 0
+    while True:
+        # Compute the table on the current grid
+        points = grid_points(axes)
+        num_integrals += compute_points(points, tables, caches, pool=pool)
+        interps = {table: RegularGridInterpolator(axes, np.array([caches[table][tuple(point)] for point in points])
+                                                  .reshape([len(axis) for axis in axes]))
+                   for table in tables}
+
+        # Test the midpoint of every interval of every axis, on a few grid lines along that axis
+        candidates = []
+        for axis_num, axis in enumerate(axes):
+            if len(axis) >= max_points:
+                continue
+            probes = [axes[other][probe_indices(len(axes[other]), num_probes)] if other != axis_num else None
+                      for other in range(len(axes))]
+            for i in range(len(axis) - 1):
+                probes[axis_num] = np.array([midpoint(axis[i], axis[i + 1])])
+                candidates.append((axis_num, probes[axis_num][0], grid_points(probes)))
+        if len(candidates) == 0:
+            break
+        num_integrals += compute_points(np.concatenate([test_points for _, _, test_points in candidates]), tables,
+                                        caches, pool=pool)
+
+        # Split the intervals that fail the tolerance
+        splits = [[] for axis in axes]
+        for axis_num, split_point, test_points in candidates:
+            for table in tables:
+                integrals = np.array([caches[table][tuple(point)] for point in test_points])
+                if np.any(np.abs(interps[table](test_points) - integrals) > atol + rtol * np.abs(integrals)):
+                    splits[axis_num].append(split_point)
+                    break
+        if all(len(axis_splits) == 0 for axis_splits in splits):
+            break
+        for axis_num, axis_splits in enumerate(splits):
+            axis_splits = axis_splits[:max_points - len(axes[axis_num])]
+            axes[axis_num] = np.sort(np.concatenate([axes[axis_num], axis_splits]))
+        print('Refined grid to {} points'.format(' x '.join(str(len(axis)) for axis in axes)))
+
+    return axes, num_integrals
+
+
+if __name__ == '__main__':
+    # Define command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--coupling", type=float, nargs='+',
+                        default=[1.6, 1.7, 1.8, 1.9, 2.0, 2.1, 2.2, 2.3, 2.4, 2.5, 2.6],
+                        help="couplings to generate, e.g. 2.0 2.1")
+    parser.add_argument("-p", "--parton", nargs='+', default=['q', 'g'], help="parton types to generate")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-n", "--start_points", type=int, default=5, help="number of points on each starting axis")
+    parser.add_argument("-m", "--max_points", type=int, default=64, help="maximum number of points on each axis")
+    parser.add_argument("-r", "--rtol", type=float, default=0.05, help="relative interpolation tolerance")
+    parser.add_argument("-a", "--atol", type=float, default=1e-3, help="absolute interpolation tolerance [GeV]")
+    parser.add_argument("--probes", type=int, default=3, help="number of test lines along each other axis")
+    parser.add_argument("-c", "--combine", action="store_true",
+                        help="combine the tables of every coupling into the (E, T, L, g) tables afterwards")
+
+    # Get command line arguments
+    args = parser.parse_args()
+
+    # Start from coarse axes over the same ranges as the fixed tables
+    start_axes = [np.logspace(np.log10(gen.E_points[0]), np.log10(gen.E_points[-1]), args.start_points),
+                  np.logspace(np.log10(gen.T_points[0]), np.log10(gen.T_points[-1]), args.start_points),
+                  np.concatenate([np.array([0.0]), np.logspace(np.log10(gen.L_points[1]), np.log10(gen.L_points[-1]),
+                                                               args.start_points)])]
+
+    tables = [(parton, coupling) for parton in args.parton for coupling in args.coupling]
+    caches = {table: load_cache(*table) for table in tables}
+
+    if args.workers > 1:
+        with multiprocessing.get_context('fork').Pool(processes=args.workers) as pool:
+            axes, num_integrals = refine_axes(start_axes, tables, caches, rtol=args.rtol, atol=args.atol,
+                                              num_probes=args.probes, max_points=args.max_points, pool=pool)
+    else:
+        axes, num_integrals = refine_axes(start_axes, tables, caches, rtol=args.rtol, atol=args.atol,
+                                          num_probes=args.probes, max_points=args.max_points)
+
+    num_fixed = len(gen.grid_points) * len(tables)
+    print('Computed {} integrals, against {} for the fixed grids'.format(num_integrals, num_fixed))
+
+    # Write the tables on the refined grid
+    points = grid_points(axes)
+    for parton, coupling in tables:
+        print('Writing table for {} at g={} on {} grid'.format(parton, coupling,
+                                                               ' x '.join(str(len(axis)) for axis in axes)))
+        delta_E_vals = np.array([caches[(parton, coupling)][tuple(point)] for point in points]).reshape(
+            [len(axis) for axis in axes])
+        temp_path = gen.table_path(parton, coupling)[:-len('.npz')] + '.tmp.npz'
+        np.savez(temp_path, E_points=axes[0],
+                 T_points=axes[1],
+                 L_points=axes[2], delta_E_vals=delta_E_vals)
+        os.replace(temp_path, gen.table_path(parton, coupling))
+
+    # Combine the tables of every coupling into one (E, T, L, g) table per parton type
+    if args.combine:
+        print('Combining tables for all couplings')
+        pi.write_combined_eloss_tables()
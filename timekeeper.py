@@ -6,327 +6,624 @@ import config
 import xarray as xr
 from scipy import interpolate
 import os
+import copy
 import traceback
 import utilities
 
 
-def evolve(event, parton, drift=True, el=True, fg=True, fgqhat=False, cel=False, scale_drift=1, scale_el=1, el_model='GLV',
-           temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO):
-    parton_dataframe = pd.DataFrame({})  # Empty dataframe to return in case of issue.
-    # If using numerical energy loss, summon the interpolator
-    if el_model == 'num_GLV':
-        el_rate_interp = pi.num_eloss_interpolator()
-        el_num = True
-    else:
-        el_num = False
+# Integer codes for the phase seen by a parton in each step
+PHASE_QGP = 0
+PHASE_HRG = 1
+PHASE_UNH = 2
+PHASE_VAC = 3
+PHASE_UNKNOWN = -1
+PHASE_NAMES = np.array(['qgp', 'hrg', 'unh', 'vac'])
 
-    #############
-    # Time Loop #
-    #############
-    # Set loop parameters
-    dtau = config.jet.DTAU  # dt for time loop in fm
-    tau = event.t0  # Set current time in fm to initial time
+# Momentum transfers a parton picks up over a step in the QGP
+QGP_TRANSFERS = ['q_el', 'q_cel', 'q_drift', 'q_fg_utau', 'q_fg_uperp', 'q_fg_utau_qhat', 'q_fg_uperp_qhat']
 
-    # Initialize counters & values
-    t_qgp = -1
-    t_hrg = -1
-    t_unhydro = -1
-    qgp_time_total = 0
-    hrg_time_total = 0
-    unhydro_time_total = 0
-    maxT = 0
-    q_el_total = 0
-    q_cel_total = 0
-    q_drift_total = 0
-    q_drift_abs_total = 0
-    q_fg_utau_total = 0
-    q_fg_utau_abs_total = 0
-    q_fg_uperp_total = 0
-    q_fg_uperp_abs_total = 0
-    q_fg_utau_qhat_total = 0
-    q_fg_utau_qhat_abs_total = 0
-    q_fg_uperp_qhat_total = 0
-    q_fg_uperp_qhat_abs_total = 0
+# Step-by-step quantities kept in a parton trajectory
+TRAJECTORY_FIELDS = [('time', np.float64), ('x', np.float64), ('y', np.float64),
+                     ('q_drift', np.float64), ('q_el', np.float64), ('q_cel', np.float64),
+                     ('q_fg_utau', np.float64), ('q_fg_uperp', np.float64),
+                     ('q_fg_utau_qhat', np.float64), ('q_fg_uperp_qhat', np.float64),
+                     ('pT', np.float64), ('temp', np.float64), ('grad_perp_temp', np.float64),
+                     ('grad_perp_utau', np.float64), ('grad_perp_uperp', np.float64),
+                     ('u_perp', np.float64), ('u_par', np.float64), ('u', np.float64),
+                     ('phase', np.int8)]
 
-    # Initialize flags
-    first = True
-    qgp_first = True
-    hrg_first = True
-    unhydro_first = True
-    phase = None
-    extinguished = False
-
-    # Initialize jet info storage arrays
-    time_array = np.array([])
-    xpos_array = np.array([])
-    ypos_array = np.array([])
-    q_drift_array = np.array([])
-    q_el_array = np.array([])
-    q_cel_array = np.array([])
-    q_fg_utau_array = np.array([])
-    q_fg_uperp_array = np.array([])
-    q_fg_utau_qhat_array = np.array([])
-    q_fg_uperp_qhat_array = np.array([])
-    pT_array = np.array([])
-    temp_seen_array = np.array([])
-    grad_perp_T_seen_array = np.array([])
-    grad_perp_utau_seen_array = np.array([])
-    grad_perp_uperp_seen_array = np.array([])
-    u_perp_array = np.array([])
-    u_par_array = np.array([])
-    u_array = np.array([])
-    phase_array = np.array([])
 
-    # Set failsafe values
-    rho_final = 0
-    phi_final = 0
-    pT_final = 0
+# Preallocated storage for the step-by-step trajectory of a parton
+# Buffers are sized for the number of steps between t0 and tf (or a given capacity) up front,
+# and grow geometrically should a trajectory ever need more steps than that.
+class trajectory_buffer:
+    def __init__(self, t0, tf, dtau, fields=TRAJECTORY_FIELDS, growth=2, capacity=None):
+        self.length = 0
+        self.growth = growth
+        if capacity is None:
+            capacity = int(np.ceil((tf - t0) / dtau)) + 2
+        self.capacity = max(int(capacity), 1)
+        self.arrays = {}
+        for name, dtype in fields:
+            self.arrays[name] = np.empty(self.capacity, dtype=dtype)
 
-    # If we want to produce hard scattering at t=0, we should propagate the partons
-    # in the time before thermalization...
-    parton.prop(tau=(tau - config.jet.TAU_PROD))
+    # Method to add one step's values to the buffers
+    def append(self, **values):
+        if self.length == self.capacity:
+            self.grow()
+        for name, value in values.items():
+            # Interpolator outputs come back as length-1 arrays
+            self.arrays[name][self.length] = np.ravel(value)[0]
+        self.length += 1
 
+    # Method to enlarge the buffers, keeping the steps recorded so far
+    def grow(self):
+        self.capacity = int(self.capacity * self.growth)
+        for name, array in self.arrays.items():
+            new_array = np.empty(self.capacity, dtype=array.dtype)
+            new_array[:self.length] = array[:self.length]
+            self.arrays[name] = new_array
 
-    # Initiate loop
-    logging.info('Initiating time loop...')
-    while True:
-        #logging.info('t = {}'.format(t))
-        #####################
-        # Initial Step Only #
-        #####################
-        if first:
-            # Good luck!
-            first = False
+    # Return the recorded steps of a given quantity
+    def __getitem__(self, name):
+        return self.arrays[name][:self.length]
 
-        #########################
-        # Set Current Step Data #
-        #########################
-        # Decide if we're in bounds of the grid
-        if parton.x > event.xmax or parton.y > event.ymax or parton.x < event.xmin or parton.y < event.ymin:
-            logging.info('Parton escaped event space...')
-            exit_code = 0
-            break
-        elif tau > event.tf:
-            logging.info('Parton escaped event time...')
-            if phase == 'qgp':
-                exit_code = 3
-            else:
-                exit_code = 2
-            break
+    def __len__(self):
+        return self.length
 
-        # Record p_T at beginning of step for extinction check
-        parton_og_p_T = parton.p_T()
 
-        # For timekeeping in phases, we approximate all time in one step as in one phase
-        parton_point = parton.coords3(time=tau)
-        parton_p_rho, parton_p_phi = parton.polar_mom_coords()
-        beta = parton.beta()
-
-        temp = utilities.dtau_avg(func=event.temp, point=parton_point, phi=parton_p_phi, dtau=config.jet.DTAU, beta=beta) #event.temp(parton_point)
-        grad_perp_T = utilities.dtau_avg(func=lambda x: event.grad_perp_T(point=x, phi=parton_p_phi),
-                                          point=parton_point, phi=parton_p_phi, dtau=config.jet.DTAU, beta=beta)  #event.grad_perp_T(point=parton_point, phi=parton_p_phi)
-        grad_perp_utau = utilities.dtau_avg(func=lambda x: event.grad_perp_u_par(point=x, phi=parton_p_phi),
-                                          point=parton_point, phi=parton_p_phi, dtau=config.jet.DTAU, beta=beta)  #event.grad_perp_u_par(point=parton_point, phi=parton_p_phi)
-        grad_perp_uperp = utilities.dtau_avg(func=lambda x: event.grad_perp_u_perp(point=x, phi=parton_p_phi),
-                                          point=parton_point, phi=parton_p_phi, dtau=config.jet.DTAU, beta=beta)  #event.grad_perp_u_perp(point=parton_point, phi=parton_p_phi)
-        u_perp = event.u_perp(point=parton_point, phi=parton_p_phi)
-        u_par = utilities.dtau_avg(func=lambda x: event.u_par(point=x, phi=parton_p_phi), point=parton_point, phi=parton_p_phi,
-                               dtau=config.jet.DTAU, beta=beta)
-        u = utilities.dtau_avg(func=event.vel, point=parton_point, phi=parton_p_phi, dtau=config.jet.DTAU, beta=beta)  #event.vel(parton_point)
+# Summary quantities kept for each evolved parton, in results dataframe column order
+PARTON_COLUMNS = [('partonNo', np.int64), ('tag', np.int64), ('weight', np.float64), ('AA_weight', np.float64),
+                  ('id', np.int64), ('pt_0', np.float64), ('pt_f', np.float64),
+                  ('q_el', np.float64), ('q_cel', np.float64), ('q_drift', np.float64), ('q_drift_abs', np.float64),
+                  ('q_fg_utau', np.float64), ('q_fg_utau_abs', np.float64),
+                  ('q_fg_uperp', np.float64), ('q_fg_uperp_abs', np.float64),
+                  ('q_fg_utau_qhat', np.float64), ('q_fg_utau_qhat_abs', np.float64),
+                  ('q_fg_uperp_qhat', np.float64), ('q_fg_uperp_qhat_abs', np.float64),
+                  ('extinguished', np.bool_), ('x_0', np.float64), ('y_0', np.float64),
+                  ('phi_0', np.float64), ('phi_f', np.float64),
+                  ('t_qgp', np.float64), ('t_hrg', np.float64), ('t_unhydro', np.float64),
+                  ('time_total_plasma', np.float64), ('time_total_hrg', np.float64),
+                  ('time_total_unhydro', np.float64), ('Tmax_parton', np.float64), ('Tavg_qgp_parton', np.float64),
+                  ('initial_time', np.float64), ('final_time', np.float64), ('dtau', np.float64),
+                  ('n_steps', np.int64), ('n_coarse_steps', np.int64), ('n_refined_steps', np.int64),
+                  ('n_skipped_steps', np.int64),
+                  ('n_mapped_steps', np.int64),
+                  ('drift', np.bool_), ('el', np.bool_), ('cel', np.bool_), ('el_num', np.bool_), ('fg', np.bool_),
+                  ('fgqhat', np.bool_), ('exit', np.int64), ('g', np.float64), ('K_F_DRIFT', np.float64),
+                  ('K_FG_DRIFT', np.float64)]
 
-        # Decide phase
-        if temp > temp_hrg:
-            phase = 'qgp'
-        elif temp < temp_hrg and temp > temp_unh:
-            phase = 'hrg'
-        elif temp < temp_unh and temp > config.transport.hydro.T_SWITCH:
-            phase = 'unh'
+
+# Columnar accumulator for parton results, with a fixed schema of (name, dtype) columns.
+# Rows are appended into preallocated numpy columns, which grow geometrically as needed,
+# and a dataframe is only made once, when all the rows are in.
+# Columns not given when a row is appended are left at nan (float), 0 (int), False (bool) or None (object),
+# and can be filled in later with set.
+class result_builder:
+    def __init__(self, columns=PARTON_COLUMNS, growth=2, capacity=64):
+        self.columns = list(columns)
+        self.length = 0
+        self.growth = growth
+        self.capacity = max(int(capacity), 1)
+        self.arrays = {}
+        for name, dtype in self.columns:
+            self.arrays[name] = self.empty_column(dtype, self.capacity)
+
+    # Method to make a column of the given type, filled with its missing value
+    def empty_column(self, dtype, length):
+        dtype = np.dtype(dtype)
+        if dtype.kind == 'f':
+            return np.full(length, np.nan, dtype=dtype)
+        elif dtype.kind == 'O':
+            return np.full(length, None, dtype=dtype)
         else:
-            phase = 'vac'
+            return np.zeros(length, dtype=dtype)
 
-        #################################
-        # Perform partonic calculations #
-        #################################
+    # Method to add a row, returning its index
+    def append(self, **values):
+        if self.length == self.capacity:
+            self.grow()
+        for name, value in values.items():
+            self.set(self.length, name, value)
+        self.length += 1
+        return self.length - 1
 
-        if phase == 'qgp':
-            # Compute drift, if enabled
-            if drift:
-                # Compute jet drift integrand in this timestep
-                int_drift = pi.drift_integrand(event=event, parton=parton, time=tau)
+    # Method to set the value of a column in an existing row
+    def set(self, index, name, value):
+        array = self.arrays[name]
+        if array.dtype.kind == 'O':
+            # Object columns hold e.g. arrays of fragmentation fractions, stored whole
+            array[index] = value
+        else:
+            # Interpolator outputs may come back as length-1 arrays
+            array[index] = np.ravel(value)[0]
 
-                # Compute jet drift momentum transferred to parton
-                q_drift = float(parton.beta() * dtau * int_drift * scale_drift)
-            else:
-                # Set drift integral and momentum transfer to zero
-                int_drift = 0
-                q_drift = 0
+    # Method to enlarge the columns, keeping the rows recorded so far
+    def grow(self):
+        self.capacity = int(self.capacity * self.growth)
+        for name, dtype in self.columns:
+            new_array = self.empty_column(dtype, self.capacity)
+            new_array[:self.length] = self.arrays[name][:self.length]
+            self.arrays[name] = new_array
 
-            # Compute energy loss, if enabled
-            if el:
-                # Use appropriate energy loss module
-                # Compute energy loss integrand (rate) in this timestep
-                if el_model == 'num_GLV':
-                    int_el = el_rate_interp.eloss_rate(event=event, parton=parton, time=tau)
+    # Method to drop all rows from the given index on
+    def truncate(self, length):
+        for name, dtype in self.columns:
+            self.arrays[name][length:self.length] = self.empty_column(dtype, self.length - length)
+        self.length = min(self.length, length)
 
-                else:
-                    # Compute energy loss integrand (rate) in this timestep
-                    int_el = pi.energy_loss_integrand(event=event, parton=parton, time=tau, tau=dtau,
-                                                      model=el_model)
+    # Method to materialize the rows as a dataframe
+    # broadcast is a dictionary of values shared by every row (e.g. event properties),
+    # which are added as constant columns without being stored for each row.
+    def to_dataframe(self, broadcast=None):
+        data = {name: self.arrays[name][:self.length] for name, dtype in self.columns}
+        if broadcast is not None:
+            for name, value in broadcast.items():
+                data[name] = np.full(self.length, value)
+        return pd.DataFrame(data)
 
+    # Return the recorded rows of a given column
+    def __getitem__(self, name):
+        return self.arrays[name][:self.length]
 
-                # Compute energy loss due to gluon exchange with the medium
-                q_el = float(parton.beta() * dtau * int_el * scale_el)
-            else:
-                # Set energy loss and el integral to zero
-                int_el = 0
-                q_el = 0
-
-            if cel:
-                # Compute energy loss integrand (rate) in this timestep
-                int_cel = pi.coll_energy_loss_integrand(event=event, parton=parton, time=tau)
-                # Compute energy loss due to gluon exchange with the medium
-                q_cel = float(parton.beta() * dtau * int_cel)
-            else:
-                int_cel = 0
-                q_cel = 0
+    def __len__(self):
+        return self.length
 
-            if fg:
-                # Compute mixed flow-gradient drift integrand in this timestep
-                int_fg_utau = pi.flowgrad_utau_integrand(event=event, parton=parton, time=tau)
-                int_fg_uperp = pi.flowgrad_uperp_integrand(event=event, parton=parton, time=tau)
+    # Drop the unused capacity when pickled, e.g. to send results back from a worker process
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['arrays'] = {name: array[:self.length] for name, array in self.arrays.items()}
+        state['capacity'] = max(self.length, 1)
+        return state
 
-                # Compute momentums transferred to parton
-                q_fg_utau = float(parton.beta() * dtau * int_fg_utau)
-                q_fg_uperp = float(parton.beta() * dtau * int_fg_uperp)
-            else:
-                # Set flow-gradient effects and integral to zero
-                int_fg_utau = 0
-                int_fg_uperp = 0
-                q_fg_utau = 0
-                q_fg_uperp = 0
-
-            if fgqhat:
-                # Compute correction to energy loss due to flow-gradient modification
-                int_fg_utau_qhat = int_el * pi.fg_utau_qhat_mod_factor(event=event, parton=parton, time=tau)
-                int_fg_uperp_qhat = int_el * pi.fg_uperp_qhat_mod_factor(event=event, parton=parton, time=tau)
-                q_fg_utau_qhat = float(parton.beta() * dtau * int_fg_utau_qhat * scale_el)
-                q_fg_uperp_qhat = float(parton.beta() * dtau * int_fg_uperp_qhat * scale_el)
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.length == 0:
+            for name, dtype in self.columns:
+                self.arrays[name] = self.empty_column(dtype, self.capacity)
+
+
+# Function to join several result builders with the same columns into one, in order.
+def concatenate_results(builders, columns=PARTON_COLUMNS):
+    builders = list(builders)
+    if len(builders) > 0:
+        columns = builders[0].columns
+    total = sum(len(builder) for builder in builders)
+    joined = result_builder(columns=columns, capacity=total)
+    for name, dtype in joined.columns:
+        if total > 0:
+            joined.arrays[name][:total] = np.concatenate([builder[name] for builder in builders])
+    joined.length = total
+    return joined
+
+
+# Function to decide the phase of a step from its average temperature, as phase_codes
+# Returns the phase code
+def phase_code(temp, temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO):
+    return int(phase_codes(temp, temp_hrg=temp_hrg, temp_unh=temp_unh))
+
+
+# Function to decide the phase of a step from bounds on its average temperature
+# Returns the phase code, or PHASE_UNKNOWN if a phase boundary lies within the bounds.
+def bounded_phase_code(lower, upper, temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO, margin=1e-9):
+    for threshold in [temp_hrg, temp_unh, config.transport.hydro.T_SWITCH]:
+        if lower - margin <= threshold <= upper + margin:
+            return PHASE_UNKNOWN
+    return phase_code(upper, temp_hrg=temp_hrg, temp_unh=temp_unh)
+
+
+# Function to decide the phase of steps from their average temperatures
+# Returns an array of phase codes
+def phase_codes(temp, temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO):
+    temp = np.asarray(temp)
+    return np.select([temp > temp_hrg, (temp < temp_hrg) & (temp > temp_unh),
+                      (temp < temp_unh) & (temp > config.transport.hydro.T_SWITCH)],
+                     [PHASE_QGP, PHASE_HRG, PHASE_UNH], default=PHASE_VAC)
+
+
+# Function to decide the phase of steps from bounds on their average temperatures (see plasma.field_block_map)
+# Returns an array of phase codes, with PHASE_UNKNOWN where a phase boundary lies within the bounds.
+def bounded_phase_codes(lower, upper, temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO, margin=1e-9):
+    codes = phase_codes(upper, temp_hrg=temp_hrg, temp_unh=temp_unh)
+    for threshold in [temp_hrg, temp_unh, config.transport.hydro.T_SWITCH]:
+        codes[(lower - margin <= threshold) & (threshold <= upper + margin)] = PHASE_UNKNOWN
+    return codes
+
+
+# Function to find when a parton moving in a straight line from the given time leaves the event,
+# either by crossing the edge of the spatial grid or by reaching event.tf.
+# Returns the exit time, and an upper bound on the number of time steps of size dtau the parton takes before it.
+def straight_line_exit(event, parton, tau, dtau):
+    rho, phi = parton.polar_mom_coords()
+    v_x = parton.beta() * np.cos(phi)
+    v_y = parton.beta() * np.sin(phi)
+
+    # Time remaining until each boundary is crossed
+    times_left = [event.tf - tau]
+    for v, pos, low, high in [(v_x, parton.x, event.xmin, event.xmax), (v_y, parton.y, event.ymin, event.ymax)]:
+        if v > 0:
+            times_left.append((high - pos) / v)
+        elif v < 0:
+            times_left.append((low - pos) / v)
+    exit_time = tau + max(min(times_left), 0)
+
+    # Leave a couple of steps margin for rounding
+    num_steps = int(np.floor((exit_time - tau) / dtau)) + 2
+
+    return exit_time, num_steps
+
+
+# Function to compute the momentum transferred to partons over steps in the QGP, from their step-averaged medium
+# Works on scalars (one parton, as parton_evolution.step) or arrays (many partons, as evolve_batch) alike.
+# vel is only needed for the BBMG energy loss model, the perp gradients of the flow only with fg or fgqhat,
+# and el_rate_interp only for the num_GLV model.
+# The coupling g and drift factor k_f_drift default to the current config values.
+# Returns a dictionary of the momentum transfers of each effect (zero for those not enabled).
+def qgp_transfers(E, T, beta, gluon, u_perp, u_par, tau, t0, dtau, drift=True, el=True, cel=False, fg=False,
+                  fgqhat=False, scale_drift=1, scale_el=1, el_model='GLV', el_rate_interp=None, vel=None,
+                  grad_perp_utau=None, grad_perp_uperp=None, g=None, k_f_drift=None):
+    zero = np.zeros_like(np.asarray(E, dtype=float))
+    transfers = {name: zero for name in QGP_TRANSFERS}
+
+    # Compute drift, if enabled
+    if drift:
+        int_drift = pi.drift_integrand_batch(E=E, T=T, u_perp=u_perp, u_tau=u_par, gluon=gluon, g=g,
+                                             k_f_drift=k_f_drift)
+        transfers['q_drift'] = beta * dtau * int_drift * scale_drift
+
+    # Compute energy loss, if enabled
+    int_el = zero
+    if el:
+        # Use appropriate energy loss module
+        if el_model == 'num_GLV':
+            L = (2*(tau - t0) + dtau)/2
+            int_el = el_rate_interp.eloss_rate_batch(E=E, T=T, L=L, gluon=gluon)
+        else:
+            int_el = pi.energy_loss_integrand_batch(E=E, T=T, vel=vel, gluon=gluon, time=tau, t0=t0, model=el_model,
+                                                    g=g)
+        transfers['q_el'] = beta * dtau * int_el * scale_el
+
+    # Compute collisional energy loss, if enabled
+    if cel:
+        int_cel = pi.coll_energy_loss_integrand_batch(E=E, T=T, gluon=gluon, g=g)
+        transfers['q_cel'] = beta * dtau * int_cel
+
+    # Compute mixed flow-gradient drift, if enabled
+    if fg:
+        int_fg_utau = pi.flowgrad_utau_integrand_batch(E=E, T=T, u_perp=u_perp, u_tau=u_par,
+                                                       grad_perp_u_tau=grad_perp_utau, gluon=gluon, time=tau, t0=t0,
+                                                       g=g)
+        int_fg_uperp = pi.flowgrad_uperp_integrand_batch(E=E, T=T, u_perp=u_perp, u_tau=u_par,
+                                                         grad_perp_u_perp=grad_perp_uperp, gluon=gluon, time=tau,
+                                                         t0=t0, g=g)
+        transfers['q_fg_utau'] = beta * dtau * int_fg_utau
+        transfers['q_fg_uperp'] = beta * dtau * int_fg_uperp
+
+    # Compute correction to energy loss due to flow-gradient modification, if enabled
+    if fgqhat:
+        int_fg_utau_qhat = int_el * pi.fg_utau_qhat_mod_factor_batch(u_perp=u_perp, u_tau=u_par,
+                                                                     grad_perp_u_tau=grad_perp_utau, time=tau, t0=t0)
+        int_fg_uperp_qhat = int_el * pi.fg_uperp_qhat_mod_factor_batch(u_tau=u_par, grad_perp_u_perp=grad_perp_uperp,
+                                                                       time=tau, t0=t0)
+        transfers['q_fg_utau_qhat'] = beta * dtau * int_fg_utau_qhat * scale_el
+        transfers['q_fg_uperp_qhat'] = beta * dtau * int_fg_uperp_qhat * scale_el
+
+    return transfers
+
+
+# State of a single parton being evolved through the medium.
+# evolve advances one of these in time, while evolve_variants advances several together,
+# sharing medium samples between variants whose partons coincide.
+# record chooses what is kept of the trajectory:
+# 'full' -- step-by-step xarray record, 'summary' -- dict of running trajectory accumulators only, 'off' -- nothing.
+# G and K_F_DRIFT default to the current config values.
+# stepping chooses the time steps taken:
+# 'fixed' -- every step is config.jet.DTAU, 'adaptive' -- outside of the QGP, steps grow geometrically up to max_dtau.
+# Adaptive steps are refined (halved) if they would leave the medium or come within refine_margin of temp_hrg.
+# With vacuum_skip, once outside of the QGP the medium along the rest of the parton's straight path is sampled at once,
+# and any steps before the parton next reaches the QGP (or leaves the event) are accounted for without stepping.
+# This is skipped when keeping a full record, which needs every step.
+# Steps whose phase is certain from the event's coarse temperature map (see plasma.field_block_map), outside of the
+# QGP and below the hottest temperature seen so far, are accounted for without sampling the medium at all.
+class parton_evolution:
+    def __init__(self, event, parton, drift=True, el=True, fg=True, fgqhat=False, cel=False, scale_drift=1, scale_el=1,
+                 el_model='GLV', temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO, record='full',
+                 G=None, K_F_DRIFT=None, el_rate_interp=None, stepping=config.jet.STEPPING,
+                 max_dtau=config.jet.MAX_DTAU, refine_margin=config.jet.REFINE_MARGIN, vacuum_skip=True):
+        if record not in ['full', 'summary', 'off']:
+            raise ValueError('Unknown record mode: {}'.format(record))
+        if stepping not in ['fixed', 'adaptive']:
+            raise ValueError('Unknown stepping mode: {}'.format(stepping))
+        self.event = event
+        self.parton = parton
+        self.drift = drift
+        self.el = el
+        self.fg = fg
+        self.fgqhat = fgqhat
+        self.cel = cel
+        self.scale_drift = scale_drift
+        self.scale_el = scale_el
+        self.el_model = el_model
+        self.temp_hrg = temp_hrg
+        self.temp_unh = temp_unh
+        self.record = record
+        self.stepping = stepping
+        self.refine_margin = refine_margin
+        self.vacuum_skip = vacuum_skip
+
+        # Physics parameters of this evolution
+        if G is None:
+            G = config.constants.G
+        if K_F_DRIFT is None:
+            K_F_DRIFT = config.jet.K_F_DRIFT
+        self.G = G
+        self.K_F_DRIFT = K_F_DRIFT
+
+        # If using numerical energy loss, summon the interpolator
+        if el_model == 'num_GLV':
+            if el_rate_interp is None:
+                el_rate_interp = pi.cached_num_eloss_interpolator(g=G)
+            self.el_rate_interp = el_rate_interp
+            self.el_num = True
+        else:
+            self.el_rate_interp = None
+            self.el_num = False
+
+        # Set loop parameters
+        self.dtau = config.jet.DTAU  # dt for time loop in fm
+        self.tau = event.t0  # Set current time in fm to initial time
+
+        # Adaptive steps are whole multiples of dtau, so they stay on the fixed step time grid
+        self.max_step_factor = max(int(np.floor(max_dtau / self.dtau + 1e-9)), 1)
+        self.step_factor = 1
+
+        # Initialize counters & values
+        self.t_qgp = -1
+        self.t_hrg = -1
+        self.t_unhydro = -1
+        self.qgp_time_total = 0
+        self.hrg_time_total = 0
+        self.unhydro_time_total = 0
+        self.maxT = 0
+        self.q_el_total = 0
+        self.q_cel_total = 0
+        self.q_drift_total = 0
+        self.q_drift_abs_total = 0
+        self.q_fg_utau_total = 0
+        self.q_fg_utau_abs_total = 0
+        self.q_fg_uperp_total = 0
+        self.q_fg_uperp_abs_total = 0
+        self.q_fg_utau_qhat_total = 0
+        self.q_fg_utau_qhat_abs_total = 0
+        self.q_fg_uperp_qhat_total = 0
+        self.q_fg_uperp_qhat_abs_total = 0
+
+        # Initialize flags
+        self.qgp_first = True
+        self.hrg_first = True
+        self.unhydro_first = True
+        self.phase = None
+        self.extinguished = False
+        self.done = False
+        self.exit_code = None
+
+        # Initialize trajectory accumulators
+        self.num_steps = 0
+        self.coarse_steps = 0
+        self.refined_steps = 0
+        self.skipped_steps = 0
+        self.mapped_steps = 0
+        self.qgp_steps = 0
+        self.qgp_temp_total = 0
+        self.temp_total = 0
+
+        # Set failsafe values
+        self.rho_final = 0
+        self.phi_final = 0
+        self.pT_final = 0
+
+        # If we want to produce hard scattering at t=0, we should propagate the partons
+        # in the time before thermalization...
+        self.parton.prop(tau=(self.tau - config.jet.TAU_PROD))
+
+        # Initialize jet info storage buffers -- only kept for a full record
+        # Sized for the steps until the parton would leave the event on a straight line
+        if record == 'full':
+            exit_time, exit_steps = straight_line_exit(event=event, parton=self.parton, tau=self.tau,
+                                                       dtau=self.dtau)
+            self.trajectory = trajectory_buffer(t0=event.t0, tf=event.tf, dtau=self.dtau, capacity=exit_steps)
+        else:
+            self.trajectory = None
+
+    # Method to check if the parton has left the event in space or time
+    # Returns True once the evolution is complete.
+    def check_exit(self):
+        # Decide if we're in bounds of the grid
+        if self.done:
+            pass
+        elif self.parton.x > self.event.xmax or self.parton.y > self.event.ymax or self.parton.x < self.event.xmin or self.parton.y < self.event.ymin:
+            logging.info('Parton escaped event space...')
+            self.exit_code = 0
+            self.done = True
+        elif self.tau > self.event.tf:
+            logging.info('Parton escaped event time...')
+            if self.phase == 'qgp':
+                self.exit_code = 3
             else:
-                # Set correction to energy loss due to flow-gradient modification to zero
-                int_fg_utau_qhat = 0
-                int_fg_uperp_qhat = 0
-                q_fg_utau_qhat = 0
-                q_fg_uperp_qhat = 0
+                self.exit_code = 2
+            self.done = True
+
+        return self.done
+
+    # Method to advance the parton by one time step
+    # A medium sample of this step may be supplied, otherwise one is made.
+    def step(self, sample=None):
+        # Record p_T at beginning of step for extinction check
+        parton_og_p_T = self.parton.p_T()
+
+        # Skip ahead through any steps outside of the QGP
+        skipped = False
+        if self.vacuum_skip and self.trajectory is None and self.phase is not None and self.phase != 'qgp':
+            skipped = self.skip_vacuum()
+            if skipped:
+                sample = None
+                if self.exited():
+                    return
 
+        # Choose the size of this step
+        step_dtau = self.dtau
+        if self.stepping == 'adaptive' and not skipped and self.phase is not None and self.phase != 'qgp':
+            step_dtau, coarse_sample = self.coarse_step()
+            if coarse_sample is not None:
+                sample = coarse_sample
+
+        # Steps whose phase is certain from the coarse temperature map of the event need no medium sample
+        if sample is None:
+            code = self.mapped_phase()
+            if code is not None:
+                self.mapped_step(code)
+                return
+
+        # For timekeeping in phases, we approximate all time in one step as in one phase
+        # Sample the medium along this step once, for use by all of the interaction integrands
+        if sample is None:
+            sample = pi.medium_sample(event=self.event, parton=self.parton, time=self.tau, dtau=self.dtau)
+        temp = sample.T()
+        u_perp = sample.u_perp_point()
+        u_par = sample.u_par()
+        u = sample.vel()
+
+        # Gradients are only needed for the full trajectory record
+        if self.trajectory is not None:
+            grad_perp_T = sample.grad_perp_T()
+            grad_perp_utau = sample.grad_perp_u_par()
+            grad_perp_uperp = sample.grad_perp_u_perp()
         else:
-            # If not in QGP, don't compute any parton-medium interactions
-            # If you wanted to add some effects in other phases, they should be computed here
-            int_el = 0
-            q_el = 0
+            grad_perp_T = 0
+            grad_perp_utau = 0
+            grad_perp_uperp = 0
 
-            int_cel = 0
-            q_cel = 0
+        # Decide phase
+        code = phase_code(temp, temp_hrg=self.temp_hrg, temp_unh=self.temp_unh)
+        self.phase = str(PHASE_NAMES[code])
 
-            int_drift = 0
-            q_drift = 0
+        # Adaptive steps start small again after any QGP step
+        if self.phase == 'qgp':
+            self.step_factor = 1
 
-            int_fg_utau = 0
-            int_fg_uperp = 0
-            q_fg_utau = 0
-            q_fg_uperp = 0
+        #################################
+        # Perform partonic calculations #
+        #################################
 
-            int_fg_utau_qhat = 0
-            int_fg_uperp_qhat = 0
-            q_fg_utau_qhat = 0
-            q_fg_uperp_qhat = 0
+        if self.phase == 'qgp':
+            gradients = self.fg or self.fgqhat
+            transfers = qgp_transfers(E=self.parton.p_T(), T=temp, beta=self.parton.beta(),
+                                      gluon=self.parton.part == 'g', u_perp=sample.u_perp(), u_par=u_par,
+                                      tau=self.tau, t0=self.event.t0, dtau=self.dtau, drift=self.drift, el=self.el,
+                                      cel=self.cel, fg=self.fg, fgqhat=self.fgqhat, scale_drift=self.scale_drift,
+                                      scale_el=self.scale_el, el_model=self.el_model,
+                                      el_rate_interp=self.el_rate_interp,
+                                      vel=sample.vel() if self.el_model == 'BBMG' else None,
+                                      grad_perp_utau=sample.grad_perp_u_par() if gradients else None,
+                                      grad_perp_uperp=sample.grad_perp_u_perp() if gradients else None,
+                                      g=self.G, k_f_drift=self.K_F_DRIFT)
+            q_el, q_cel, q_drift, q_fg_utau, q_fg_uperp, q_fg_utau_qhat, q_fg_uperp_qhat = [
+                float(transfers[name]) for name in QGP_TRANSFERS]
+
+        else:
+            # If not in QGP, don't compute any parton-medium interactions
+            # If you wanted to add some effects in other phases, they should be computed here
+            q_el, q_cel, q_drift, q_fg_utau, q_fg_uperp, q_fg_utau_qhat, q_fg_uperp_qhat = [0] * len(QGP_TRANSFERS)
 
         ###################
         # Data Accounting #
         ###################
         # Log momentum transfers
-        q_el_total += q_el
-        q_cel_total += q_cel
-        q_drift_total += q_drift
-        q_drift_abs_total += np.abs(q_drift)
+        self.q_el_total += q_el
+        self.q_cel_total += q_cel
+        self.q_drift_total += q_drift
+        self.q_drift_abs_total += np.abs(q_drift)
         #q_fg_T_total += q_fg_T
         #q_fg_T_abs_total += np.abs(q_fg_T)
-        q_fg_utau_total += q_fg_utau
-        q_fg_utau_abs_total += np.abs(q_fg_utau)
-        q_fg_uperp_total += q_fg_uperp
-        q_fg_uperp_abs_total += np.abs(q_fg_uperp)
-        q_fg_utau_qhat_total += q_fg_utau_qhat
-        q_fg_utau_qhat_abs_total += np.abs(q_fg_utau_qhat)
-        q_fg_uperp_qhat_total += q_fg_uperp_qhat
-        q_fg_uperp_qhat_abs_total += np.abs(q_fg_uperp_qhat)
+        self.q_fg_utau_total += q_fg_utau
+        self.q_fg_utau_abs_total += np.abs(q_fg_utau)
+        self.q_fg_uperp_total += q_fg_uperp
+        self.q_fg_uperp_abs_total += np.abs(q_fg_uperp)
+        self.q_fg_utau_qhat_total += q_fg_utau_qhat
+        self.q_fg_utau_qhat_abs_total += np.abs(q_fg_utau_qhat)
+        self.q_fg_uperp_qhat_total += q_fg_uperp_qhat
+        self.q_fg_uperp_qhat_abs_total += np.abs(q_fg_uperp_qhat)
 
         # Check for max temperature
-        if temp > maxT:
-            maxT = temp  #[0]
+        # The average over a coarse step hides the hottest fixed step within it, so look at those instead --
+        # unless the QGP has been reached, as every coarse step is cooler than temp_hrg.
+        if step_dtau > self.dtau and self.maxT < self.temp_hrg:
+            step_maxT = np.amax(self.sub_step_temps(step_dtau))
+        else:
+            step_maxT = temp
+        if step_maxT > self.maxT:
+            self.maxT = step_maxT  #[0]
 
         # Decide phase for categorization & timekeeping
-        if phase == 'qgp':
-            if qgp_first:
-                t_qgp = tau
-                qgp_first = False
+        if self.phase == 'qgp':
+            if self.qgp_first:
+                self.t_qgp = self.tau
+                self.qgp_first = False
 
-            qgp_time_total += dtau
+            self.qgp_time_total += step_dtau
 
         # Decide phase for categorization & timekeeping
-        if phase == 'hrg':
-            if hrg_first:
-                t_hrg = tau
-                hrg_first = False
-
-            hrg_time_total += dtau
-
-        if phase == 'unh':
-            if unhydro_first:
-                t_unhydro = tau
-                unhydro_first = False
-
-            unhydro_time_total += dtau
-
-        # Record arrays of values from this step for the parton record
-        time_array = np.append(time_array, tau)
-        xpos_array = np.append(xpos_array, parton.x)
-        ypos_array = np.append(ypos_array, parton.y)
-        q_drift_array = np.append(q_drift_array, q_drift)
-        q_el_array = np.append(q_el_array, q_el)
-        q_cel_array = np.append(q_cel_array, q_cel)
-        #q_fg_T_array = np.append(q_fg_T_array, q_fg_T)
-        q_fg_utau_array = np.append(q_fg_utau_array, q_fg_utau)
-        q_fg_uperp_array = np.append(q_fg_uperp_array, q_fg_uperp)
-        q_fg_utau_qhat_array = np.append(q_fg_utau_qhat_array, q_fg_utau_qhat)
-        q_fg_uperp_qhat_array = np.append(q_fg_uperp_qhat_array, q_fg_uperp_qhat)
-        pT_array = np.append(pT_array, parton.p_T())
-        temp_seen_array = np.append(temp_seen_array, temp)
-        grad_perp_T_seen_array = np.append(grad_perp_T_seen_array, grad_perp_T)
-        grad_perp_utau_seen_array = np.append(grad_perp_utau_seen_array, grad_perp_utau)
-        grad_perp_uperp_seen_array = np.append(grad_perp_uperp_seen_array, grad_perp_uperp)
-        u_perp_array = np.append(u_perp_array, u_perp)
-        u_par_array = np.append(u_par_array, u_par)
-        u_array = np.append(u_array, u)
-        phase_array = np.append(phase_array, phase)
+        if self.phase == 'hrg':
+            if self.hrg_first:
+                self.t_hrg = self.tau
+                self.hrg_first = False
+
+            self.hrg_time_total += step_dtau
+
+        if self.phase == 'unh':
+            if self.unhydro_first:
+                self.t_unhydro = self.tau
+                self.unhydro_first = False
+
+            self.unhydro_time_total += step_dtau
+
+        # Accumulate trajectory summary quantities
+        self.num_steps += 1
+        if step_dtau > self.dtau:
+            self.coarse_steps += 1
+        self.temp_total += float(temp)
+        if self.phase == 'qgp':
+            self.qgp_steps += 1
+            self.qgp_temp_total += float(temp)
+
+        # Record values from this step for the parton record
+        if self.trajectory is not None:
+            self.trajectory.append(time=self.tau, x=self.parton.x, y=self.parton.y, q_drift=q_drift, q_el=q_el,
+                                   q_cel=q_cel, q_fg_utau=q_fg_utau, q_fg_uperp=q_fg_uperp,
+                                   q_fg_utau_qhat=q_fg_utau_qhat, q_fg_uperp_qhat=q_fg_uperp_qhat,
+                                   pT=self.parton.p_T(), temp=temp, grad_perp_temp=grad_perp_T,
+                                   grad_perp_utau=grad_perp_utau, grad_perp_uperp=grad_perp_uperp,
+                                   u_perp=u_perp, u_par=u_par, u=u, phase=code)
 
         ############################
         # Change Parton Parameters #
         ############################
         # Note -- We propagate FIRST in order to travel over the timestep whose medium properties we're averaging.
         # Propagate parton position
-        parton.prop(tau=dtau)
+        self.parton.prop(tau=step_dtau)
 
         # Change parton momentum to reflect energy loss
-        parton.add_q_par(q_par=q_el)
-        parton.add_q_par(q_par=q_cel)
-        parton.add_q_par(q_par=q_fg_utau_qhat)
-        parton.add_q_par(q_par=q_fg_uperp_qhat)
+        self.parton.add_q_par(q_par=q_el)
+        self.parton.add_q_par(q_par=q_cel)
+        self.parton.add_q_par(q_par=q_fg_utau_qhat)
+        self.parton.add_q_par(q_par=q_fg_uperp_qhat)
 
         # Change parton momentum to reflect drift effects
         # If not computed, q values go to zero.
-        parton.add_q_perp(q_perp=q_drift)
+        self.parton.add_q_perp(q_perp=q_drift)
         #parton.add_q_perp(q_perp=q_fg_T)
-        parton.add_q_perp(q_perp=q_fg_utau)
-        parton.add_q_perp(q_perp=q_fg_uperp)
+        self.parton.add_q_perp(q_perp=q_fg_utau)
+        self.parton.add_q_perp(q_perp=q_fg_uperp)
 
         # Check if the "jet" would be extinguished (prevents flipping directions
         # when T >> p_T, since q_el has no p_T dependence):
@@ -334,156 +631,836 @@ def evolve(event, parton, drift=True, el=True, fg=True, fgqhat=False, cel=False,
         # at the beginning of the step, we extinguish the "jet" and end things
         if np.abs(q_el) >= parton_og_p_T:
             logging.info('Parton extinguished')
-            parton.p_x = 0
-            parton.p_y = 0
-            extinguished = True
-            exit_code = 1
-            break
+            self.parton.p_x = 0
+            self.parton.p_y = 0
+            self.extinguished = True
+            self.exit_code = 1
+            self.done = True
+            return
 
         ###############
         # Timekeeping #
         ###############
-        tau += dtau
+        # Adaptive steps add dtau repeatedly, so times match the fixed step grid exactly
+        for i in range(int(round(step_dtau / self.dtau))):
+            self.tau += self.dtau
 
         # Get final parton parameters
-        rho_final, phi_final = parton.polar_mom_coords()
-        pT_final = parton.p_T()
+        self.rho_final, self.phi_final = self.parton.polar_mom_coords()
+        self.pT_final = self.parton.p_T()
 
-    logging.info('Time loop complete...')
+    # Method to check if the parton is currently outside of the event in space or time
+    def exited(self):
+        return (self.parton.x > self.event.xmax or self.parton.y > self.event.ymax
+                or self.parton.x < self.event.xmin or self.parton.y < self.event.ymin
+                or self.tau > self.event.tf)
+
+    # Method to account for the steps a parton outside of the QGP takes before it next reaches the QGP
+    # Samples the medium along the parton's straight path through the rest of the event all at once,
+    # using the same step average temperatures as stepping would, then moves the parton to the start
+    # of the first QGP step (or the point it leaves the event).
+    # Returns True if any steps were skipped.
+    def skip_vacuum(self):
+        exit_time, num_steps = straight_line_exit(event=self.event, parton=self.parton, tau=self.tau, dtau=self.dtau)
+
+        # Start points of the remaining steps, accumulated as stepping would
+        rho, phi = self.parton.polar_mom_coords()
+        beta = self.parton.beta()
+        taus = np.cumsum(np.concatenate([np.array([self.tau]), np.full(num_steps, self.dtau)]))
+        xs = np.cumsum(np.concatenate([np.array([self.parton.x]), np.full(num_steps, beta * np.cos(phi) * self.dtau)]))
+        ys = np.cumsum(np.concatenate([np.array([self.parton.y]), np.full(num_steps, beta * np.sin(phi) * self.dtau)]))
+
+        # Find the first step start outside of the event
+        outside = ((xs > self.event.xmax) | (ys > self.event.ymax) | (xs < self.event.xmin) | (ys < self.event.ymin)
+                   | (taus > self.event.tf))
+        if not np.any(outside):
+            return False
+        num_steps = int(np.argmax(outside))
+
+        points = np.column_stack((taus[:num_steps], xs[:num_steps], ys[:num_steps]))
+
+        # Phases of the steps certain from the coarse temperature map -- only steps up to the first
+        # certain QGP step matter, and only the rest are sampled
+        temps = np.zeros(num_steps)
+        mapping = self.mapped_phases(points)
+        if mapping is None:
+            codes = np.full(num_steps, PHASE_UNKNOWN)
+            mapped = np.zeros(num_steps, dtype=bool)
+        else:
+            codes, mapped = mapping
+            qgp = codes == PHASE_QGP
+            if np.any(qgp):
+                num_steps = int(np.argmax(qgp))
+                codes, mapped, points = codes[:num_steps], mapped[:num_steps], points[:num_steps]
+                temps = temps[:num_steps]
+
+        # Step average temperatures along the path
+        sampled = ~mapped
+        if np.any(sampled):
+            temps[sampled] = utilities.dtau_avg_batch(funcs=[self.event.temp], points=points[sampled],
+                                                      phi=np.full(np.count_nonzero(sampled), phi), dtau=self.dtau,
+                                                      beta=np.full(np.count_nonzero(sampled), beta),
+                                                      bounds=(self.event.t0, self.event.tf, self.event.xmin,
+                                                              self.event.xmax, self.event.ymin, self.event.ymax),
+                                                      num_samples=config.jet.STEP_SAMPLES,
+                                                      rule=config.jet.STEP_RULE)[0]
+            codes[sampled] = phase_codes(temps[sampled], temp_hrg=self.temp_hrg, temp_unh=self.temp_unh)
+
+        # Steps until the QGP is reached again
+        qgp = codes == PHASE_QGP
+        if np.any(qgp):
+            num_steps = int(np.argmax(qgp))
+        if num_steps == 0:
+            return False
+
+        # Account for the skipped steps
+        for i in range(num_steps):
+            if codes[i] == PHASE_HRG:
+                self.phase = 'hrg'
+                if self.hrg_first:
+                    self.t_hrg = taus[i]
+                    self.hrg_first = False
+                self.hrg_time_total += self.dtau
+            elif codes[i] == PHASE_UNH:
+                self.phase = 'unh'
+                if self.unhydro_first:
+                    self.t_unhydro = taus[i]
+                    self.unhydro_first = False
+                self.unhydro_time_total += self.dtau
+            else:
+                self.phase = 'vac'
+            if temps[i] > self.maxT:
+                self.maxT = temps[i]
+            self.temp_total += float(temps[i])
+        self.mapped_steps += int(np.count_nonzero(mapped[:num_steps]))
+        self.num_steps += num_steps
+        self.skipped_steps += num_steps
+
+        # Move the parton to the start of the next step
+        self.tau = taus[num_steps]
+        self.parton.x = float(xs[num_steps])
+        self.parton.y = float(ys[num_steps])
+        self.rho_final, self.phi_final = self.parton.polar_mom_coords()
+        self.pT_final = self.parton.p_T()
+
+        return True
+
+    # Method to decide which steps starting at the given (t, x, y) points can be accounted for from the
+    # coarse temperature map of the event alone, without sampling the medium
+    # These are steps certainly outside of the QGP, whose temperature can't raise the parton's maximum.
+    # As the average temperature is kept with a summary record (and everything with a full record),
+    # then only steps through zero temperature (e.g. outside of a cropped medium) qualify.
+    # Returns the phase codes of the steps and a mask of those that qualify, or None if the event has no map.
+    def mapped_phases(self, points):
+        if self.trajectory is not None:
+            return None
+        temp_bounds = self.event.step_temp_bounds(points, dtau=self.dtau)
+        if temp_bounds is None:
+            return None
+        lower, upper = temp_bounds
+        codes = bounded_phase_codes(lower, upper, temp_hrg=self.temp_hrg, temp_unh=self.temp_unh)
+        mapped = (codes != PHASE_UNKNOWN) & (codes != PHASE_QGP) & (upper * (1 + 1e-12) <= self.maxT)
+        if self.record == 'summary':
+            mapped &= upper == 0
+        return codes, mapped
+
+    # Method to decide the phase of the current step from the coarse temperature map of the event
+    # The same as mapped_phases, for the current step alone.
+    # Returns the phase code, or None if the step must be sampled.
+    def mapped_phase(self):
+        if self.trajectory is not None:
+            return None
+        temp_bounds = self.event.step_temp_bounds((self.tau, self.parton.x, self.parton.y), dtau=self.dtau)
+        if temp_bounds is None:
+            return None
+        lower, upper = temp_bounds
+        code = bounded_phase_code(lower, upper, temp_hrg=self.temp_hrg, temp_unh=self.temp_unh)
+        if (code == PHASE_UNKNOWN or code == PHASE_QGP or upper * (1 + 1e-12) > self.maxT
+                or (self.record == 'summary' and upper != 0)):
+            return None
+        return code
+
+    # Method to account for a step outside of the QGP whose phase is known, without sampling the medium
+    def mapped_step(self, phase_code):
+        self.phase = str(PHASE_NAMES[phase_code])
+        if self.phase == 'hrg':
+            if self.hrg_first:
+                self.t_hrg = self.tau
+                self.hrg_first = False
+            self.hrg_time_total += self.dtau
+        elif self.phase == 'unh':
+            if self.unhydro_first:
+                self.t_unhydro = self.tau
+                self.unhydro_first = False
+            self.unhydro_time_total += self.dtau
+        self.num_steps += 1
+        self.mapped_steps += 1
+
+        # Propagate the parton through the step
+        self.parton.prop(tau=self.dtau)
+        self.tau += self.dtau
+        self.rho_final, self.phi_final = self.parton.polar_mom_coords()
+        self.pT_final = self.parton.p_T()
 
-    mean_QGP_temp = np.mean(temp_seen_array[phase_array == 'qgp'])
-    # Create momentPlasma results dataframe
-    try:
-        print('Making dataframe...')
-        parton_dataframe = pd.DataFrame(
-            {
-                "partonNo": [int(parton.no)],
-                "tag": [int(parton.tag)],
-                "weight": [float(parton.weight)],
-                "AA_weight": [float(parton.AA_weight)],
-                "id": [int(parton.id)],
-                "pt_0": [float(parton.p_T0)],
-                "pt_f": [float(pT_final)],
-                "q_el": [float(q_el_total)],
-                "q_cel": [float(q_cel_total)],
-                "q_drift": [float(q_drift_total)],
-                "q_drift_abs": [float(q_drift_abs_total)],
-                "q_fg_utau": [float(q_fg_utau_total)],
-                "q_fg_utau_abs": [float(q_fg_utau_abs_total)],
-                "q_fg_uperp": [float(q_fg_uperp_total)],
-                "q_fg_uperp_abs": [float(q_fg_uperp_abs_total)],
-                "q_fg_utau_qhat": [float(q_fg_utau_qhat_total)],
-                "q_fg_utau_qhat_abs": [float(q_fg_utau_qhat_abs_total)],
-                "q_fg_uperp_qhat": [float(q_fg_uperp_qhat_total)],
-                "q_fg_uperp_qhat_abs": [float(q_fg_uperp_qhat_abs_total)],
-                "extinguished": [bool(extinguished)],
-                "x_0": [float(parton.x_0)],
-                "y_0": [float(parton.y_0)],
-                "phi_0": [float(parton.phi_0)],
-                "phi_f": [float(phi_final)],
-                "t_qgp": [float(t_qgp)],
-                "t_hrg": [float(t_hrg)],
-                "t_unhydro": [float(t_unhydro)],
-                "time_total_plasma": [float(qgp_time_total)],
-                "time_total_hrg": [float(hrg_time_total)],
-                "time_total_unhydro": [float(unhydro_time_total)],
-                "Tmax_parton": [float(maxT)],
-                "Tavg_qgp_parton": [float(mean_QGP_temp)],
-                "initial_time": [float(event.t0)],
-                "final_time": [float(event.tf)],
-                "dtau": [float(config.jet.DTAU)],
-                "drift": [bool(drift)],
-                "el": [bool(el)],
-                "cel": [bool(cel)],
-                "el_num": [bool(el_num)],
-                "fg": [bool(fg)],
-                "fgqhat": [bool(fgqhat)],
-                "exit": [int(exit_code)],
-                "g": [float(config.constants.G)],
-                "K_F_DRIFT": [float(config.jet.K_F_DRIFT)],
-                "K_FG_DRIFT": [float(config.jet.K_FG_DRIFT)]
-            }
-        )
-
-        logging.info('Pandas dataframe generated...')
-
-    except Exception as error:
-        logging.info("An error occurred: {}".format(type(error).__name__))  # An error occurred: NameError
-        logging.info('- Parton Dataframe Creation Failed -')
-        traceback.print_exc()
-
-    # Create and store parton record xarray
-    # define data with variable attributes
-    logging.info('Creating xarray parton record...')
-    data_vars = {'x': (['time'], xpos_array,
-                       {'units': 'fm',
-                        'long_name': 'x position coordinate'}),
-                 'y': (['time'], ypos_array,
-                       {'units': 'fm',
-                        'long_name': 'y position coordinate'}),
-                 'q_drift': (['time'], q_drift_array,
-                             {'units': 'GeV',
-                              'long_name': 'Momentum obtained by the parton at this timestep due to flow drift'}),
-                 'q_fg_utau': (['time'], q_fg_utau_array,
-                          {'units': 'GeV',
-                           'long_name': 'Momentum obtained by the parton at this timestep due to flow-grad_utau drift'}),
-                 'q_fg_uperp': (['time'], q_fg_uperp_array,
-                          {'units': 'GeV',
-                           'long_name': 'Momentum obtained by the parton at this timestep due to flow-grad_uperp drift'}),
-                 'q_el': (['time'], q_el_array,
-                            {'units': 'GeV',
-                             'long_name': 'Momentum obtained by the parton at this timestep due to radiative energy loss'}),
-                 'q_cel': (['time'], q_cel_array,
-                          {'units': 'GeV',
-                           'long_name': 'Momentum obtained by the parton at this timestep due to collisional energy loss'}),
-                 'q_fg_utau_qhat': (['time'], q_fg_utau_qhat_array,
-                          {'units': 'GeV',
-                           'long_name': 'Momentum obtained by the parton at this timestep due to fg_utau mod to energy loss'}),
-                 'q_fg_uperp_qhat': (['time'], q_fg_uperp_qhat_array,
+    # Method to choose the size of an adaptive step outside of the QGP
+    # The proposed step is twice the last one, up to max_dtau. It is halved until the whole step is within the medium
+    # and the hottest point sampled along it is below temp_hrg - refine_margin, down to a single fixed step.
+    # Returns the step size and the medium sample along it (None for a fixed step).
+    def coarse_step(self):
+        self.step_factor = min(2 * self.step_factor, self.max_step_factor)
+        while self.step_factor > 1:
+            step_dtau = self.step_factor * self.dtau
+            sample = pi.medium_sample(event=self.event, parton=self.parton, time=self.tau, dtau=step_dtau)
+            if sample.in_bounds and np.amax(sample.field('temp')) < self.temp_hrg - self.refine_margin:
+                return step_dtau, sample
+
+            # Refine the step
+            self.refined_steps += 1
+            self.step_factor = self.step_factor // 2
+
+        return self.dtau, None
+
+    # Method to return the step-averaged temperatures of the fixed steps making up a coarse step of step_dtau
+    def sub_step_temps(self, step_dtau):
+        num_steps = int(round(step_dtau / self.dtau))
+        rho, phi = self.parton.polar_mom_coords()
+        beta = self.parton.beta()
+        delta_taus = self.dtau * np.arange(num_steps)
+        points = np.column_stack((self.tau + delta_taus, self.parton.x + beta * np.cos(phi) * delta_taus,
+                                  self.parton.y + beta * np.sin(phi) * delta_taus))
+        return utilities.dtau_avg_batch(funcs=[self.event.temp], points=points, phi=np.full(num_steps, phi),
+                                        dtau=self.dtau, beta=np.full(num_steps, beta),
+                                        bounds=(self.event.t0, self.event.tf, self.event.xmin, self.event.xmax,
+                                                self.event.ymin, self.event.ymax),
+                                        num_samples=config.jet.STEP_SAMPLES, rule=config.jet.STEP_RULE)[0]
+
+    # Method to return the summary quantities of the parton, keyed by PARTON_COLUMNS
+    def row(self):
+        return {"partonNo": int(self.parton.no),
+                "tag": int(self.parton.tag),
+                "weight": float(self.parton.weight),
+                "AA_weight": float(self.parton.AA_weight),
+                "id": int(self.parton.id),
+                "pt_0": float(self.parton.p_T0),
+                "pt_f": float(self.pT_final),
+                "q_el": float(self.q_el_total),
+                "q_cel": float(self.q_cel_total),
+                "q_drift": float(self.q_drift_total),
+                "q_drift_abs": float(self.q_drift_abs_total),
+                "q_fg_utau": float(self.q_fg_utau_total),
+                "q_fg_utau_abs": float(self.q_fg_utau_abs_total),
+                "q_fg_uperp": float(self.q_fg_uperp_total),
+                "q_fg_uperp_abs": float(self.q_fg_uperp_abs_total),
+                "q_fg_utau_qhat": float(self.q_fg_utau_qhat_total),
+                "q_fg_utau_qhat_abs": float(self.q_fg_utau_qhat_abs_total),
+                "q_fg_uperp_qhat": float(self.q_fg_uperp_qhat_total),
+                "q_fg_uperp_qhat_abs": float(self.q_fg_uperp_qhat_abs_total),
+                "extinguished": bool(self.extinguished),
+                "x_0": float(self.parton.x_0),
+                "y_0": float(self.parton.y_0),
+                "phi_0": float(self.parton.phi_0),
+                "phi_f": float(self.phi_final),
+                "t_qgp": float(self.t_qgp),
+                "t_hrg": float(self.t_hrg),
+                "t_unhydro": float(self.t_unhydro),
+                "time_total_plasma": float(self.qgp_time_total),
+                "time_total_hrg": float(self.hrg_time_total),
+                "time_total_unhydro": float(self.unhydro_time_total),
+                "Tmax_parton": float(self.maxT),
+                "Tavg_qgp_parton": float(self.mean_qgp_temp()),
+                "initial_time": float(self.event.t0),
+                "final_time": float(self.event.tf),
+                "dtau": float(config.jet.DTAU),
+                "n_steps": int(self.num_steps),
+                "n_coarse_steps": int(self.coarse_steps),
+                "n_refined_steps": int(self.refined_steps),
+                "n_skipped_steps": int(self.skipped_steps),
+                "n_mapped_steps": int(self.mapped_steps),
+                "drift": bool(self.drift),
+                "el": bool(self.el),
+                "cel": bool(self.cel),
+                "el_num": bool(self.el_num),
+                "fg": bool(self.fg),
+                "fgqhat": bool(self.fgqhat),
+                "exit": int(self.exit_code),
+                "g": float(self.G),
+                "K_F_DRIFT": float(self.K_F_DRIFT),
+                "K_FG_DRIFT": float(config.jet.K_FG_DRIFT)}
+
+    # Method to return the mean temperature over the QGP steps -- nan if the parton never saw a QGP
+    def mean_qgp_temp(self):
+        if self.qgp_steps > 0:
+            return self.qgp_temp_total / self.qgp_steps
+        else:
+            return np.nan
+
+    # Method to return the results dataframe and the requested trajectory record
+    # If a result_builder is given, the parton's results are appended to it instead,
+    # and the index of its row is returned in place of the dataframe.
+    def results(self, results=None):
+        parton_dataframe = pd.DataFrame({}) if results is None else None  # To return in case of issue.
+        mean_QGP_temp = self.mean_qgp_temp()
+
+        # Create momentPlasma results dataframe
+        try:
+            if results is not None:
+                parton_dataframe = results.append(**self.row())
+            else:
+                print('Making dataframe...')
+                parton_dataframe = pd.DataFrame({name: [value] for name, value in self.row().items()})
+
+                logging.info('Pandas dataframe generated...')
+
+        except Exception as error:
+            logging.info("An error occurred: {}".format(type(error).__name__))  # An error occurred: NameError
+            logging.info('- Parton Dataframe Creation Failed -')
+            traceback.print_exc()
+
+        # Create and store parton record
+        if self.record == 'off':
+            self.parton.record = None
+            return parton_dataframe, None
+        elif self.record == 'summary':
+            parton_summary = {'steps': self.num_steps,
+                              'qgp_steps': self.qgp_steps,
+                              'temp_max': float(self.maxT),
+                              'temp_avg': self.temp_total / self.num_steps if self.num_steps > 0 else np.nan,
+                              'temp_avg_qgp': float(mean_QGP_temp),
+                              'x_f': float(self.parton.x),
+                              'y_f': float(self.parton.y),
+                              'pt_f': float(self.pT_final),
+                              'phi_f': float(self.phi_final),
+                              'exit': int(self.exit_code)}
+            self.parton.record = parton_summary
+            return parton_dataframe, parton_summary
+
+        # Create and store parton record xarray
+        # define data with variable attributes
+        logging.info('Creating xarray parton record...')
+        data_vars = {'x': (['time'], self.trajectory['x'],
+                           {'units': 'fm',
+                            'long_name': 'x position coordinate'}),
+                     'y': (['time'], self.trajectory['y'],
+                           {'units': 'fm',
+                            'long_name': 'y position coordinate'}),
+                     'q_drift': (['time'], self.trajectory['q_drift'],
+                                 {'units': 'GeV',
+                                  'long_name': 'Momentum obtained by the parton at this timestep due to flow drift'}),
+                     'q_fg_utau': (['time'], self.trajectory['q_fg_utau'],
+                              {'units': 'GeV',
+                               'long_name': 'Momentum obtained by the parton at this timestep due to flow-grad_utau drift'}),
+                     'q_fg_uperp': (['time'], self.trajectory['q_fg_uperp'],
+                              {'units': 'GeV',
+                               'long_name': 'Momentum obtained by the parton at this timestep due to flow-grad_uperp drift'}),
+                     'q_el': (['time'], self.trajectory['q_el'],
+                                {'units': 'GeV',
+                                 'long_name': 'Momentum obtained by the parton at this timestep due to radiative energy loss'}),
+                     'q_cel': (['time'], self.trajectory['q_cel'],
+                              {'units': 'GeV',
+                               'long_name': 'Momentum obtained by the parton at this timestep due to collisional energy loss'}),
+                     'q_fg_utau_qhat': (['time'], self.trajectory['q_fg_utau_qhat'],
                               {'units': 'GeV',
-                               'long_name': 'Momentum obtained by the parton at this timestep due to fg_uperp mod to energy loss'}),
-                 'pT': (['time'], pT_array,
-                          {'units': 'GeV',
-                           'long_name': 'Transverse momentum of the parton at this timestep'}),
-                 'temp': (['time'], temp_seen_array,
-                          {'units': 'GeV',
-                           'long_name': 'Temperature seen by the parton at this timestep'}),
-                 'grad_perp_temp': (['time'], grad_perp_T_seen_array,
-                          {'units': 'GeV/fm',
-                           'long_name': 'Gradient of Temperature perp. to parton seen by the parton at this timestep'}),
-                 'grad_perp_utau': (['time'], grad_perp_utau_seen_array,
-                                    {'units': 'GeV/fm',
-                                     'long_name': 'Gradient of utau perp. to parton seen by the parton at this timestep'}),
-                 'grad_perp_uperp': (['time'], grad_perp_uperp_seen_array,
-                                    {'units': 'GeV/fm',
-                                     'long_name': 'Gradient of uperp perp. to parton seen by the parton at this timestep'}),
-                 'u_perp': (['time'], u_perp_array,
-                            {'units': 'GeV',
-                             'long_name': 'Temperature seen by the parton at this timestep'}),
-                 'u_par': (['time'], u_par_array,
+                               'long_name': 'Momentum obtained by the parton at this timestep due to fg_utau mod to energy loss'}),
+                     'q_fg_uperp_qhat': (['time'], self.trajectory['q_fg_uperp_qhat'],
+                                  {'units': 'GeV',
+                                   'long_name': 'Momentum obtained by the parton at this timestep due to fg_uperp mod to energy loss'}),
+                     'pT': (['time'], self.trajectory['pT'],
+                              {'units': 'GeV',
+                               'long_name': 'Transverse momentum of the parton at this timestep'}),
+                     'temp': (['time'], self.trajectory['temp'],
+                              {'units': 'GeV',
+                               'long_name': 'Temperature seen by the parton at this timestep'}),
+                     'grad_perp_temp': (['time'], self.trajectory['grad_perp_temp'],
+                              {'units': 'GeV/fm',
+                               'long_name': 'Gradient of Temperature perp. to parton seen by the parton at this timestep'}),
+                     'grad_perp_utau': (['time'], self.trajectory['grad_perp_utau'],
+                                        {'units': 'GeV/fm',
+                                         'long_name': 'Gradient of utau perp. to parton seen by the parton at this timestep'}),
+                     'grad_perp_uperp': (['time'], self.trajectory['grad_perp_uperp'],
+                                        {'units': 'GeV/fm',
+                                         'long_name': 'Gradient of uperp perp. to parton seen by the parton at this timestep'}),
+                     'u_perp': (['time'], self.trajectory['u_perp'],
+                                {'units': 'GeV',
+                                 'long_name': 'Temperature seen by the parton at this timestep'}),
+                     'u_par': (['time'], self.trajectory['u_par'],
+                               {'units': 'GeV',
+                                'long_name': 'Temperature seen by the parton at this timestep'}),
+                     'u': (['time'], self.trajectory['u'],
                            {'units': 'GeV',
                             'long_name': 'Temperature seen by the parton at this timestep'}),
-                 'u': (['time'], u_array,
-                       {'units': 'GeV',
-                        'long_name': 'Temperature seen by the parton at this timestep'}),
-                 'phase': (['time'], phase_array,
-                           {'units': 'qgp = Quark Gluon Plasma, hrg = HadRon Gas, unh = UNHydrodynamic hadron gas, vac = below unh cutoff / vacuum',
-                            'long_name': 'Phase seen by the parton at this timestep'})
-                 }
+                     'phase': (['time'], PHASE_NAMES[self.trajectory['phase']],
+                               {'units': 'qgp = Quark Gluon Plasma, hrg = HadRon Gas, unh = UNHydrodynamic hadron gas, vac = below unh cutoff / vacuum',
+                                'long_name': 'Phase seen by the parton at this timestep'})
+                     }
+
+        # define coordinates
+        coords = {'time': (['time'], self.trajectory['time'])}
+
+        # define global attributes
+        attrs = {'property_name': 'value'}
+
+        # create dataset
+        parton_xarray = xr.Dataset(data_vars=data_vars,
+                                coords=coords,
+                                attrs=attrs)
+
+        self.parton.record = parton_xarray
+
+        logging.info('Xarray dataframe generated...')
+
+        return parton_dataframe, parton_xarray
+
+
+# Function to evolve a single parton through the medium.
+# record chooses what is kept of the trajectory:
+# 'full' -- step-by-step xarray record, 'summary' -- dict of running trajectory accumulators only, 'off' -- nothing.
+# stepping chooses 'fixed' or 'adaptive' time steps -- see parton_evolution.
+# The coupling G and drift factor K_F_DRIFT default to the current config values.
+# If a result_builder is given as results, the parton's results are appended to it,
+# and the index of its row is returned in place of the dataframe.
+def evolve(event, parton, drift=True, el=True, fg=True, fgqhat=False, cel=False, scale_drift=1, scale_el=1, el_model='GLV',
+           temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO, record='full', stepping=config.jet.STEPPING,
+           G=None, K_F_DRIFT=None, results=None):
+    evolution = parton_evolution(event=event, parton=parton, drift=drift, el=el, fg=fg, fgqhat=fgqhat, cel=cel,
+                                 scale_drift=scale_drift, scale_el=scale_el, el_model=el_model, temp_hrg=temp_hrg,
+                                 temp_unh=temp_unh, record=record, stepping=stepping, G=G, K_F_DRIFT=K_F_DRIFT)
+
+    #############
+    # Time Loop #
+    #############
+    logging.info('Initiating time loop...')
+    while not evolution.check_exit():
+        evolution.step()
+
+    logging.info('Time loop complete...')
+
+    return evolution.results(results=results)
+
+
+# Function to evolve several physics variants of one parton through the medium together.
+# variants is a list of dictionaries of evolve options (drift, el, cel, fg, fgqhat, scale_drift, scale_el),
+# along with the coupling "G" and drift factor "K_F_DRIFT" to use -- these default to the current config values.
+# Each variant evolves its own copy of the parton. At each step, variants whose partons still coincide
+# (same time, position, direction and velocity to within share_tol) share a single medium sample,
+# and the medium is interpolated for all remaining groups in one call.
+# Returns a list with a (dataframe, record, evolved parton) tuple for each variant.
+# If a result_builder is given as results, each variant's results are appended to it in order,
+# and the index of its row is returned in place of the dataframe.
+def evolve_variants(event, parton, variants, el_model='GLV', temp_hrg=config.jet.T_HRG,
+                    temp_unh=config.jet.T_UNHYDRO, record='off', stepping=config.jet.STEPPING, share_tol=1e-12,
+                    results=None):
+    # Set up each variant -- energy loss interpolators are shared through the process-wide cache
+    evolutions = []
+    for variant in variants:
+        evolutions.append(parton_evolution(event=event, parton=copy.copy(parton), el_model=el_model,
+                                           temp_hrg=temp_hrg, temp_unh=temp_unh, record=record, stepping=stepping,
+                                           **variant))
+
+    #############
+    # Time Loop #
+    #############
+    logging.info('Initiating time loop for {} variants...'.format(len(evolutions)))
+    while True:
+        active = [evolution for evolution in evolutions if not evolution.check_exit()]
+        if len(active) == 0:
+            break
+
+        # Group the variants whose partons coincide
+        # Skipped and adaptive steps leave variants at different times, so the time is part of the state.
+        group_states = []
+        group_partons = []
+        group_times = []
+        groups = []
+        for evolution in active:
+            state = np.array([evolution.tau, evolution.parton.x, evolution.parton.y,
+                              evolution.parton.polar_mom_coords()[1], evolution.parton.beta()])
+            for i, group_state in enumerate(group_states):
+                if np.all(np.abs(state - group_state) <= share_tol):
+                    groups.append(i)
+                    break
+            else:
+                groups.append(len(group_states))
+                group_states.append(state)
+                group_partons.append(evolution.parton)
+                group_times.append(evolution.tau)
+
+        # Sample the medium once for each group, interpolating for all groups together
+        samples = pi.medium_samples(event=event, partons=group_partons, time=group_times, dtau=active[0].dtau)
+
+        # Step each variant
+        for evolution, group in zip(active, groups):
+            evolution.step(sample=samples[group])
+
+    logging.info('Time loop complete...')
+
+    return [evolution.results(results=results) + (evolution.parton,) for evolution in evolutions]
+
+
+# Function to evolve many partons through the medium at once.
+# Partons are given as arrays -- positions (x, y), momenta (p_x, p_y), masses, species (PDG ids) and weights --
+# and are all stepped together in time, with the medium sampled for every active parton in one call per field.
+# Partons that escape the event or are extinguished are masked out of subsequent steps.
+# The coupling G and drift factor K_F_DRIFT default to the current config values.
+# Every step is a fixed step, and no steps are skipped or refined, so the n_coarse_steps, n_refined_steps and
+# n_skipped_steps columns are NaN. n_mapped_steps counts the steps batch evolution left unsampled by the coarse
+# temperature map of the event, which can differ from the count of evolve.
+# Returns a dataframe with one row per parton and the same summary columns as evolve,
+# and a dictionary of the final parton position and momentum arrays.
+def evolve_batch(event, x, y, p_x, p_y, mass, species, weight, AA_weight=None, tag=None, no=None,
+                 drift=True, el=True, fg=True, fgqhat=False, cel=False, scale_drift=1, scale_el=1, el_model='GLV',
+                 temp_hrg=config.jet.T_HRG, temp_unh=config.jet.T_UNHYDRO, G=None, K_F_DRIFT=None):
+    # Physics parameters of this evolution
+    if G is None:
+        G = config.constants.G
+    if K_F_DRIFT is None:
+        K_F_DRIFT = config.jet.K_F_DRIFT
+
+    # Copy parton arrays so we don't modify the caller's data
+    x = np.array(x, dtype=float)
+    y = np.array(y, dtype=float)
+    p_x = np.array(p_x, dtype=float)
+    p_y = np.array(p_y, dtype=float)
+    mass = np.array(mass, dtype=float)
+    species = np.array(species, dtype=int)
+    weight = np.array(weight, dtype=float)
+    num_partons = len(x)
+    AA_weight = np.zeros(num_partons) if AA_weight is None else np.array(AA_weight, dtype=float)
+    tag = np.zeros(num_partons, dtype=int) if tag is None else np.array(tag, dtype=int)
+    no = np.zeros(num_partons, dtype=int) if no is None else np.array(no, dtype=int)
+
+    # Gluons are PDG id 21 -- everything else is treated as a light quark
+    gluon = species == 21
+
+    # If using numerical energy loss, summon the interpolator
+    if el_model == 'num_GLV':
+        el_rate_interp = pi.cached_num_eloss_interpolator(g=G)
+        el_num = True
+    else:
+        el_num = False
+
+    # Record initial parton properties
+    x_0 = np.copy(x)
+    y_0 = np.copy(y)
+    pT_0 = np.sqrt(p_x ** 2 + p_y ** 2)
+    phi_0 = np.mod(np.arctan2(p_y, p_x), 2 * np.pi)
+
+    # Choose which medium fields need to be sampled
+    bounds = (event.t0, event.tf, event.xmin, event.xmax, event.ymin, event.ymax)
+    sample_funcs = [event.temp, event.x_vel, event.y_vel]
+    if el_model == 'BBMG':
+        sample_funcs = sample_funcs + [event.vel]
+    if fg or fgqhat:
+        sample_funcs = sample_funcs + [event.grad_x_u_x, event.grad_x_u_y, event.grad_y_u_x, event.grad_y_u_y]
+
+    #############
+    # Time Loop #
+    #############
+    # Set loop parameters
+    dtau = config.jet.DTAU  # dt for time loop in fm
+    tau = event.t0  # Set current time in fm to initial time
+
+    # Initialize counters & values
+    t_qgp = np.full(num_partons, -1.0)
+    t_hrg = np.full(num_partons, -1.0)
+    t_unhydro = np.full(num_partons, -1.0)
+    qgp_time_total = np.zeros(num_partons)
+    hrg_time_total = np.zeros(num_partons)
+    unhydro_time_total = np.zeros(num_partons)
+    maxT = np.zeros(num_partons)
+    qgp_temp_sum = np.zeros(num_partons)
+    qgp_steps = np.zeros(num_partons, dtype=int)
+    num_steps = np.zeros(num_partons, dtype=int)
+    mapped_steps = np.zeros(num_partons, dtype=int)
+    q_el_total = np.zeros(num_partons)
+    q_cel_total = np.zeros(num_partons)
+    q_drift_total = np.zeros(num_partons)
+    q_drift_abs_total = np.zeros(num_partons)
+    q_fg_utau_total = np.zeros(num_partons)
+    q_fg_utau_abs_total = np.zeros(num_partons)
+    q_fg_uperp_total = np.zeros(num_partons)
+    q_fg_uperp_abs_total = np.zeros(num_partons)
+    q_fg_utau_qhat_total = np.zeros(num_partons)
+    q_fg_utau_qhat_abs_total = np.zeros(num_partons)
+    q_fg_uperp_qhat_total = np.zeros(num_partons)
+    q_fg_uperp_qhat_abs_total = np.zeros(num_partons)
+
+    # Initialize flags
+    active = np.ones(num_partons, dtype=bool)
+    in_qgp = np.zeros(num_partons, dtype=bool)  # Phase of the last step was qgp
+    extinguished = np.zeros(num_partons, dtype=bool)
+    exit_code = np.full(num_partons, -1)
+
+    # Set failsafe values
+    phi_final = np.zeros(num_partons)
+    pT_final = np.zeros(num_partons)
+
+    # If we want to produce hard scattering at t=0, we should propagate the partons
+    # in the time before thermalization...
+    pT = np.sqrt(p_x ** 2 + p_y ** 2)
+    phi = np.mod(np.arctan2(p_y, p_x), 2 * np.pi)
+    beta = pT / np.sqrt(mass ** 2 + pT ** 2)
+    x = x + beta * np.cos(phi) * (tau - config.jet.TAU_PROD)
+    y = y + beta * np.sin(phi) * (tau - config.jet.TAU_PROD)
+
+    # Initiate loop
+    logging.info('Initiating batched time loop for {} partons...'.format(num_partons))
+    while np.any(active):
+        #########################
+        # Set Current Step Data #
+        #########################
+        # Decide which partons are in bounds of the grid
+        escaped = active & ((x > event.xmax) | (y > event.ymax) | (x < event.xmin) | (y < event.ymin))
+        exit_code[escaped] = 0
+        active[escaped] = False
+
+        if tau > event.tf:
+            logging.info('Partons escaped event time...')
+            exit_code[active] = np.where(in_qgp[active], 3, 2)
+            active[:] = False
+
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+
+        # For timekeeping in phases, we approximate all time in one step as in one phase
+        step_pT = np.sqrt(p_x[idx] ** 2 + p_y[idx] ** 2)
+        step_phi = np.mod(np.arctan2(p_y[idx], p_x[idx]), 2 * np.pi)
+        step_beta = step_pT / np.sqrt(mass[idx] ** 2 + step_pT ** 2)
+        step_gluon = gluon[idx]
+        points = np.column_stack([np.full(len(idx), tau), x[idx], y[idx]])
+
+        # Partons certainly outside of the QGP by the coarse temperature map of the event,
+        # whose temperature can't raise their maximum, need no medium sample
+        temp_bounds = event.step_temp_bounds(points, dtau=dtau)
+        if temp_bounds is None:
+            mapped_codes = np.full(len(idx), PHASE_UNKNOWN)
+            mapped = np.zeros(len(idx), dtype=bool)
+        else:
+            mapped_codes = bounded_phase_codes(temp_bounds[0], temp_bounds[1], temp_hrg=temp_hrg, temp_unh=temp_unh)
+            mapped = ((mapped_codes != PHASE_UNKNOWN) & (mapped_codes != PHASE_QGP)
+                      & (temp_bounds[1] * (1 + 1e-12) <= maxT[idx]))
+        sampled = ~mapped
+
+        # Average the medium over the step for all other active partons at once
+        averages = np.zeros((len(sample_funcs), len(idx)))
+        if np.any(sampled):
+            averages[:, sampled] = utilities.dtau_avg_batch(funcs=sample_funcs, points=points[sampled],
+                                                            phi=step_phi[sampled], dtau=dtau,
+                                                            beta=step_beta[sampled], bounds=bounds,
+                                                            num_samples=config.jet.STEP_SAMPLES,
+                                                            rule=config.jet.STEP_RULE)
+        temp, u_x, u_y = averages[0], averages[1], averages[2]
+        sin_phi = np.sin(step_phi)
+        cos_phi = np.cos(step_phi)
+        u_perp = -u_x * sin_phi + u_y * cos_phi
+        u_par = u_x * cos_phi + u_y * sin_phi
+        vel = averages[3] if el_model == 'BBMG' else None
+        if fg or fgqhat:
+            grad_x_u_x, grad_x_u_y, grad_y_u_x, grad_y_u_y = averages[-4:]
+            grad_perp_utau = (- grad_x_u_x * sin_phi * cos_phi
+                              + grad_y_u_x * (cos_phi**2)
+                              - grad_x_u_y * (sin_phi**2)
+                              + grad_y_u_y * sin_phi * cos_phi)
+            grad_perp_uperp = (grad_x_u_x * (sin_phi**2)
+                               - grad_y_u_x * sin_phi * cos_phi
+                               - grad_x_u_y * sin_phi * cos_phi
+                               + grad_y_u_y * (cos_phi**2))
+
+        # Decide phase
+        codes = phase_codes(temp, temp_hrg=temp_hrg, temp_unh=temp_unh)
+        codes[mapped] = mapped_codes[mapped]
+        qgp = codes == PHASE_QGP
+        hrg = codes == PHASE_HRG
+        unh = codes == PHASE_UNH
+
+        #################################
+        # Perform partonic calculations #
+        #################################
+        # If not in QGP, don't compute any parton-medium interactions
+        q_el, q_cel, q_drift, q_fg_utau, q_fg_uperp, q_fg_utau_qhat, q_fg_uperp_qhat = [
+            np.zeros(len(idx)) for name in QGP_TRANSFERS]
+
+        if np.any(qgp):
+            transfers = qgp_transfers(E=step_pT[qgp], T=temp[qgp], beta=step_beta[qgp], gluon=step_gluon[qgp],
+                                      u_perp=u_perp[qgp], u_par=u_par[qgp], tau=tau, t0=event.t0, dtau=dtau,
+                                      drift=drift, el=el, cel=cel, fg=fg, fgqhat=fgqhat, scale_drift=scale_drift,
+                                      scale_el=scale_el, el_model=el_model,
+                                      el_rate_interp=el_rate_interp if el_num else None,
+                                      vel=None if vel is None else vel[qgp],
+                                      grad_perp_utau=grad_perp_utau[qgp] if (fg or fgqhat) else None,
+                                      grad_perp_uperp=grad_perp_uperp[qgp] if (fg or fgqhat) else None,
+                                      g=G, k_f_drift=K_F_DRIFT)
+            for q, name in zip([q_el, q_cel, q_drift, q_fg_utau, q_fg_uperp, q_fg_utau_qhat, q_fg_uperp_qhat],
+                               QGP_TRANSFERS):
+                q[qgp] = transfers[name]
+
+        ###################
+        # Data Accounting #
+        ###################
+        # Log momentum transfers
+        q_el_total[idx] += q_el
+        q_cel_total[idx] += q_cel
+        q_drift_total[idx] += q_drift
+        q_drift_abs_total[idx] += np.abs(q_drift)
+        q_fg_utau_total[idx] += q_fg_utau
+        q_fg_utau_abs_total[idx] += np.abs(q_fg_utau)
+        q_fg_uperp_total[idx] += q_fg_uperp
+        q_fg_uperp_abs_total[idx] += np.abs(q_fg_uperp)
+        q_fg_utau_qhat_total[idx] += q_fg_utau_qhat
+        q_fg_utau_qhat_abs_total[idx] += np.abs(q_fg_utau_qhat)
+        q_fg_uperp_qhat_total[idx] += q_fg_uperp_qhat
+        q_fg_uperp_qhat_abs_total[idx] += np.abs(q_fg_uperp_qhat)
+
+        # Check for max temperature
+        maxT[idx] = np.maximum(maxT[idx], temp)
+        num_steps[idx] += 1
+        mapped_steps[idx] += mapped
+
+        # Decide phase for categorization & timekeeping
+        t_qgp[idx[qgp & (t_qgp[idx] < 0)]] = tau
+        qgp_time_total[idx[qgp]] += dtau
+        qgp_temp_sum[idx[qgp]] += temp[qgp]
+        qgp_steps[idx[qgp]] += 1
+        t_hrg[idx[hrg & (t_hrg[idx] < 0)]] = tau
+        hrg_time_total[idx[hrg]] += dtau
+        t_unhydro[idx[unh & (t_unhydro[idx] < 0)]] = tau
+        unhydro_time_total[idx[unh]] += dtau
+        in_qgp[idx] = qgp
+
+        ############################
+        # Change Parton Parameters #
+        ############################
+        # Note -- We propagate FIRST in order to travel over the timestep whose medium properties we're averaging.
+        # Propagate parton positions
+        x[idx] = x[idx] + step_beta * cos_phi * dtau
+        y[idx] = y[idx] + step_beta * sin_phi * dtau
+
+        # Change parton momenta to reflect energy loss, then drift effects
+        # Kicks are applied one at a time, each relative to the momentum direction left by the last.
+        for q, perp in [(q_el, False), (q_cel, False), (q_fg_utau_qhat, False), (q_fg_uperp_qhat, False),
+                        (q_drift, True), (q_fg_utau, True), (q_fg_uperp, True)]:
+            angle = np.mod(np.arctan2(p_y[idx], p_x[idx]), 2 * np.pi)
+            if perp:
+                angle = angle + (np.pi / 2)
+            p_x[idx] = p_x[idx] + q * np.cos(angle)
+            p_y[idx] = p_y[idx] + q * np.sin(angle)
+
+        # Check if the "jet" would be extinguished (prevents flipping directions
+        # when T >> p_T, since q_el has no p_T dependence)
+        snuffed = np.abs(q_el) >= step_pT
+        if np.any(snuffed):
+            logging.info('{} partons extinguished'.format(np.sum(snuffed)))
+            p_x[idx[snuffed]] = 0
+            p_y[idx[snuffed]] = 0
+            extinguished[idx[snuffed]] = True
+            exit_code[idx[snuffed]] = 1
+            active[idx[snuffed]] = False
+
+        ###############
+        # Timekeeping #
+        ###############
+        tau += dtau
+
+        # Get final parton parameters
+        kept = idx[~snuffed]
+        phi_final[kept] = np.mod(np.arctan2(p_y[kept], p_x[kept]), 2 * np.pi)
+        pT_final[kept] = np.sqrt(p_x[kept] ** 2 + p_y[kept] ** 2)
+
+    logging.info('Batched time loop complete...')
+
+    # Average temperature over the QGP steps -- nan if a parton never saw a QGP
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_QGP_temp = qgp_temp_sum / qgp_steps
+
+    # Create results dataframe
+    parton_dataframe = pd.DataFrame(
+        {
+            "partonNo": no,
+            "tag": tag,
+            "weight": weight,
+            "AA_weight": AA_weight,
+            "id": species,
+            "pt_0": pT_0,
+            "pt_f": pT_final,
+            "q_el": q_el_total,
+            "q_cel": q_cel_total,
+            "q_drift": q_drift_total,
+            "q_drift_abs": q_drift_abs_total,
+            "q_fg_utau": q_fg_utau_total,
+            "q_fg_utau_abs": q_fg_utau_abs_total,
+            "q_fg_uperp": q_fg_uperp_total,
+            "q_fg_uperp_abs": q_fg_uperp_abs_total,
+            "q_fg_utau_qhat": q_fg_utau_qhat_total,
+            "q_fg_utau_qhat_abs": q_fg_utau_qhat_abs_total,
+            "q_fg_uperp_qhat": q_fg_uperp_qhat_total,
+            "q_fg_uperp_qhat_abs": q_fg_uperp_qhat_abs_total,
+            "extinguished": extinguished,
+            "x_0": x_0,
+            "y_0": y_0,
+            "phi_0": phi_0,
+            "phi_f": phi_final,
+            "t_qgp": t_qgp,
+            "t_hrg": t_hrg,
+            "t_unhydro": t_unhydro,
+            "time_total_plasma": qgp_time_total,
+            "time_total_hrg": hrg_time_total,
+            "time_total_unhydro": unhydro_time_total,
+            "Tmax_parton": maxT,
+            "Tavg_qgp_parton": mean_QGP_temp,
+            "initial_time": np.full(num_partons, float(event.t0)),
+            "final_time": np.full(num_partons, float(event.tf)),
+            "dtau": np.full(num_partons, float(config.jet.DTAU)),
+            "n_steps": num_steps,
+            "n_coarse_steps": np.full(num_partons, np.nan),
+            "n_refined_steps": np.full(num_partons, np.nan),
+            "n_skipped_steps": np.full(num_partons, np.nan),
+            "n_mapped_steps": mapped_steps,
+            "drift": np.full(num_partons, bool(drift)),
+            "el": np.full(num_partons, bool(el)),
+            "cel": np.full(num_partons, bool(cel)),
+            "el_num": np.full(num_partons, bool(el_num)),
+            "fg": np.full(num_partons, bool(fg)),
+            "fgqhat": np.full(num_partons, bool(fgqhat)),
+            "exit": exit_code,
+            "g": np.full(num_partons, float(G)),
+            "K_F_DRIFT": np.full(num_partons, float(K_F_DRIFT)),
+            "K_FG_DRIFT": np.full(num_partons, float(config.jet.K_FG_DRIFT))
+        }
+    )
+
+    # Final parton state for callers that want to continue with it (e.g. fragmentation)
+    final_state = {'x': x, 'y': y, 'p_x': p_x, 'p_y': p_y}
 
-    # define coordinates
-    coords = {'time': (['time'], time_array)}
+    return parton_dataframe, final_state
 
-    # define global attributes
-    attrs = {'property_name': 'value'}
 
-    # create dataset
-    parton_xarray = xr.Dataset(data_vars=data_vars,
-                            coords=coords,
-                            attrs=attrs)
+# Function to evolve a list of jets.parton objects together with evolve_batch.
+# The final position and momentum of each parton object is updated, as evolve would do.
+def evolve_partons(event, partons, **kwargs):
+    parton_dataframe, final_state = evolve_batch(event=event,
+                                                 x=[parton.x for parton in partons],
+                                                 y=[parton.y for parton in partons],
+                                                 p_x=[parton.p_x for parton in partons],
+                                                 p_y=[parton.p_y for parton in partons],
+                                                 mass=[parton.m for parton in partons],
+                                                 species=[parton.id for parton in partons],
+                                                 weight=[parton.weight for parton in partons],
+                                                 AA_weight=[parton.AA_weight for parton in partons],
+                                                 tag=[parton.tag for parton in partons],
+                                                 no=[parton.no for parton in partons],
+                                                 **kwargs)
 
-    parton.record = parton_xarray
+    # Keep the original initial conditions of each parton
+    parton_dataframe['pt_0'] = [parton.p_T0 for parton in partons]
+    parton_dataframe['phi_0'] = [parton.phi_0 for parton in partons]
+    parton_dataframe['x_0'] = [parton.x_0 for parton in partons]
+    parton_dataframe['y_0'] = [parton.y_0 for parton in partons]
 
-    logging.info('Xarray dataframe generated...')
+    # Update the parton objects with their final state
+    for i, parton in enumerate(partons):
+        parton.x = float(final_state['x'][i])
+        parton.y = float(final_state['y'][i])
+        parton.p_x = float(final_state['p_x'][i])
+        parton.p_y = float(final_state['p_y'][i])
 
-    return parton_dataframe, parton_xarray
+    return parton_dataframe
@@ -164,23 +164,104 @@ def jet_e_sample(maxAttempts=5, batch=1000, min_e=0, max_e=100):
     print("AHHHHHHHHHHHHHHH!!!!!!!!!!!")
     return 0
 
+# Function to return the offsets in time and weights of the points used to average over a step of length dtau
+# rule chooses the quadrature:
+# 'rectangle' -- the start of the step and evenly spaced points along it, weighted equally (num_samples points),
+# 'simpson' -- composite Simpson's rule on evenly spaced points including both ends (num_samples is rounded up to odd),
+# 'gauss' -- Gauss-Legendre points and weights on the step (num_samples points, exact for polynomials of
+# degree 2 * num_samples - 1, so a few points reach the accuracy of many rectangle points).
+# The weights sum to one, so an average is the weighted sum of values at the points.
+def dtau_quadrature(dtau, num_samples=10, rule='rectangle'):
+    key = (float(dtau), int(num_samples), rule)
+    if key not in quadrature_cache:
+        if rule == 'rectangle':
+            delta_taus = np.concatenate([np.array([0.0]), np.arange(dtau/num_samples, dtau, dtau/num_samples)])
+            weights = np.full(len(delta_taus), 1 / len(delta_taus))
+        elif rule == 'simpson':
+            num_points = max(int(num_samples), 3)
+            num_points += 1 - num_points % 2
+            delta_taus = np.linspace(0, dtau, num_points)
+            weights = np.ones(num_points)
+            weights[1:-1:2] = 4
+            weights[2:-1:2] = 2
+            weights = weights / np.sum(weights)
+        elif rule == 'gauss':
+            nodes, weights = np.polynomial.legendre.leggauss(int(num_samples))
+            delta_taus = (nodes + 1) * dtau / 2
+            weights = weights / 2
+        else:
+            raise ValueError('Unknown step quadrature rule: {}'.format(rule))
+        delta_taus.setflags(write=False)
+        weights.setflags(write=False)
+        quadrature_cache[key] = (delta_taus, weights)
+    return quadrature_cache[key]
+
+quadrature_cache = {}
+
 # Function generally used to average a medium parameter over a certain pathlength
-def dtau_avg(func, point, phi, dtau, beta, num_samples=10):
-    sample_coords = point
-    for delta_tau in np.arange(dtau/num_samples, dtau, dtau/num_samples):
-        sample_tau = point[0] + delta_tau
-        sample_x = point[1] + (beta * delta_tau * np.cos(phi))
-        sample_y = point[2] + (beta * delta_tau * np.sin(phi))
-        sample_coords = np.vstack((sample_coords, np.array([sample_tau, sample_x, sample_y])))
-
-    # Return zero if any point within the step would be out of bounds
-    try:
-        value = np.mean(func(sample_coords))
-    except ValueError:
-        value = 0
+# func may also be a list of functions, all evaluated at the same points, in which case a list of averages is returned.
+def dtau_avg(func, point, phi, dtau, beta, num_samples=10, rule='rectangle'):
+    delta_taus, weights = dtau_quadrature(dtau=dtau, num_samples=num_samples, rule=rule)
+    sample_coords = dtau_sample_points(point=point, phi=phi, dtau=dtau, beta=beta, num_samples=num_samples,
+                                       rule=rule)
+
+    funcs = func if isinstance(func, (list, tuple)) else [func]
+    values = []
+    for f in funcs:
+        # Return zero if any point within the step would be out of bounds
+        try:
+            values.append(np.dot(weights, np.ravel(f(sample_coords))))
+        except ValueError:
+            values.append(0)
 
     # return averaged value
-    return value
+    if isinstance(func, (list, tuple)):
+        return values
+    return values[0]
+
+# Function to return the (t, x, y) points sampled along the next step of a parton for step averages
+# The points follow the parton's straight path, at the offsets given by dtau_quadrature.
+def dtau_sample_points(point, phi, dtau, beta, num_samples=10, rule='rectangle'):
+    delta_taus, weights = dtau_quadrature(dtau=dtau, num_samples=num_samples, rule=rule)
+    sample_coords = np.empty((len(delta_taus), 3))
+    sample_coords[:, 0] = point[0] + delta_taus
+    sample_coords[:, 1] = point[1] + (beta * delta_taus * np.cos(phi))
+    sample_coords[:, 2] = point[2] + (beta * delta_taus * np.sin(phi))
+    return sample_coords
+
+# Function to average many medium parameters over the next step of many partons at once
+# Batched counterpart of dtau_avg -- points is an (N, 3) array of (t, x, y), phi and beta are length N arrays,
+# and bounds is (t0, tf, xmin, xmax, ymin, ymax) of the functions' domain.
+# Each function in funcs is evaluated once on all N * num_samples points. Returns a list of length N arrays.
+# As in dtau_avg, a parton gets zero for every average if any point within its step would be out of bounds.
+def dtau_avg_batch(funcs, points, phi, dtau, beta, bounds, num_samples=10, rule='rectangle'):
+    points = np.atleast_2d(points)
+    num_partons = len(points)
+
+    # Sample offsets along the step -- the same points as dtau_avg
+    delta_taus, weights = dtau_quadrature(dtau=dtau, num_samples=num_samples, rule=rule)
+
+    # Build (N, num_samples, 3) array of sample coordinates
+    sample_coords = np.empty((num_partons, len(delta_taus), 3))
+    sample_coords[:, :, 0] = points[:, 0, np.newaxis] + delta_taus
+    sample_coords[:, :, 1] = points[:, 1, np.newaxis] + (beta[:, np.newaxis] * delta_taus * np.cos(phi)[:, np.newaxis])
+    sample_coords[:, :, 2] = points[:, 2, np.newaxis] + (beta[:, np.newaxis] * delta_taus * np.sin(phi)[:, np.newaxis])
+
+    # Find the partons whose whole step is within bounds
+    t0, tf, xmin, xmax, ymin, ymax = bounds
+    in_bounds = np.all((sample_coords[:, :, 0] >= t0) & (sample_coords[:, :, 0] <= tf)
+                       & (sample_coords[:, :, 1] >= xmin) & (sample_coords[:, :, 1] <= xmax)
+                       & (sample_coords[:, :, 2] >= ymin) & (sample_coords[:, :, 2] <= ymax), axis=1)
+
+    # Evaluate each function on every in-bounds point in a single call
+    values = []
+    for func in funcs:
+        value = np.zeros(num_partons)
+        if np.any(in_bounds):
+            value[in_bounds] = np.dot(func(sample_coords[in_bounds]), weights)
+        values.append(value)
+
+    return values
 
 # Function to take an IC object and return the angle for epsilon_n
 def ecc_more(ic, n):
@@ -0,0 +1,90 @@
+import sys
+import numpy as np
+import io
+import contextlib
+import argparse
+import logging
+import plasma
+import jets
+import timekeeper
+
+"""
+This file validates timekeeper.evolve_variants against evolving each variant on its own with timekeeper.evolve.
+The medium is two hot blobs, so partons leave the QGP and enter it again -- after which skipped and adaptive steps
+leave the variants of a parton at different times. Every summary column of every variant must agree.
+Exits with a nonzero status if any do not.
+"""
+# Define command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-n", "--num_partons", type=int, default=20, help="number of partons to evolve")
+parser.add_argument("-m", "--el_model", default='GLV', help="energy loss model to use")
+parser.add_argument("-s", "--seed", type=int, default=1, help="random seed for the partons")
+parser.add_argument("-r", "--rtol", type=float, default=1e-9, help="relative tolerance of the comparison")
+
+# Get command line arguments
+args = parser.parse_args()
+logging.disable(logging.CRITICAL)
+
+
+# Two blobs of QGP, 6 fm apart along x, with flow pushing outward from each
+def temp_func(t, x, y):
+    return ((0.6 * np.exp(-((x + 3) ** 2 + y ** 2) / (2 * 1.2 ** 2))
+             + 0.6 * np.exp(-((x - 3) ** 2 + y ** 2) / (2 * 1.2 ** 2))) * (0.6 / t) ** 0.2)
+
+
+def x_vel_func(t, x, y):
+    return 0.3 * np.tanh(x / 4) * np.exp(-y ** 2 / 20)
+
+
+def y_vel_func(t, x, y):
+    return 0.2 * np.tanh(y / 4) * np.exp(-x ** 2 / 60)
+
+
+event = plasma.functional_plasma(temp_func=temp_func, x_vel_func=x_vel_func, y_vel_func=y_vel_func,
+                                 resolution=10, rmax=10, time=10, tau0=0.6)
+
+# Physics variants of each parton, as run by ebe_ape -- with an exaggerated drift, so that paths split
+variants = [dict(drift=True, el=True, cel=False, fg=False, fgqhat=False),
+            dict(drift=False, el=True, cel=False, fg=False, fgqhat=False),
+            dict(drift=True, el=True, cel=True, fg=False, fgqhat=False, G=2.2),
+            dict(drift=True, el=False, cel=False, fg=False, fgqhat=False, K_F_DRIFT=0.5),
+            dict(drift=True, el=True, cel=False, fg=False, fgqhat=False, scale_el=0.5, scale_drift=20)]
+
+# Draw random partons, starting in the first blob and mostly heading towards the second
+rng = np.random.default_rng(args.seed)
+partons = []
+for i in range(args.num_partons):
+    partons.append(dict(x_0=rng.uniform(-4, -2), y_0=rng.uniform(-1, 1), phi_0=rng.normal(0, 0.3) % (2 * np.pi),
+                        p_T0=rng.uniform(2, 30), part=rng.choice(['g', 'u', 'd', 's'])))
+
+# Evolve every variant both ways and compare
+num_bad = 0
+for stepping in ['fixed', 'adaptive']:
+    num_compared = 0
+    for parton_params in partons:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fused = timekeeper.evolve_variants(event=event, parton=jets.parton(tag=0, no=0, weight=1, AA_weight=1,
+                                                                               **parton_params),
+                                               variants=variants, el_model=args.el_model, stepping=stepping)
+            separate = [timekeeper.evolve(event=event, parton=jets.parton(tag=0, no=0, weight=1, AA_weight=1,
+                                                                          **parton_params),
+                                          el_model=args.el_model, record='off', stepping=stepping, **variant)
+                        for variant in variants]
+        for (fused_dataframe, fused_record, fused_parton), (dataframe, record) in zip(fused, separate):
+            num_compared += 1
+            for column in dataframe.columns:
+                fused_value = fused_dataframe[column][0]
+                value = dataframe[column][0]
+                if isinstance(value, (float, np.floating)):
+                    same = np.isclose(fused_value, value, rtol=args.rtol, atol=1e-12, equal_nan=True)
+                else:
+                    same = fused_value == value
+                if not same:
+                    num_bad += 1
+                    print('{} stepping, parton {}: {} is {} fused, {} alone'.format(stepping, parton_params,
+                                                                                   column, fused_value, value))
+    print('{} stepping: compared {} variants'.format(stepping, num_compared))
+
+print('{} mismatched values'.format(num_bad))
+if num_bad > 0:
+    sys.exit(1)
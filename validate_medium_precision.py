@@ -0,0 +1,97 @@
+import sys
+import numpy as np
+import time
+import io
+import contextlib
+import argparse
+import logging
+import config
+import plasma
+import jets
+import timekeeper
+
+"""
+This file validates single precision (float32) medium storage against double precision.
+The same partons are evolved through the same event stored both ways, and the changes in the final pT
+and flow-drift momentum are reported, along with the memory and time taken for each.
+Exits with a nonzero status if the results differ by more than the tolerances, or any exit codes differ.
+"""
+# Define command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument("-f", "--hydro_file", help="viscous_14_moments_evo.dat hydro file to use, "
+                                               "otherwise a smooth analytic medium is used")
+parser.add_argument("-n", "--num_partons", type=int, default=50, help="number of partons to evolve")
+parser.add_argument("-m", "--el_model", default='GLV', help="energy loss model to use")
+parser.add_argument("-s", "--seed", type=int, default=1, help="random seed for the partons")
+parser.add_argument("-r", "--rtol", type=float, default=1e-4, help="relative tolerance of the comparison")
+parser.add_argument("-a", "--atol", type=float, default=1e-4, help="absolute tolerance of the comparison [GeV]")
+
+# Get command line arguments
+args = parser.parse_args()
+logging.disable(logging.CRITICAL)
+
+
+# Function to make the event, stored in the given precision
+def make_event(dtype):
+    if args.hydro_file is not None:
+        return plasma.plasma_event(event=plasma.osu_hydro_file(file_path=args.hydro_file, cache=False, dtype=dtype))
+
+    def temp_func(t, x, y):
+        return 0.45 * np.exp(-(x ** 2 + 1.5 * y ** 2) / (2 * (3 + 0.3 * t) ** 2)) * (0.6 / t) ** 0.33
+
+    def x_vel_func(t, x, y):
+        return 0.08 * x * t / (1 + 0.1 * t * t) * np.exp(-(x ** 2 + y ** 2) / 60)
+
+    def y_vel_func(t, x, y):
+        return 0.1 * y * t / (1 + 0.1 * t * t) * np.exp(-(x ** 2 + y ** 2) / 60)
+
+    return plasma.functional_plasma(temp_func=temp_func, x_vel_func=x_vel_func, y_vel_func=y_vel_func,
+                                    resolution=10, rmax=10, time=12, tau0=0.6, dtype=dtype)
+
+
+# Draw random partons
+rng = np.random.default_rng(args.seed)
+partons = []
+for i in range(args.num_partons):
+    partons.append(dict(x_0=rng.uniform(-5, 5), y_0=rng.uniform(-5, 5), phi_0=rng.uniform(0, 2 * np.pi),
+                        p_T0=rng.uniform(2, 50), part=rng.choice(['g', 'u', 'd', 's'])))
+
+# Evolve all partons through the event in each precision
+results = {}
+for dtype in ['float64', 'float32']:
+    event = make_event(dtype)
+    memory = sum(field_interp.values.nbytes for field_interp in event.field_interps)
+    start = time.time()
+    pt_f = []
+    q_drift = []
+    exits = []
+    for parton_params in partons:
+        parton = jets.parton(tag=0, no=0, weight=1, AA_weight=1, **parton_params)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parton_dataframe, record = timekeeper.evolve(event=event, parton=parton, drift=True, el=True, fg=False,
+                                                         fgqhat=False, el_model=args.el_model, record='off')
+        pt_f.append(parton_dataframe['pt_f'][0])
+        q_drift.append(parton_dataframe['q_drift'][0])
+        exits.append(parton_dataframe['exit'][0])
+    results[dtype] = {'pt_f': np.array(pt_f), 'q_drift': np.array(q_drift), 'exit': np.array(exits),
+                      'memory': memory, 'time': time.time() - start}
+    print('{}: medium fields {:.1f} MB, evolution {:.2f} s'.format(dtype, memory / 1e6, results[dtype]['time']))
+
+# Compare
+double = results['float64']
+single = results['float32']
+pt_diff = np.abs(single['pt_f'] - double['pt_f'])
+drift_diff = np.abs(single['q_drift'] - double['q_drift'])
+print('pt_f: max |diff| {:.3e} GeV, max relative diff {:.3e}'.format(
+    np.amax(pt_diff), np.amax(pt_diff / np.abs(double['pt_f']))))
+print('q_drift: max |diff| {:.3e} GeV, max relative diff {:.3e}'.format(
+    np.amax(drift_diff), np.amax(drift_diff / np.maximum(np.abs(double['q_drift']), 1e-12))))
+print('exit codes differ for {} of {} partons'.format(np.count_nonzero(single['exit'] != double['exit']),
+                                                      len(partons)))
+
+num_bad = (np.count_nonzero(~np.isclose(single['pt_f'], double['pt_f'], rtol=args.rtol, atol=args.atol))
+           + np.count_nonzero(~np.isclose(single['q_drift'], double['q_drift'], rtol=args.rtol, atol=args.atol))
+           + np.count_nonzero(single['exit'] != double['exit']))
+print('{} mismatched values'.format(num_bad))
+if num_bad > 0:
+    sys.exit(1)